@@ -0,0 +1,111 @@
+import itertools
+from datetime import date, timedelta
+
+import pytest
+from django.test import RequestFactory
+
+from market.models import ListingImage
+from market.serializers import ListingImageURLSerializer
+from utils import moderation
+
+
+# Query strings of Listings.list, as the frontend's filters combine them
+LIST_FILTERS = {
+    "all": "",
+    "items": "type=item",
+    "sublets": "type=sublet",
+    "category": "type=item&category=Books&condition=NEW",
+    "price": "min_price=20&max_price=200&negotiable=True",
+    "title": "title=lamp",
+    "tags": "tags=Used&tags=Couch",
+    "sublet_dates": (
+        f"type=sublet&beds=2&start_date={date.today() + timedelta(days=30)}"
+        f"&end_date={date.today() + timedelta(days=365)}"
+    ),
+    "popular": "ordering=-favorite_count&limit=100",
+    "deep_page": "ordering=-price&offset=500",
+    "seller": "seller=true",
+}
+
+
+@pytest.mark.benchmark(group="listings-list")
+@pytest.mark.parametrize("filters", LIST_FILTERS.values(), ids=LIST_FILTERS.keys())
+def bench_listings_list(measure, filters):
+    measure("get", f"/market/listings/?{filters}")
+
+
+@pytest.mark.benchmark(group="listings-retrieve")
+def bench_listing_retrieve(measure, catalog):
+    measure("get", f"/market/listings/{catalog.listing_with_images.id}/")
+
+
+@pytest.mark.benchmark(group="favorites")
+def bench_favorites_list(measure):
+    measure("get", "/market/favorites/")
+
+
+@pytest.mark.benchmark(group="favorites")
+def bench_favorite_toggle(benchmark, api_client, catalog):
+    url = f"/market/listings/{catalog.other_listings[-1]}/favorites/"
+
+    def toggle():
+        api_client.post(url)
+        return api_client.delete(url)
+
+    response = benchmark(toggle)
+    assert response.json() == {"liked": False}
+
+
+@pytest.mark.benchmark(group="offers")
+def bench_offer_create(benchmark, api_client, catalog):
+    # a listing the user hasn't made an offer on yet, every round
+    listings = iter(catalog.other_listings)
+
+    def setup():
+        return (f"/market/listings/{next(listings)}/offers/",), {
+            "data": {"offered_price": 50, "message": "Is this still available?"},
+            "format": "json",
+        }
+
+    response = benchmark.pedantic(api_client.post, setup=setup, rounds=200)
+    assert response.status_code == 201, response.content
+
+
+@pytest.mark.benchmark(group="serializers")
+def bench_image_urls(benchmark, catalog, db):
+    images = list(ListingImage.objects.order_by("id")[:100])
+    request = RequestFactory().get("/market/listings/")
+
+    def serialize():
+        return ListingImageURLSerializer(
+            images, many=True, context={"request": request}
+        ).data
+
+    assert benchmark(serialize)[0]["image_url"].startswith("http://testserver/")
+
+
+PROFANITY_TEXTS = [
+    f"{adjective} {thing}, barely used, pick up on Locust Walk {number}"
+    for adjective, thing, number in itertools.product(
+        ["Vintage", "Modern", "Gently used"], ["desk", "lamp", "couch"], range(3)
+    )
+]
+
+
+@pytest.mark.benchmark(group="profanity")
+def bench_profanity_cold(benchmark):
+    pytest.importorskip("profanity_check")
+    moderation.load_model()
+    benchmark.pedantic(
+        moderation.predict_profanity,
+        args=(PROFANITY_TEXTS,),
+        setup=moderation.get_cache().clear,
+        rounds=50,
+    )
+
+
+@pytest.mark.benchmark(group="profanity")
+def bench_profanity_cached(benchmark):
+    pytest.importorskip("profanity_check")
+    moderation.predict_profanity(PROFANITY_TEXTS)
+    benchmark(moderation.predict_profanity, PROFANITY_TEXTS)
@@ -0,0 +1,240 @@
+"""
+Benchmarks of the API's hot paths, with pytest-benchmark. They run against the
+database in DATABASE_URL (PostgreSQL or SQLite), in a test database seeded
+with --listings listings (comma-separated sizes, 1000 by default), and measure
+each request through the whole middleware stack. Query counts are recorded
+with the timings and held to the views' query budgets, so a query regression
+fails the run wherever it runs.
+
+From backend/:
+
+    uv run pytest benchmarks --listings 1000,10000,100000 --benchmark-autosave
+    # later, against the last saved run
+    uv run pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:15%
+
+Runs are saved under backend/.benchmarks, per machine and Python version; only
+compare runs from the same machine. Caches are local memory and favorites are
+served from the database, so runs neither depend on nor touch a Redis server.
+"""
+
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from market.instrumentation import get_query_budget
+from market.models import Category, Item, Listing, ListingImage, Offer, Sublet, Tag
+from market.seeding import bulk_create_listings
+from market.throttling import SlidingWindowThrottle
+
+
+User = get_user_model()
+
+SELLERS = 50
+# the benchmark user's favorites, whatever the number of listings
+FAVORITES = 100
+CATEGORIES = ["Books", "Electronics", "Furniture", "Other"]
+TAGS = ["New", "Used", "Couch", "Laptop", "Textbook", "Chair", "Apartment", "House"]
+WORDS = ["Desk", "Lamp", "Chair", "Laptop", "Couch", "Bike", "Textbook", "Room"]
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--listings",
+        default="1000",
+        help="Comma-separated numbers of listings to benchmark with",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "catalog" in metafunc.fixturenames:
+        sizes = sorted(int(size) for size in metafunc.config.option.listings.split(","))
+        # session-scoped, so every benchmark runs at one size before the next
+        metafunc.parametrize("catalog", sizes, indirect=True, scope="session")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def benchmark_settings():
+    with (
+        override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            },
+            FAVORITES_BACKEND="db",
+            ALLOWED_HOSTS=["testserver"],
+            SECURE_SSL_REDIRECT=False,
+        ),
+        # unlimited, since benchmarks repeat requests thousands of times
+        pytest.MonkeyPatch.context() as monkeypatch,
+    ):
+        scopes = settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]
+        monkeypatch.setattr(
+            SlidingWindowThrottle, "THROTTLE_RATES", dict.fromkeys(scopes)
+        )
+        yield
+
+
+class Catalog:
+    """What a seeded database holds, for benchmarks to request."""
+
+    def __init__(self, size):
+        self.size = size
+        self.user = User.objects.get(username="benchmark")
+        self.other_listings = list(
+            Listing.objects.exclude(seller=self.user)
+            .order_by("-id")
+            .values_list("id", flat=True)[:1000]
+        )
+        self.listing_with_images = (
+            Listing.objects.filter(images__isnull=False).order_by("id").first()
+        )
+
+
+@pytest.fixture(scope="session")
+def catalog(request, django_db_setup, django_db_blocker):
+    """A database seeded with request.param listings, added to the last size's."""
+    with django_db_blocker.unblock():
+        seed(request.param, random.Random(request.param))
+        return Catalog(request.param)
+
+
+def seed(size, rng):
+    if not User.objects.filter(username="benchmark").exists():
+        User.objects.create_user(
+            "benchmark", phone_number="+12025550100", phone_verified=True
+        )
+        User.objects.bulk_create([User(username=f"seller{i}") for i in range(SELLERS)])
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORIES])
+        Tag.objects.bulk_create([Tag(name=name) for name in TAGS])
+    user = User.objects.get(username="benchmark")
+    sellers = list(User.objects.exclude(pk=user.pk).values_list("id", flat=True))
+    categories = list(Category.objects.values_list("id", flat=True))
+    tags = list(Tag.objects.values_list("id", flat=True))
+
+    existing = Listing.objects.count()
+    now = timezone.now()
+    items, sublets = [], []
+    for i in range(existing, size):
+        listing = {
+            # the benchmark user sells a listing in a hundred
+            "seller_id": user.pk if i % 100 == 0 else rng.choice(sellers),
+            "title": f"{rng.choice(WORDS)} {i}",
+            "description": " ".join(rng.choices(WORDS, k=20)),
+            "price": Decimal(rng.randint(500, 300000)) / 100,
+            "negotiable": rng.random() < 0.7,
+            # a tenth have expired
+            "expires_at": now + timedelta(days=rng.randint(-10, 90)),
+            "moderation_status": (
+                Listing.ModerationStatus.PENDING_REVIEW
+                if rng.random() < 0.02
+                else Listing.ModerationStatus.PUBLISHED
+            ),
+        }
+        if rng.random() < 0.8:
+            items.append(
+                Item(
+                    **listing,
+                    category_id=rng.choice(categories),
+                    condition=rng.choice(Item.Condition.values),
+                )
+            )
+        else:
+            start = date.today() + timedelta(days=rng.randint(0, 120))
+            sublets.append(
+                Sublet(
+                    **listing,
+                    street_address=f"{rng.randint(100, 4999)} Walnut St",
+                    beds=rng.randint(0, 4),
+                    baths=rng.randint(1, 3),
+                    start_date=start,
+                    end_date=start + timedelta(days=30 * rng.randint(1, 12)),
+                )
+            )
+    listings = bulk_create_listings(items) + bulk_create_listings(sublets)
+
+    ListingTag = Listing.tags.through
+    ListingTag.objects.bulk_create(
+        [
+            ListingTag(listing_id=listing.id, tag_id=tag)
+            for listing in listings
+            for tag in rng.sample(tags, rng.randint(0, 3))
+        ],
+        batch_size=1000,
+    )
+    ListingImage.objects.bulk_create(
+        [
+            ListingImage(
+                listing_id=listing.id,
+                image=f"marketplace/images/benchmark-{listing.id}-{order}.jpg",
+                order=order,
+            )
+            for listing in listings[::3]
+            for order in range(rng.randint(1, 4))
+        ],
+        batch_size=1000,
+    )
+    others = [listing.id for listing in listings if listing.seller_id != user.pk]
+    Offer.objects.bulk_create(
+        [
+            Offer(user_id=rng.choice(sellers), listing_id=listing_id, offered_price=5)
+            for listing_id in others[::10]
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    Favorite = Listing.favorites.through
+    favorited = Favorite.objects.filter(user=user).count()
+    Favorite.objects.bulk_create(
+        [
+            Favorite(user_id=user.pk, listing_id=listing_id)
+            for listing_id in others[: FAVORITES - favorited]
+        ]
+    )
+    ids = [listing.id for listing in listings]
+    for start in range(0, len(ids), 1000):
+        Listing.recount(ids[start : start + 1000])
+
+
+@pytest.fixture(autouse=True)
+def at_each_size(catalog):
+    """Run every benchmark at each size, so the results can be grouped by it."""
+
+
+@pytest.fixture
+def api_client(catalog, db):
+    client = APIClient()
+    client.force_authenticate(catalog.user)
+    return client
+
+
+@pytest.fixture
+def measure(benchmark, api_client):
+    """
+    Benchmark `api_client.<method>(url, ...)`, after recording the queries of one
+    request and checking them against the view's query budget.
+    """
+
+    def measure(method, url, status=200, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(api_client, method)(url, **kwargs)
+        assert response.status_code == status, response.content
+        budget = get_query_budget(
+            response.wsgi_request.resolver_match.func, response.wsgi_request
+        )
+        benchmark.extra_info["queries"] = len(queries)
+        benchmark.extra_info["query_budget"] = budget
+        if budget is not None:
+            assert len(queries) <= budget, [query["sql"] for query in queries]
+        return benchmark(getattr(api_client, method), url, **kwargs)
+
+    return measure
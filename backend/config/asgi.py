@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+Serve with uvicorn, e.g.:
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --workers 4
 """
 
 import os
@@ -13,5 +17,8 @@ from django.core.asgi import get_asgi_application
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Native async read views (see market/async_views.py) are opt-in: benchmarks
+# haven't shown them beating threaded DRF views yet
+os.environ.setdefault("ASYNC_VIEWS", "false")
 
 application = get_asgi_application()
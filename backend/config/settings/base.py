@@ -33,12 +33,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the metrics cover every other middleware
+    "market.instrumentation.RequestMetricsMiddleware",
+    # off unless REQUEST_RECORDING_PATH is set
+    "market.recording.RequestRecordingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # before anything that queries the database
+    "utils.replicas.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # needs request.user
+    "market.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -108,19 +116,162 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTHENTICATION_BACKENDS = [
+    "market.backends.CachedLabsUserBackend",
+    # still listed so sessions created before user caching stay valid
     "accounts.backends.LabsUserBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
 
+# Seconds the authenticated user, and the user an access token belongs to, are
+# cached for (see market/authentication.py)
+AUTH_CACHE_TIMEOUT = int(os.environ.get("AUTH_CACHE_TIMEOUT", 60))
+
+# Database connection pooling (see utils/postgres_pool): "none", "psycopg" (a
+# pool per process) or "pgbouncer" (transaction pooling in front of Postgres)
+DATABASE_POOL = os.environ.get("DATABASE_POOL", "none")
+DATABASE_POOL_OPTIONS = {
+    "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+    # Seconds a request waits for a free connection before failing
+    "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+    # Seconds before idle connections above min_size, and any connection, are closed
+    "max_idle": float(os.environ.get("DATABASE_POOL_MAX_IDLE", 600)),
+    "max_lifetime": float(os.environ.get("DATABASE_POOL_MAX_LIFETIME", 3600)),
+}
+# Check that a reused connection is still alive before handing it out
+DATABASE_HEALTH_CHECKS = (
+    os.environ.get("DATABASE_HEALTH_CHECKS", "true").lower() == "true"
+)
+
+# Read replicas (see utils/replicas.py), as comma separated database URLs. The
+# reads of GET requests are spread across them.
+DATABASE_REPLICA_URLS = [
+    url for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url
+]
+DATABASE_ROUTERS = ["utils.replicas.ReplicaRouter"]
+# Their aliases in DATABASES; filled in by the environment's settings
+DATABASE_REPLICAS = []
+# Seconds a client reads from the primary after writing, so they see their writes
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 10)
+)
+# Replicas further behind the primary than this aren't read from
+DATABASE_REPLICA_MAX_LAG_SECONDS = float(
+    os.environ.get("DATABASE_REPLICA_MAX_LAG_SECONDS", 5)
+)
+# How often each process checks how far behind the replicas are
+DATABASE_REPLICA_LAG_CHECK_SECONDS = float(
+    os.environ.get("DATABASE_REPLICA_LAG_CHECK_SECONDS", 5)
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Per-process cache for small, rarely changing reference data (categories,
+    # tags). Filled before fork when PRELOAD_WORKERS is enabled.
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "market-local",
+        "TIMEOUT": int(os.environ.get("LOCAL_CACHE_TIMEOUT", 300)),
+    },
+}
+
+# Where sessions are stored: "db" (the django_session table), "cached_db"
+# (written through to the table, read from the default cache) or "cache" (the
+# default cache only; needs Redis, and a Redis that doesn't evict them). Before
+# switching to "cache", copy live sessions with `manage.py migrate_sessions`.
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+}[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = "default"
+
 REST_FRAMEWORK = {
+    # JSON rendering time goes into the Server-Timing header
+    "DEFAULT_RENDERER_CLASSES": [
+        "market.instrumentation.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.BasicAuthentication",
-        "accounts.authentication.PlatformAuthentication",
-    ]
+        "market.authentication.CachedPlatformAuthentication",
+    ],
+    # Sliding-window limits (see market/throttling.py); "3/10m" is 3 per 10 min
+    "DEFAULT_THROTTLE_RATES": {
+        "send_code_user": os.environ.get("THROTTLE_SEND_CODE_USER", "5/h"),
+        "send_code_phone": os.environ.get("THROTTLE_SEND_CODE_PHONE", "3/10m"),
+        "verify_code_user": os.environ.get("THROTTLE_VERIFY_CODE_USER", "10/10m"),
+        "verify_code_phone": os.environ.get("THROTTLE_VERIFY_CODE_PHONE", "10/10m"),
+        "offer_create": os.environ.get("THROTTLE_OFFER_CREATE", "30/h"),
+        "listing_create": os.environ.get("THROTTLE_LISTING_CREATE", "20/h"),
+    },
 }
 
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", "")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", "")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER", "")
 PHONE_VERIFICATION_CODE_EXPIRY_MINUTES = 10
+
+# Text messages are queued in the OutboundSMS table and delivered by
+# `manage.py send_sms` through this backend (see utils/sms.py)
+SMS_BACKEND = os.environ.get("SMS_BACKEND", "utils.sms.TwilioBackend")
+SMS_TIMEOUT_SECONDS = float(os.environ.get("SMS_TIMEOUT_SECONDS", 10))
+SMS_BATCH_SIZE = int(os.environ.get("SMS_BATCH_SIZE", 20))
+SMS_POLL_INTERVAL_SECONDS = float(os.environ.get("SMS_POLL_INTERVAL_SECONDS", 1.0))
+SMS_MAX_ATTEMPTS = int(os.environ.get("SMS_MAX_ATTEMPTS", 5))
+# Delay before the first retry; doubled after each further failure
+SMS_RETRY_BACKOFF_SECONDS = float(os.environ.get("SMS_RETRY_BACKOFF_SECONDS", 5))
+
+# Number of profanity predictions memoized per process (keyed by text hash)
+PROFANITY_CACHE_SIZE = int(os.environ.get("PROFANITY_CACHE_SIZE", 4096))
+
+# "inline" rejects profane listings during validation; "async" accepts them as
+# pending review and leaves scoring to `manage.py moderate_listings`
+MODERATION_MODE = os.environ.get("MODERATION_MODE", "inline")
+MODERATION_BATCH_SIZE = int(os.environ.get("MODERATION_BATCH_SIZE", 64))
+MODERATION_POLL_INTERVAL_SECONDS = float(
+    os.environ.get("MODERATION_POLL_INTERVAL_SECONDS", 1.0)
+)
+
+# "redis" serves favorites from Redis sets and writes them behind into the
+# database with `manage.py flush_favorites`; "db" reads and writes the table
+FAVORITES_BACKEND = os.environ.get("FAVORITES_BACKEND", "db")
+FAVORITES_FLUSH_BATCH_SIZE = int(os.environ.get("FAVORITES_FLUSH_BATCH_SIZE", 1000))
+FAVORITES_FLUSH_INTERVAL_SECONDS = float(
+    os.environ.get("FAVORITES_FLUSH_INTERVAL_SECONDS", 1.0)
+)
+
+# Serve GET requests to the main read endpoints with native async views (see
+# market/async_views.py). Only worth enabling under ASGI (config/asgi.py); under
+# WSGI every async view would need its own event loop.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "false").lower() == "true"
+
+# Requests slower than this are logged with their query counts and fingerprints
+# (see market/instrumentation.py), as are requests over their query budget
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+
+# How often a superuser's ?profile=1 request samples its call stacks (see
+# market/profiling.py)
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 1))
+
+# Bearer token Prometheus scrapes /metrics with (see utils/metrics.py for
+# PROMETHEUS_MULTIPROC_DIR, needed with several workers)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# File RequestRecordingMiddleware appends request shapes to, for replays (see
+# market/recording.py); recording is off if empty
+REQUEST_RECORDING_PATH = os.environ.get("REQUEST_RECORDING_PATH", "")
+REQUEST_RECORDING_SAMPLE_RATE = float(
+    os.environ.get("REQUEST_RECORDING_SAMPLE_RATE", 1)
+)
+
+# Regression budget for `manage.py profile_imports` (cold worker boot)
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
+
+# Warm the app (imports, profanity model, reference caches) in the master
+# process so forked WSGI workers share it copy-on-write
+PRELOAD_WORKERS = os.environ.get("PRELOAD_WORKERS", "false").lower() == "true"
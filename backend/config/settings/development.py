@@ -4,6 +4,8 @@ Dev settings - for local development with docker-compose
 
 import dj_database_url
 
+from utils import postgres_pool, replicas
+
 from .base import *
 
 
@@ -14,18 +16,27 @@ ALLOWED_HOSTS = ["localhost", "127.0.0.1", "backend"]
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {"default": dj_database_url.config()}
+DATABASES = {
+    "default": postgres_pool.configure(
+        dj_database_url.config(), DATABASE_POOL, DATABASE_POOL_OPTIONS
+    )
+}
+DATABASES.update(
+    replicas.databases(DATABASE_REPLICA_URLS, DATABASE_POOL, DATABASE_POOL_OPTIONS)
+)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
 
 # Redis - from docker-compose
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 
-CACHES = {
-    "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": REDIS_URL,
-    }
+CACHES["default"] = {
+    "BACKEND": "django_redis.cache.RedisCache",
+    "LOCATION": REDIS_URL,
 }
 
+# Print text messages instead of sending them unless configured otherwise
+SMS_BACKEND = os.environ.get("SMS_BACKEND", "utils.sms.ConsoleBackend")
+
 PLATFORM_ACCOUNTS = {
     "REDIRECT_URI": "http://localhost:8000/accounts/callback/",
     "CLIENT_ID": os.environ.get("LABS_CLIENT_ID", "clientid"),
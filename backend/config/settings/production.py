@@ -4,6 +4,8 @@ Production settings
 
 import dj_database_url
 
+from utils import postgres_pool, replicas
+
 from .base import *
 
 
@@ -12,19 +14,31 @@ DEBUG = False
 ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "").split(",")
 
 DATABASES = {
-    "default": dj_database_url.config(
-        conn_max_age=600,
-        conn_health_checks=True,
+    "default": postgres_pool.configure(
+        dj_database_url.config(
+            conn_max_age=600,
+            conn_health_checks=DATABASE_HEALTH_CHECKS,
+        ),
+        DATABASE_POOL,
+        DATABASE_POOL_OPTIONS,
     )
 }
+DATABASES.update(
+    replicas.databases(
+        DATABASE_REPLICA_URLS,
+        DATABASE_POOL,
+        DATABASE_POOL_OPTIONS,
+        conn_max_age=600,
+        conn_health_checks=DATABASE_HEALTH_CHECKS,
+    )
+)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
 
 REDIS_URL = os.environ.get("REDIS_URL")
 if REDIS_URL:
-    CACHES = {
-        "default": {
-            "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": REDIS_URL,
-        }
+    CACHES["default"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": REDIS_URL,
     }
 
 PLATFORM_ACCOUNTS = {
@@ -18,9 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from market.views import get_metrics
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls", namespace="accounts")),
     path("market/", include("market.urls")),
+    path("metrics", get_metrics, name="metrics"),
 ]
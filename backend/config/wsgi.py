@@ -9,9 +9,17 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+if settings.PRELOAD_WORKERS:
+    # Warm up in the master process so forked workers start hot and share the
+    # loaded model and caches copy-on-write (requires uWSGI without lazy-apps)
+    from market.warmup import warm_up
+
+    warm_up()
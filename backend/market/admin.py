@@ -1,7 +1,16 @@
 from django.contrib import admin
 from django.utils.html import mark_safe
 
-from market.models import Category, Item, Listing, ListingImage, Offer, Sublet, Tag
+from market.models import (
+    Category,
+    Item,
+    Listing,
+    ListingImage,
+    Offer,
+    OutboundSMS,
+    Sublet,
+    Tag,
+)
 
 
 class ListingAdmin(admin.ModelAdmin):
@@ -14,6 +23,13 @@ class ListingAdmin(admin.ModelAdmin):
 
     image_tag.short_description = "Listing Images"
     readonly_fields = ("image_tag",)
+    list_filter = ("moderation_status",)
+
+
+class OutboundSMSAdmin(admin.ModelAdmin):
+    list_display = ("to", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+    exclude = ("body",)
 
 
 admin.site.register(Category)
@@ -23,3 +39,4 @@ admin.site.register(Listing, ListingAdmin)
 admin.site.register(ListingImage)
 admin.site.register(Item)
 admin.site.register(Sublet)
+admin.site.register(OutboundSMS, OutboundSMSAdmin)
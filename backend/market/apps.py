@@ -1,6 +1,39 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class MarketConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "market"
+
+    def ready(self):
+        from market import authentication, caches, favorites, instrumentation
+        from market.models import Category, Listing, Tag, User
+
+        for signal, name in ((post_save, "save"), (post_delete, "delete")):
+            signal.connect(
+                caches.invalidate_categories,
+                sender=Category,
+                dispatch_uid=f"invalidate_categories_on_{name}",
+            )
+            signal.connect(
+                caches.invalidate_tags,
+                sender=Tag,
+                dispatch_uid=f"invalidate_tags_on_{name}",
+            )
+            signal.connect(
+                authentication.invalidate_user,
+                sender=User,
+                dispatch_uid=f"invalidate_cached_user_on_{name}",
+            )
+
+        pre_delete.connect(
+            favorites.forget_listing_on_delete,
+            sender=Listing,
+            dispatch_uid="forget_listing_favorites",
+        )
+        connection_created.connect(
+            instrumentation.install_query_recorder,
+            dispatch_uid="install_query_recorder",
+        )
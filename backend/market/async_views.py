@@ -0,0 +1,154 @@
+"""
+Native async versions of the read endpoints.
+
+With ASYNC_VIEWS on (the default under config/asgi.py), GET requests to these
+endpoints are served here instead of by the DRF views, which would each hold a
+worker thread for the whole request. Responses match the DRF views'.
+
+Everything a serializer reads is fetched up front with the async ORM, so
+serializing never blocks the event loop. Requests are authenticated by Bearer
+token or session only.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from market import favorites
+from market.authentication import CachedPlatformAuthentication, aauthenticate
+from market.caches import aget_tags
+from market.instrumentation import timed
+from market.pagination import PageSizeOffsetPagination
+from market.serializers import (
+    ListingSerializer,
+    ListingSerializerList,
+    ListingSerializerPublic,
+    TagSerializer,
+    UserSerializer,
+)
+from market.views import Listings, listings_with_related
+
+
+def with_async_reads(sync_view, async_view):
+    """
+    A view that serves GET requests with `async_view` and every other method
+    with the DRF `sync_view`, run in a thread as Django would under ASGI. So do
+    GETs with credentials other than a Bearer token (e.g. Basic), which only
+    the DRF authentication classes understand.
+    """
+    threaded_view = sync_to_async(sync_view)
+    keyword = CachedPlatformAuthentication.keyword
+
+    # keeps the DRF view's attributes, e.g. its query_budget
+    @wraps(sync_view)
+    async def view(request, *args, **kwargs):
+        authorization = request.headers.get("Authorization", "").split()
+        if request.method == "GET" and authorization[:1] in ([], [keyword]):
+            return await async_view(request, *args, **kwargs)
+        return await threaded_view(request, *args, **kwargs)
+
+    # DRF views enforce CSRF themselves, for session-authenticated requests
+    return csrf_exempt(view)
+
+
+def async_api_view(view):
+    """
+    Authenticate the request and render what the view returns (or the error it
+    raises) as JSON, the way DRF's api_view would. The view gets a DRF Request.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            user = await aauthenticate(request)
+            request = Request(request, authenticators=())
+            request.user = user
+            data = await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return error_response(exc)
+        with timed("render_time"):
+            return JsonResponse(data, encoder=JSONEncoder, safe=False)
+
+    return wrapper
+
+
+def error_response(exc):
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # what DRF answers when its first authenticator (session) sends no
+        # WWW-Authenticate header
+        status = 403
+    else:
+        status = exc.status_code
+    data = (
+        exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    )
+    return JsonResponse(data, encoder=JSONEncoder, safe=False, status=status)
+
+
+def require_authentication(request):
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+
+
+def listings_view(request, action):
+    """The DRF viewset, for its querysets and filters."""
+    return Listings(request=request, action=action, format_kwarg=None, kwargs={})
+
+
+async def paginate(queryset, request, serializer_class):
+    paginator = PageSizeOffsetPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, context={"request": request})
+    return paginator.get_paginated_data(serializer.data)
+
+
+@async_api_view
+async def current_user(request):
+    require_authentication(request)
+    return UserSerializer(request.user).data
+
+
+@async_api_view
+async def tags(request):
+    return await paginate(await aget_tags(), request, TagSerializer)
+
+
+@async_api_view
+async def user_favorites(request):
+    require_authentication(request)
+    listing_ids = await favorites.alisting_ids(request.user.id)
+    queryset = listings_with_related().filter(id__in=listing_ids).order_by("id")
+    return await paginate(queryset, request, ListingSerializerList)
+
+
+@async_api_view
+async def listings(request):
+    require_authentication(request)
+    view = listings_view(request, "list")
+    queryset = view.filter_listings(view.get_queryset())
+    return await paginate(queryset, request, ListingSerializerList)
+
+
+@async_api_view
+async def listing(request, pk):
+    require_authentication(request)
+    queryset = listings_view(request, "retrieve").get_queryset()
+    try:
+        instance = await queryset.filter(pk=pk).afirst()
+    except (TypeError, ValueError, DjangoValidationError):
+        instance = None
+    if instance is None:
+        raise exceptions.NotFound("No Listing matches the given query.")
+
+    if instance.seller_id != request.user.id:
+        return ListingSerializerPublic(instance).data
+    # only the owner's view lists buyers and favorites
+    await sync_to_async(prefetch_related_objects)([instance], "buyers", "favorites")
+    return ListingSerializer(instance).data
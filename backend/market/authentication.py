@@ -0,0 +1,172 @@
+import hashlib
+import logging
+from importlib import import_module
+
+from accounts.authentication import PlatformAuthentication
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model, login
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpRequest
+from redis.exceptions import RedisError
+
+from market.caches import aget
+from market.instrumentation import record_cache, timed
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+USER_CACHE_KEY = "auth:user:{}"
+TOKEN_CACHE_KEY = "auth:token:{}"
+
+
+def cache_get(key):
+    try:
+        with timed("cache_time"):
+            value = cache.get(key)
+    except RedisError:
+        logger.warning("Redis unavailable, authenticating from DB", exc_info=True)
+        return None
+    # e.g. "auth:user" for the entry of one user
+    record_cache(key.rpartition(":")[0], hit=value is not None)
+    return value
+
+
+def cache_set(key, value):
+    try:
+        with timed("cache_time"):
+            cache.set(key, value, settings.AUTH_CACHE_TIMEOUT)
+    except RedisError:
+        logger.warning("Redis unavailable, not caching user", exc_info=True)
+
+
+def get_user(user_id):
+    """
+    The user with this id, from the shared cache when possible. Entries are
+    dropped whenever the user is saved or deleted (see invalidate_user), and
+    by code that updates users in bulk (see invalidate_users).
+    """
+    key = USER_CACHE_KEY.format(user_id)
+    user = cache_get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            cache_set(key, user)
+    return user
+
+
+async def aget_user(user_id):
+    """get_user() for async views."""
+    key = USER_CACHE_KEY.format(user_id)
+    try:
+        user = await aget(key)
+    except RedisError:
+        logger.warning("Redis unavailable, authenticating from DB", exc_info=True)
+        user = None
+    if user is None:
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is not None:
+            await sync_to_async(cache_set)(key, user)
+    return user
+
+
+def can_authenticate(user):
+    """ModelBackend.user_can_authenticate, for users cached behind a token."""
+    return user is not None and getattr(user, "is_active", True)
+
+
+def token_cache_key(token):
+    # tokens are credentials, so only their digest goes into the cache
+    return TOKEN_CACHE_KEY.format(hashlib.sha256(token.encode()).hexdigest())
+
+
+def invalidate_users(user_ids):
+    """
+    Drop cached users. QuerySet.update() and bulk_update() send no signals, so
+    anything that updates users with them must call this afterwards, or a
+    later save() of the cached user writes its stale columns back.
+    """
+    if not user_ids:
+        # DEL needs at least one key
+        return
+    try:
+        cache.delete_many([USER_CACHE_KEY.format(user_id) for user_id in user_ids])
+    except RedisError:
+        # the entries expire after AUTH_CACHE_TIMEOUT regardless
+        logger.warning("Could not drop cached users %s", user_ids, exc_info=True)
+
+
+def invalidate_user(instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+class CachedPlatformAuthentication(PlatformAuthentication):
+    """
+    PlatformAuthentication that remembers which user an access token belongs to
+    for AUTH_CACHE_TIMEOUT seconds, instead of introspecting the token with
+    Platform (and re-syncing the user row) on every request. A revoked token
+    keeps working until its entry expires, but not for a deactivated user: their
+    token is introspected again, and the auth backend rejects them.
+    """
+
+    def authenticate(self, request):
+        authorization = request.META.get("HTTP_AUTHORIZATION", "").split()
+        if len(authorization) != 2 or authorization[0] != self.keyword:
+            # no token, or a malformed header the parent rejects
+            return super().authenticate(request)
+
+        key = token_cache_key(authorization[1])
+        if (user_id := cache_get(key)) is not None and can_authenticate(
+            user := get_user(user_id)
+        ):
+            return (user, None)
+
+        result = super().authenticate(request)
+        user, _ = result
+        if user is not None:
+            cache_set(key, user.pk)
+            cache_set(USER_CACHE_KEY.format(user.pk), user)
+        return result
+
+
+async def aauthenticate(request):
+    """
+    The user behind a request to an async view: the owner of its Bearer token,
+    else its session's user. A cached token is resolved without leaving the
+    event loop; an unknown one is introspected with Platform in a thread.
+    Raises AuthenticationFailed for tokens CachedPlatformAuthentication rejects.
+    """
+    authentication = CachedPlatformAuthentication()
+    authorization = request.headers.get("Authorization", "").split()
+    if not authorization or authorization[0] != authentication.keyword:
+        return await request.auser()
+
+    if len(authorization) == 2:
+        key = token_cache_key(authorization[1])
+        try:
+            user_id = await aget(key)
+        except RedisError:
+            logger.warning("Redis unavailable, authenticating from DB", exc_info=True)
+            user_id = None
+        if user_id is not None and can_authenticate(user := await aget_user(user_id)):
+            return user
+
+    result = await sync_to_async(authentication.authenticate)(request)
+    # a bare Platform JWT authenticates without a user
+    return result[0] or AnonymousUser()
+
+
+def create_session(user):
+    """
+    Log `user` in to a new session, as a request to the login view would, and
+    return its key. For scripts that drive the API as other users,
+    e.g. load tests.
+    """
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+    request.session.save()
+    return request.session.session_key
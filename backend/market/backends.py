@@ -0,0 +1,16 @@
+from accounts.backends import LabsUserBackend
+
+from market.authentication import get_user
+
+
+class CachedLabsUserBackend(LabsUserBackend):
+    """
+    LabsUserBackend that loads the user behind a session from the shared cache
+    instead of querying it on every request.
+    """
+
+    def get_user(self, user_id):
+        user = get_user(user_id)
+        if user is not None and self.user_can_authenticate(user):
+            return user
+        return None
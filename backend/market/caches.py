@@ -0,0 +1,128 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+
+from market.instrumentation import record_cache, timed
+from market.models import Category, Tag
+
+
+CATEGORIES_CACHE_KEY = "market:categories"
+TAGS_CACHE_KEY = "market:tags"
+
+
+def local_get_or_set(key, default):
+    with timed("cache_time"):
+        value = caches["local"].get(key)
+    record_cache(key, hit=value is not None)
+    if value is None:
+        value = default()
+        caches["local"].set(key, value)
+    return value
+
+
+def get_categories():
+    """Categories keyed by name, cached per process."""
+    return local_get_or_set(
+        CATEGORIES_CACHE_KEY,
+        lambda: {category.name: category for category in Category.objects.all()},
+    )
+
+
+def get_category(name):
+    """
+    The category with this name. A stale hit is harmless, but a stale miss would
+    reject valid input: another process may have created the category since this
+    one cached the list, and only the creating process drops its own copy. So a
+    miss is checked against the database, and a found category refreshes the
+    cache.
+    """
+    category = get_categories().get(name)
+    if category is None:
+        category = Category.objects.filter(name=name).first()
+        if category is not None:
+            caches["local"].delete(CATEGORIES_CACHE_KEY)
+    return category
+
+
+def get_tags():
+    """All tags in id order, cached per process."""
+    return local_get_or_set(TAGS_CACHE_KEY, lambda: list(Tag.objects.order_by("id")))
+
+
+async def aget_tags():
+    """get_tags() for async views; only a cache miss touches the database."""
+    with timed("cache_time"):
+        tags = caches["local"].get(TAGS_CACHE_KEY)
+    record_cache(TAGS_CACHE_KEY, hit=tags is not None)
+    if tags is None:
+        tags = [tag async for tag in Tag.objects.order_by("id")]
+        caches["local"].set(TAGS_CACHE_KEY, tags)
+    return tags
+
+
+def get_redis():
+    """The Redis connection behind the default cache, or None if it isn't Redis."""
+    from django_redis import get_redis_connection
+
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+# asyncio connection pools can't be shared between event loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    An asyncio client for the default cache's Redis server, or None if the
+    default cache isn't Redis. Must be called from a running event loop.
+    """
+    from redis import asyncio as aioredis
+
+    config = settings.CACHES["default"]
+    if config["BACKEND"] != "django_redis.cache.RedisCache":
+        return None
+    location = config["LOCATION"]
+    if isinstance(location, (list, tuple)):
+        # the first server is the primary
+        location = location[0]
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if location not in clients:
+        clients[location] = aioredis.Redis.from_url(location)
+    return clients[location]
+
+
+async def aget(key):
+    """
+    Read a default cache entry without leaving the event loop: through the
+    asyncio client when the cache is Redis (decoded the way django-redis
+    encodes it), else through Django's async cache API.
+    """
+    with timed("cache_time"):
+        if (client := get_async_redis()) is None:
+            value = await caches["default"].aget(key)
+        else:
+            backend = caches["default"].client
+            value = await client.get(backend.make_key(key))
+            if value is not None:
+                value = backend.decode(value)
+    record_cache(key.rpartition(":")[0], hit=value is not None)
+    return value
+
+
+def prime():
+    get_categories()
+    get_tags()
+
+
+def invalidate_categories(**kwargs):
+    caches["local"].delete(CATEGORIES_CACHE_KEY)
+
+
+def invalidate_tags(**kwargs):
+    caches["local"].delete(TAGS_CACHE_KEY)
@@ -0,0 +1,352 @@
+"""
+Favorites store.
+
+With FAVORITES_BACKEND = "redis", favorites are served from Redis sets: one per
+user (listing ids) and one per listing (user ids). Writes only touch Redis and
+record the change in a pending hash, which `manage.py flush_favorites` writes
+behind into the favorites table in batches. Sets are loaded from the database
+the first time they are needed.
+
+With FAVORITES_BACKEND = "db", or whenever Redis can't be reached, every call
+goes straight to the database. Run `manage.py repair_favorites` after an outage
+so the sets pick up writes they missed.
+"""
+
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from redis.exceptions import RedisError, ResponseError
+
+from market.authentication import invalidate_users
+from market.caches import get_async_redis, get_redis
+from market.models import Listing
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+Favorite = Listing.favorites.through
+
+USER_KEY = "favorites:user:{}"
+LISTING_KEY = "favorites:listing:{}"
+PENDING_KEY = "favorites:pending"
+FLUSHING_KEY = "favorites:flushing"
+VERSIONS_KEY = "favorites:versions"
+
+# Ids start at 1, so 0 marks a set as loaded even when it has no real members
+SENTINEL = "0"
+
+# Add or remove favorites, queue the changes for write-behind and bump the
+# user's version if anything changed. Returns {number changed, version}, or
+# {-1, 0} if the user's set isn't loaded yet.
+# KEYS: user set, pending hash, versions hash, then one listing set per listing.
+# ARGV: user id, then listing ids, negated for removals
+WRITE_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return {-1, 0}
+end
+local changed = 0
+for i = 2, #ARGV do
+    local listing, command, flag = ARGV[i], "SADD", "1"
+    if string.sub(listing, 1, 1) == "-" then
+        listing, command, flag = string.sub(listing, 2), "SREM", "0"
+    end
+    if redis.call(command, KEYS[1], listing) == 1 then
+        changed = changed + 1
+        if redis.call("EXISTS", KEYS[i + 2]) == 1 then
+            redis.call(command, KEYS[i + 2], ARGV[1])
+        end
+        redis.call("HSET", KEYS[2], ARGV[1] .. ":" .. listing, flag)
+    end
+end
+if changed > 0 then
+    return {changed, redis.call("HINCRBY", KEYS[3], ARGV[1], 1)}
+end
+return {0, tonumber(redis.call("HGET", KEYS[3], ARGV[1]) or "0")}
+"""
+
+
+def get_client():
+    """The Redis connection behind the default cache, or None in database mode."""
+    if settings.FAVORITES_BACKEND != "redis":
+        return None
+    return get_redis()
+
+
+def load_user(client, user_id):
+    key = USER_KEY.format(user_id)
+    listing_ids = Favorite.objects.filter(user_id=user_id).values_list(
+        "listing_id", flat=True
+    )
+    client.hsetnx(VERSIONS_KEY, user_id, db_version(user_id))
+    client.sadd(key, SENTINEL, *listing_ids)
+    return key
+
+
+def load_listing(client, listing_id):
+    key = LISTING_KEY.format(listing_id)
+    user_ids = Favorite.objects.filter(listing_id=listing_id).values_list(
+        "user_id", flat=True
+    )
+    client.sadd(key, SENTINEL, *user_ids)
+    return key
+
+
+def redis_update(client, user_id, add, remove):
+    listing_ids = [*add, *remove]
+    keys = [USER_KEY.format(user_id), PENDING_KEY, VERSIONS_KEY]
+    keys += [LISTING_KEY.format(listing_id) for listing_id in listing_ids]
+    args = [user_id, *add, *(-listing_id for listing_id in remove)]
+    changed, version = client.eval(WRITE_SCRIPT, len(keys), *keys, *args)
+    if changed == -1:
+        load_user(client, user_id)
+        changed, version = client.eval(WRITE_SCRIPT, len(keys), *keys, *args)
+    return changed, version
+
+
+def db_version(user_id):
+    return User.objects.values_list("favorites_version", flat=True).get(id=user_id)
+
+
+def db_bump_version(user_id):
+    User.objects.filter(id=user_id).update(favorites_version=F("favorites_version") + 1)
+    invalidate_users([user_id])
+    return db_version(user_id)
+
+
+def db_update(user_id, add, remove):
+    # A single favorite goes through its unique constraint so that of two
+    # concurrent identical requests exactly one reports a change
+    if len(add) + len(remove) == 1:
+        try:
+            with transaction.atomic():
+                if add:
+                    Favorite.objects.create(user_id=user_id, listing_id=add[0])
+                    Listing.adjust_count(add[0], "favorite_count", 1)
+                else:
+                    deleted, _ = Favorite.objects.filter(
+                        user_id=user_id, listing_id=remove[0]
+                    ).delete()
+                    if not deleted:
+                        return 0, db_version(user_id)
+                    Listing.adjust_count(remove[0], "favorite_count", -1)
+                return 1, db_bump_version(user_id)
+        except IntegrityError:
+            return 0, db_version(user_id)
+
+    with transaction.atomic():
+        current = set(
+            Favorite.objects.filter(
+                user_id=user_id, listing_id__in=[*add, *remove]
+            ).values_list("listing_id", flat=True)
+        )
+        added = [listing_id for listing_id in add if listing_id not in current]
+        removed = [listing_id for listing_id in remove if listing_id in current]
+        if not added and not removed:
+            return 0, db_version(user_id)
+
+        Favorite.objects.bulk_create(
+            [Favorite(user_id=user_id, listing_id=listing_id) for listing_id in added],
+            ignore_conflicts=True,
+        )
+        Favorite.objects.filter(user_id=user_id, listing_id__in=removed).delete()
+        Listing.recount([*added, *removed])
+        return len(added) + len(removed), db_bump_version(user_id)
+
+
+def update(user_id, add=(), remove=()):
+    """
+    Favorite the listings in `add` and unfavorite those in `remove` in one step.
+    Listings already in the requested state are left alone. Returns the number
+    of favorites that changed and the user's favorites version afterwards.
+    """
+    add, remove = list(add), list(remove)
+    if client := get_client():
+        try:
+            return redis_update(client, user_id, add, remove)
+        except RedisError:
+            logger.warning("Redis unavailable, writing favorites to DB", exc_info=True)
+    return db_update(user_id, add, remove)
+
+
+def add(user_id, listing_id):
+    """Favorite a listing. Returns False if the user had already favorited it."""
+    changed, _ = update(user_id, add=[listing_id])
+    return bool(changed)
+
+
+def remove(user_id, listing_id):
+    """Unfavorite a listing. Returns False if the user hadn't favorited it."""
+    changed, _ = update(user_id, remove=[listing_id])
+    return bool(changed)
+
+
+def version(user_id):
+    if client := get_client():
+        try:
+            if (version := client.hget(VERSIONS_KEY, user_id)) is not None:
+                return int(version)
+        except RedisError:
+            logger.warning("Redis unavailable, reading version from DB", exc_info=True)
+    return db_version(user_id)
+
+
+def is_favorited(user_id, listing_id):
+    if client := get_client():
+        try:
+            key = USER_KEY.format(user_id)
+            if not client.exists(key):
+                load_user(client, user_id)
+            return bool(client.sismember(key, listing_id))
+        except RedisError:
+            logger.warning("Redis unavailable, reading favorite from DB", exc_info=True)
+    return Favorite.objects.filter(listing_id=listing_id, user_id=user_id).exists()
+
+
+def listing_ids(user_id):
+    """Ids of the listings a user has favorited, in no particular order."""
+    if client := get_client():
+        try:
+            key = USER_KEY.format(user_id)
+            if not client.exists(key):
+                load_user(client, user_id)
+            return [int(member) for member in client.smembers(key) if int(member)]
+        except RedisError:
+            logger.warning(
+                "Redis unavailable, reading favorites from DB", exc_info=True
+            )
+    return list(
+        Favorite.objects.filter(user_id=user_id).values_list("listing_id", flat=True)
+    )
+
+
+async def alisting_ids(user_id):
+    """listing_ids() for async views, read with the asyncio Redis client."""
+    if settings.FAVORITES_BACKEND == "redis" and (client := get_async_redis()):
+        try:
+            if members := await client.smembers(USER_KEY.format(user_id)):
+                return [int(member) for member in members if int(member)]
+        except RedisError:
+            logger.warning(
+                "Redis unavailable, reading favorites from DB", exc_info=True
+            )
+        # Loading the set (or falling back to the DB) is rare: do it in a thread
+        return await sync_to_async(listing_ids)(user_id)
+    return [
+        listing_id
+        async for listing_id in Favorite.objects.filter(user_id=user_id).values_list(
+            "listing_id", flat=True
+        )
+    ]
+
+
+def pending_writes(client, key=PENDING_KEY):
+    """(user id, listing id, added) for each write not yet in the database."""
+    for field, value in client.hgetall(key).items():
+        user_id, listing_id = map(int, field.split(b":"))
+        yield user_id, listing_id, value == b"1"
+
+
+def forget_listing(listing_id):
+    """Drop a listing that is being deleted from every set and pending write."""
+    if not (client := get_client()):
+        return
+    try:
+        key = LISTING_KEY.format(listing_id)
+        if not client.exists(key):
+            load_listing(client, listing_id)
+        user_ids = {int(member) for member in client.smembers(key)} - {0}
+        # The listing set is only kept up to date once loaded, so favorites made
+        # before that are found through their pending writes
+        for field, _ in client.hscan_iter(PENDING_KEY, match=f"*:{listing_id}"):
+            user_ids.add(int(field.split(b":")[0]))
+        with client.pipeline() as pipe:
+            for user_id in user_ids:
+                pipe.srem(USER_KEY.format(user_id), listing_id)
+                pipe.hdel(PENDING_KEY, f"{user_id}:{listing_id}")
+                pipe.hincrby(VERSIONS_KEY, user_id, 1)
+            pipe.delete(key)
+            pipe.execute()
+    except RedisError:
+        logger.warning("Could not drop deleted listing from favorites", exc_info=True)
+
+
+def forget_listing_on_delete(instance, **kwargs):
+    forget_listing(instance.id)
+
+
+def flush(batch_size=1000):
+    """
+    Write pending favorites behind into the database. Returns the number of
+    (added, removed) favorites.
+
+    The pending hash is renamed before it is read so writes made during the
+    flush go into a fresh hash. If a flush dies midway its batch is left in
+    place and retried by the next one; replaying it is harmless.
+    """
+    client = get_client()
+    if client is None:
+        return 0, 0
+    if not client.exists(FLUSHING_KEY):
+        try:
+            client.rename(PENDING_KEY, FLUSHING_KEY)
+        except ResponseError:
+            # nothing pending
+            return 0, 0
+
+    adds, removes = [], []
+    for user_id, listing_id, added in pending_writes(client, FLUSHING_KEY):
+        (adds if added else removes).append((user_id, listing_id))
+
+    # Listings and users may have been deleted since they were favorited
+    live_listings = set(
+        Listing.objects.filter(
+            id__in={listing_id for _, listing_id in adds}
+        ).values_list("id", flat=True)
+    )
+    live_users = set(
+        User.objects.filter(
+            id__in={user_id for user_id, _ in adds + removes}
+        ).values_list("id", flat=True)
+    )
+    adds = [
+        (user_id, listing_id)
+        for user_id, listing_id in adds
+        if user_id in live_users and listing_id in live_listings
+    ]
+
+    with transaction.atomic():
+        Favorite.objects.bulk_create(
+            [
+                Favorite(user_id=user_id, listing_id=listing_id)
+                for user_id, listing_id in adds
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        for i in range(0, len(removes), batch_size):
+            pairs = Q()
+            for user_id, listing_id in removes[i : i + batch_size]:
+                pairs |= Q(user_id=user_id, listing_id=listing_id)
+            Favorite.objects.filter(pairs).delete()
+        Listing.recount({listing_id for _, listing_id in adds + removes})
+        # Carry the versions over so they keep increasing if Redis goes away
+        user_ids = list(live_users)
+        versions = client.hmget(VERSIONS_KEY, user_ids) if user_ids else []
+        User.objects.bulk_update(
+            [
+                User(id=user_id, favorites_version=int(version))
+                for user_id, version in zip(user_ids, versions)
+                if version is not None
+            ],
+            ["favorites_version"],
+            batch_size=batch_size,
+        )
+    invalidate_users(user_ids)
+
+    client.delete(FLUSHING_KEY)
+    return len(adds), len(removes)
@@ -0,0 +1,305 @@
+"""
+Per-request metrics and query budgets.
+
+RequestMetricsMiddleware records, for every request, the SQL queries it ran
+(count, total time and fingerprints), hits and misses of the app's caches and
+the time spent in them, serializing, building image URLs, checking for
+profanity and rendering. Every response breaks that time down in its
+Server-Timing header, which browsers show next to the request. Totals per view
+are kept in `view_totals`, and exported to Prometheus by route name (see
+utils/metrics.py).
+
+Views declare how many queries a request may run, authentication included,
+with `query_budget`: per view, or per viewset action. Requests over budget, or
+slower than SLOW_REQUEST_MS, are logged with the query fingerprints that ran
+most often, which is where an N+1 shows up. Tests hold the views in
+market/urls.py to their budgets as the page size grows (TestQueryBudgets).
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from prometheus_client.core import GaugeMetricFamily
+from rest_framework.renderers import JSONRenderer
+
+from market.models import Listing, OutboundSMS
+from utils.metrics import (
+    CACHE_REQUESTS,
+    REQUEST_DB_DURATION,
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# What the slow-request log lists of a request's queries
+LOGGED_FINGERPRINTS = 5
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.serializer_time = 0.0
+        self.image_url_time = 0.0
+        self.moderation_time = 0.0
+        self.render_time = 0.0
+        # whether a serializer is already being timed, so nested ones aren't
+        self.serializing = False
+
+
+current_metrics = ContextVar("request_metrics", default=None)
+
+# (method, route) -> totals of the RequestMetrics counters, for this process
+view_totals = {}
+view_totals_lock = threading.Lock()
+
+
+def query_budget(budget):
+    """
+    Declare the most queries a function view may run, e.g.
+    `@query_budget(2)` above its `@api_view`. Class-based views set a
+    `query_budget` attribute instead, which a viewset can make a dict by
+    action.
+    """
+
+    def decorator(view):
+        view.query_budget = budget
+        return view
+
+    return decorator
+
+
+def get_query_budget(view_func, request):
+    """The budget declared for the view resolved for `request`, or None."""
+    budget = getattr(view_func, "query_budget", None)
+    if budget is None:
+        # DRF views, then Django's
+        view_class = getattr(view_func, "cls", getattr(view_func, "view_class", None))
+        budget = getattr(view_class, "query_budget", None)
+    if isinstance(budget, dict):
+        # viewsets map methods to actions; other views go by method
+        actions = getattr(view_func, "actions", None) or {}
+        method = request.method.lower()
+        budget = budget.get(actions.get(method, method))
+    return budget
+
+
+def fingerprint(sql):
+    """`sql` without what varies between executions of the same query."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = re.sub(r"%s", "?", sql)
+    # IN lists grow with the page
+    return re.sub(r"\(\?(?:, \?)*\)", "(...)", sql)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.fingerprints[fingerprint(sql)] += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    """connection_created receiver."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache(namespace, hit):
+    """Count a lookup in the cache entries under `namespace`, e.g. "auth:user"."""
+    CACHE_REQUESTS.labels(namespace, "hit" if hit else "miss").inc()
+    if metrics := current_metrics.get():
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+@contextmanager
+def timed(attribute):
+    """Add the time the block takes to the request's RequestMetrics.<attribute>."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            metrics,
+            attribute,
+            getattr(metrics, attribute) + time.perf_counter() - start,
+        )
+
+
+def server_timing(metrics, duration):
+    """The Server-Timing header of a response, durations in milliseconds."""
+    timings = [
+        ("db", metrics.db_time, f"{metrics.queries} queries"),
+        (
+            "cache",
+            metrics.cache_time,
+            f"{metrics.cache_hits} hits / {metrics.cache_misses} misses",
+        ),
+        ("serialize", metrics.serializer_time, None),
+        ("images", metrics.image_url_time, "image URLs (part of serialize)"),
+        ("moderation", metrics.moderation_time, "profanity checks"),
+        ("render", metrics.render_time, None),
+        ("total", duration, None),
+    ]
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" + (f';desc="{desc}"' if desc else "")
+        for name, seconds, desc in timings
+    )
+
+
+class TimedSerializerMixin:
+    """Adds the serializer's to_representation() time to the request's metrics."""
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that adds its time to the request's metrics."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("render_time"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, metrics, duration):
+        match = request.resolver_match
+        # unresolved URLs share a label, so there isn't one per path
+        route = (match.view_name if match.url_name else match.route) if match else ""
+        REQUEST_DURATION.labels(request.method, route, response.status_code).observe(
+            duration
+        )
+        REQUEST_QUERIES.labels(route).observe(metrics.queries)
+        REQUEST_DB_DURATION.labels(route).observe(metrics.db_time)
+        response.headers["Server-Timing"] = server_timing(metrics, duration)
+        if match is None:
+            return
+
+        view = (request.method, match.route)
+        with view_totals_lock:
+            totals = view_totals.setdefault(view, Counter())
+            totals.update(
+                requests=1,
+                queries=metrics.queries,
+                db_time=metrics.db_time,
+                cache_hits=metrics.cache_hits,
+                cache_misses=metrics.cache_misses,
+                cache_time=metrics.cache_time,
+                serializer_time=metrics.serializer_time,
+                image_url_time=metrics.image_url_time,
+                moderation_time=metrics.moderation_time,
+                render_time=metrics.render_time,
+                duration=duration,
+            )
+
+        budget = get_query_budget(match.func, request)
+        over_budget = budget is not None and metrics.queries > budget
+        if not over_budget and duration * 1000 < settings.SLOW_REQUEST_MS:
+            return
+        logger.warning(
+            "%s %s took %.0f ms: %d queries (budget %s) in %.0f ms, "
+            "%d cache hits, %d misses, %.0f ms serializing. Most run: %s",
+            request.method,
+            request.get_full_path(),
+            duration * 1000,
+            metrics.queries,
+            budget,
+            metrics.db_time * 1000,
+            metrics.cache_hits,
+            metrics.cache_misses,
+            metrics.serializer_time * 1000,
+            "; ".join(
+                f"{count}x {sql}"
+                for sql, count in metrics.fingerprints.most_common(LOGGED_FINGERPRINTS)
+            ),
+        )
+
+
+class QueueDepthCollector:
+    """Backlogs of the background workers, counted when metrics are scraped."""
+
+    def collect(self):
+        depth = GaugeMetricFamily(
+            "queue_depth", "Items waiting for a background worker", labels=["queue"]
+        )
+        depth.add_metric(
+            ["sms"],
+            OutboundSMS.objects.filter(status=OutboundSMS.Status.PENDING).count(),
+        )
+        depth.add_metric(
+            ["moderation"],
+            Listing.objects.filter(
+                moderation_status=Listing.ModerationStatus.PENDING_REVIEW
+            ).count(),
+        )
+        yield depth
@@ -0,0 +1,102 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+
+User = get_user_model()
+
+PATHS = [
+    "/market/listings/",
+    "/market/listings/?type=item&ordering=-created_at",
+    "/market/favorites/",
+    "/market/tags/",
+    "/market/user/me/",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent-request throughput of running WSGI and ASGI "
+        "deployments on the read endpoints. Start both against the same "
+        "database first, e.g. `uwsgi --http :8000 --module config.wsgi` and "
+        "`uvicorn config.asgi:application --port 8001`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            dest="targets",
+            action="append",
+            metavar="NAME=URL",
+            help="Deployment to measure, e.g. wsgi=http://localhost:8000 (repeatable)",
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--duration", type=float, default=10.0, help="Seconds per endpoint"
+        )
+
+    def handle(self, *args, **options):
+        targets = dict(target.split("=", 1) for target in options["targets"] or [])
+        if not targets:
+            raise CommandError("Give at least one --target NAME=URL")
+
+        user = User.objects.create_user(f"asgi-benchmark-{uuid.uuid4().hex[:8]}")
+        try:
+            cookie = self.session_cookie(user)
+            for path in PATHS:
+                for name, url in targets.items():
+                    self.measure(name, url.rstrip("/") + path, cookie, options)
+        finally:
+            user.delete()
+
+    def session_cookie(self, user):
+        # the servers share this process's database and session store
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            client.force_login(user)
+        return f"{settings.SESSION_COOKIE_NAME}={client.session.session_key}"
+
+    def measure(self, name, url, cookie, options):
+        deadline = time.perf_counter() + options["duration"]
+
+        def worker():
+            timings, errors = [], 0
+            request = urllib.request.Request(url, headers={"Cookie": cookie})
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                except (urllib.error.URLError, OSError):
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - start)
+            return timings, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            results = [pool.submit(worker) for _ in range(options["concurrency"])]
+            results = [result.result() for result in results]
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(
+            timing for worker_timings, _ in results for timing in worker_timings
+        )
+        errors = sum(worker_errors for _, worker_errors in results)
+        if not timings:
+            self.stdout.write(f"{name:>6} {url}: every request failed")
+            return
+        self.stdout.write(
+            f"{name:>6} {url}: {len(timings) / elapsed:8.1f} req/s, "
+            f"p50 {timings[len(timings) // 2] * 1e3:7.1f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1e3:7.1f} ms, "
+            f"mean {statistics.mean(timings) * 1e3:7.1f} ms, {errors} errors"
+        )
@@ -0,0 +1,99 @@
+import os
+import statistics
+import time
+import timeit
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from prometheus_client import Counter, Histogram
+
+
+User = get_user_model()
+
+METRICS_MIDDLEWARE = "market.instrumentation.RequestMetricsMiddleware"
+PATH = "/market/tags/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what request metrics (market/instrumentation.py) add to the "
+        f"latency of GET {PATH}, and the cost of single metric updates. Set "
+        "PROMETHEUS_MULTIPROC_DIR to a scratch directory to measure "
+        "multiprocess mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=5,
+            help="Alternate with and without metrics this many times",
+        )
+
+    def handle(self, *args, **options):
+        mode = (
+            "multiprocess"
+            if "PROMETHEUS_MULTIPROC_DIR" in os.environ
+            else "single process"
+        )
+        self.stdout.write(f"Prometheus client in {mode} mode")
+
+        without_metrics = [m for m in settings.MIDDLEWARE if m != METRICS_MIDDLEWARE]
+        user = User.objects.create_user(f"metrics-benchmark-{uuid.uuid4().hex[:8]}")
+        timings = {"without": [], "with": []}
+        try:
+            for _ in range(options["rounds"]):
+                timings["without"] += self.measure(
+                    user, without_metrics, options["requests"]
+                )
+                timings["with"] += self.measure(
+                    user, settings.MIDDLEWARE, options["requests"]
+                )
+        finally:
+            user.delete()
+
+        for name, values in timings.items():
+            values.sort()
+            self.stdout.write(
+                f"{name:>8} metrics: mean {statistics.mean(values) * 1e6:7.1f} us, "
+                f"p50 {values[len(values) // 2] * 1e6:7.1f} us"
+            )
+        overhead = statistics.mean(timings["with"]) - statistics.mean(
+            timings["without"]
+        )
+        self.stdout.write(f"Overhead per request: {overhead * 1e6:.1f} us")
+
+        # not registered, so they don't show up in this process's /metrics
+        histogram = Histogram("benchmark_histogram", "", ["route"], registry=None)
+        counter = Counter("benchmark_counter", "", ["namespace"], registry=None)
+        for name, update in (
+            ("histogram observe", lambda: histogram.labels("route").observe(0.01)),
+            ("counter inc", lambda: counter.labels("namespace").inc()),
+        ):
+            number = 100_000
+            elapsed = timeit.timeit(update, number=number)
+            self.stdout.write(f"{name:>18}: {elapsed / number * 1e6:.2f} us")
+
+    def measure(self, user, middleware, count):
+        with override_settings(
+            MIDDLEWARE=middleware,
+            ALLOWED_HOSTS=["testserver"],
+            SECURE_SSL_REDIRECT=False,
+        ):
+            client = Client()
+            client.force_login(user)
+            # warm the reference caches
+            client.get(PATH)
+
+            timings = []
+            for _ in range(count):
+                start = time.perf_counter()
+                response = client.get(PATH)
+                timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+            client.logout()
+        return timings
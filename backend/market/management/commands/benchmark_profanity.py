@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils import moderation
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-field profanity checks against batched, cached predictions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listings",
+            type=int,
+            default=500,
+            help="Number of synthetic listings (title + description) to score",
+        )
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.3,
+            help="Fraction of listings that reuse an earlier title/description",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        listings = []
+        for i in range(options["listings"]):
+            if listings and rng.random() < options["duplicates"]:
+                listings.append(rng.choice(listings))
+            else:
+                listings.append(
+                    (
+                        f"Gently used desk lamp #{i}",
+                        f"Selling lamp {i}, works perfectly. Pickup near campus.",
+                    )
+                )
+
+        start = time.perf_counter()
+        predict = moderation.load_model()
+        load_time = time.perf_counter() - start
+        self.stdout.write(f"Model load: {load_time * 1000:.1f} ms")
+
+        # Previous behaviour: one predict call per field per listing
+        start = time.perf_counter()
+        for title, description in listings:
+            predict([title])[0]
+            predict([description])[0]
+        per_field = time.perf_counter() - start
+
+        # One predict call per listing covering both fields, cold cache
+        moderation.get_cache().clear()
+        start = time.perf_counter()
+        for listing in listings:
+            moderation.predict_profanity(list(listing))
+        batched = time.perf_counter() - start
+
+        # The same payloads again, now answered from the LRU
+        start = time.perf_counter()
+        for listing in listings:
+            moderation.predict_profanity(list(listing))
+        cached = time.perf_counter() - start
+
+        # A single bulk payload scored with one predict call
+        moderation.get_cache().clear()
+        start = time.perf_counter()
+        moderation.predict_profanity([text for listing in listings for text in listing])
+        bulk = time.perf_counter() - start
+
+        count = len(listings)
+        for label, elapsed in (
+            ("per-field", per_field),
+            ("batched", batched),
+            ("batched (warm cache)", cached),
+            ("bulk payload", bulk),
+        ):
+            self.stdout.write(
+                f"{label:>22}: {elapsed * 1000:9.1f} ms total, "
+                f"{elapsed / count * 1e6:9.1f} us/listing, "
+                f"{per_field / elapsed if elapsed else 0:6.1f}x vs per-field"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Scored {count} listings"))
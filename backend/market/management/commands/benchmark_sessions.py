@@ -0,0 +1,67 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+User = get_user_model()
+
+ENGINES = ["db", "cached_db", "cache"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request latency and database queries of the session "
+        "backends, using a session-authenticated GET /market/user/me/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument(
+            "--backend",
+            dest="backends",
+            action="append",
+            choices=ENGINES,
+            help="Backend to measure (repeatable); defaults to all",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f"session-benchmark-{uuid.uuid4().hex[:8]}")
+        try:
+            for backend in options["backends"] or ENGINES:
+                self.measure(backend, user, options["requests"])
+        finally:
+            user.delete()
+
+    def measure(self, backend, user, count):
+        with override_settings(
+            SESSION_ENGINE=f"django.contrib.sessions.backends.{backend}",
+            ALLOWED_HOSTS=["testserver"],
+            SECURE_SSL_REDIRECT=False,
+        ):
+            client = Client()
+            client.force_login(user)
+            # first request fills whatever cache the backend has
+            client.get("/market/user/me/")
+
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = client.get("/market/user/me/")
+                    timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+            client.logout()
+
+        timings.sort()
+        self.stdout.write(
+            f"{backend:>10}: mean {statistics.mean(timings) * 1e3:6.2f} ms, "
+            f"p50 {timings[len(timings) // 2] * 1e3:6.2f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1e3:6.2f} ms, "
+            f"{len(queries) / count:.1f} queries/request"
+        )
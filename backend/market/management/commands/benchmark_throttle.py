@@ -0,0 +1,77 @@
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from market.caches import get_redis
+from market.throttling import UserSlidingWindowThrottle
+
+
+class BenchmarkThrottle(UserSlidingWindowThrottle):
+    scope = "benchmark"
+    rate = "1000000/h"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request overhead of the sliding-window throttle against "
+        "the configured default cache (Redis or DRF's cache fallback)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=100,
+            help="Number of distinct users the requests are spread over",
+        )
+
+    def handle(self, *args, **options):
+        backend = "Redis Lua script" if get_redis() else "cache fallback"
+        self.stdout.write(f"Backend: {backend}")
+
+        run = uuid.uuid4().hex[:8]
+        factory = APIRequestFactory()
+        requests = []
+        for i in range(options["requests"]):
+            request = Request(factory.post("/"))
+            request.user = SimpleNamespace(
+                pk=f"{run}-{i % options['users']}", is_authenticated=True
+            )
+            requests.append(request)
+
+        # What every request pays without a throttle: building the key only
+        timings = {"no throttle": [], "allowed": [], "rejected": []}
+        throttle = BenchmarkThrottle()
+        for request in requests:
+            start = time.perf_counter()
+            throttle.get_cache_key(request, None)
+            timings["no throttle"].append(time.perf_counter() - start)
+
+        for request in requests:
+            start = time.perf_counter()
+            throttle.allow_request(request, None)
+            timings["allowed"].append(time.perf_counter() - start)
+
+        # A full window: every request is checked and turned away
+        throttle.num_requests = 1
+        for request in requests:
+            start = time.perf_counter()
+            throttle.allow_request(request, None)
+            timings["rejected"].append(time.perf_counter() - start)
+
+        for label, samples in timings.items():
+            samples = sorted(samples)
+            self.stdout.write(
+                f"{label:>12}: mean {statistics.mean(samples) * 1e6:8.1f} us, "
+                f"p50 {samples[len(samples) // 2] * 1e6:8.1f} us, "
+                f"p99 {samples[int(len(samples) * 0.99)] * 1e6:8.1f} us"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Throttled {len(requests)} requests per mode")
+        )
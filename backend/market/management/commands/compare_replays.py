@@ -0,0 +1,85 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market.recording import percentile
+
+
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latencies of two replay_requests runs, e.g. of the same "
+        "recording against two builds, overall and per request shape"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("base", help="replay_requests output of the baseline")
+        parser.add_argument("new", help="replay_requests output to compare with it")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10,
+            help="Percent slower at p50 or p95 that counts as a regression",
+        )
+        parser.add_argument(
+            "--min-requests",
+            type=int,
+            default=20,
+            help="Skip shapes with fewer requests in either run",
+        )
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with an error if anything regressed",
+        )
+
+    def handle(self, *args, **options):
+        base, new = (self.load(options[name]) for name in ("base", "new"))
+        rows = [("all requests", self.merged(base), self.merged(new))]
+        for key in sorted(base.keys() & new.keys(), key=lambda key: -len(base[key])):
+            if min(len(base[key]), len(new[key])) >= options["min_requests"]:
+                rows.append((key, base[key], new[key]))
+
+        regressions = 0
+        for key, before, after in rows:
+            changes = {
+                name: percentile(after, q) / percentile(before, q) - 1
+                for name, q in QUANTILES.items()
+            }
+            regressed = max(changes["p50"], changes["p95"]) * 100 > options["threshold"]
+            regressions += regressed
+            self.stdout.write(
+                f"{'SLOWER' if regressed else '':<6} {len(before):>7,} -> "
+                f"{len(after):<7,} "
+                + "  ".join(
+                    f"{name} {percentile(before, q):7.1f} -> "
+                    f"{percentile(after, q):7.1f} ms ({changes[name]:+6.1%})"
+                    for name, q in QUANTILES.items()
+                )
+                + f"  {key}"
+            )
+        for name, only in (
+            ("base", base.keys() - new.keys()),
+            ("new", new.keys() - base.keys()),
+        ):
+            if only:
+                self.stdout.write(f"Only in {name}: {', '.join(sorted(only))}")
+
+        if regressions and options["fail"]:
+            raise CommandError(
+                f"{regressions} of {len(rows)} comparisons slower by more than "
+                f"{options['threshold']}%"
+            )
+
+    def load(self, path):
+        """Request shape -> sorted latencies in milliseconds."""
+        with open(path) as f:
+            shapes = json.load(f)["shapes"]
+        if not shapes:
+            raise CommandError(f"No requests in {path}")
+        return {key: shape["latencies_ms"] for key, shape in shapes.items()}
+
+    def merged(self, shapes):
+        return sorted(latency for latencies in shapes.values() for latency in latencies)
@@ -0,0 +1,48 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from market.authentication import create_session, invalidate_users
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Log in users made by generate_listings and print their session "
+        "cookies as JSON, for scripts/loadtest.py. The users' phone numbers "
+        "are marked verified, so they can make offers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(username__startswith="generated").order_by("id")[
+                : options["users"]
+            ]
+        )
+        if not users:
+            raise CommandError("No generated users: run generate_listings first")
+        User.objects.filter(pk__in=[user.pk for user in users]).update(
+            phone_number="+12155550100", phone_verified=True
+        )
+        invalidate_users([user.pk for user in users])
+
+        sessions = {user.username: create_session(user) for user in users}
+        self.stdout.write(
+            json.dumps(
+                {
+                    "session_cookie": settings.SESSION_COOKIE_NAME,
+                    "csrf_cookie": settings.CSRF_COOKIE_NAME,
+                    "csrf_header": settings.CSRF_HEADER_NAME.removeprefix(
+                        "HTTP_"
+                    ).replace("_", "-"),
+                    "sessions": sessions,
+                }
+            )
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from market.models import Offer
+
+
+class Command(BaseCommand):
+    help = "Mark pending offers on expired listings as expired"
+
+    def handle(self, *args, **options):
+        # A single UPDATE ... WHERE listing_id IN (expired listings), driven by
+        # the partial index on pending offers
+        expired = Offer.objects.filter(
+            status=Offer.Status.PENDING, listing__expires_at__lt=timezone.now()
+        ).update(status=Offer.Status.EXPIRED)
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} offers"))
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from market import favorites
+
+
+class Command(BaseCommand):
+    help = "Write favorites recorded in Redis behind into the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.FAVORITES_FLUSH_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.FAVORITES_FLUSH_INTERVAL_SECONDS,
+            help="Seconds to sleep between flushes",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Flush what is pending and exit instead of running forever",
+        )
+
+    def handle(self, *args, **options):
+        if favorites.get_client() is None:
+            raise CommandError('FAVORITES_BACKEND is not "redis"; nothing to flush')
+
+        while True:
+            started = time.perf_counter()
+            added, removed = favorites.flush(options["batch_size"])
+            if added or removed:
+                self.stdout.write(
+                    f"Flushed {added} added and {removed} removed favorites in "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms"
+                )
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -1,21 +1,154 @@
+import math
+import multiprocessing
 import random
-from datetime import date, timedelta
-from decimal import Decimal
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
 
-from market.models import Category, Item, Sublet
+from market.models import Category, Tag
+from market.seeding import CHUNK_SIZE, ITEM_TYPES, Population, generate_chunk
 
 
 User = get_user_model()
 
+PASSWORD = "testpassword123"
+TAGS = ["New", "Used", "Couch", "Laptop", "Textbook", "Chair", "Apartment", "House"]
+
+# set in each worker process by its initializer
+population = None
+
+
+def init_worker(shared_population):
+    global population
+    population = shared_population
+
+
+def generate(*args):
+    return generate_chunk(population, *args)
+
 
 class Command(BaseCommand):
-    help = "Generate 25 random items and 25 random sublets for testing"
+    help = (
+        "Generate random users, items, sublets, offers, favorites and images, "
+        "for local development and performance work. The same --seed generates "
+        "the same data, however many --workers generate it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=25)
+        parser.add_argument("--sublets", type=int, default=25)
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=20,
+            help=(
+                "Users to generate besides testuser, who sell listings, favorite "
+                f"them and make offers; all have the password {PASSWORD}"
+            ),
+        )
+        parser.add_argument("--offers", type=int, default=50)
+        parser.add_argument("--favorites", type=int, default=100)
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=25,
+            help="Image rows; they name placeholder files, which aren't written",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Random seed; printed if not given"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                f"Processes generating chunks of {CHUNK_SIZE:,} listings in "
+                "parallel; PostgreSQL only"
+            ),
+        )
 
     def handle(self, *args, **options):
+        if options["workers"] > 1 and connection.vendor == "sqlite":
+            raise CommandError("SQLite allows one writer at a time: use --workers 1")
+        seed = options["seed"]
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.stdout.write(f"Seed: {seed}")
+
+        population = Population(
+            self.create_users(options["users"]),
+            self.create_categories(),
+            self.create_tags(),
+        )
+
+        # chunks get shares of the offers, favorites and images in proportion
+        # to their listings, by where they start and end among all listings
+        total = options["items"] + options["sublets"]
+        chunks = []
+        start = 0
+        for kind, count in (("item", options["items"]), ("sublet", options["sublets"])):
+            for number in range(math.ceil(count / CHUNK_SIZE)):
+                size = min(CHUNK_SIZE, count - number * CHUNK_SIZE)
+                shares = [
+                    options[name] * (start + size) // total
+                    - options[name] * start // total
+                    for name in ("offers", "favorites", "images")
+                ]
+                chunks.append(
+                    (seed, kind, number, size, *shares, options["batch_size"])
+                )
+                start += size
+
+        created = Counter()
+        started = time.perf_counter()
+        if options["workers"] > 1:
+            # forked workers must open connections of their own
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options["workers"],
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=init_worker,
+                initargs=(population,),
+            ) as executor:
+                futures = [executor.submit(generate, *chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    created += future.result()
+                    self.progress(created, total, started)
+        else:
+            for chunk in chunks:
+                created += generate_chunk(population, *chunk)
+                self.progress(created, total, started)
+        if self.stdout.isatty():
+            self.stdout.write("")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{count:,} {name}" for name, count in created.items())
+                + f" created in {time.perf_counter() - started:.1f}s"
+            )
+        )
+
+    def progress(self, created, total, started):
+        elapsed = time.perf_counter() - started
+        line = (
+            f"{created['listings']:,}/{total:,} listings, "
+            f"{sum(created.values()) / elapsed:,.0f} rows/s"
+        )
+        # redraw a single line on terminals, one line per chunk in logs
+        if self.stdout.isatty():
+            self.stdout.write(f"\r{line}", ending="")
+            self.stdout.flush()
+        else:
+            self.stdout.write(line)
+
+    def create_users(self, count):
+        """Ids of testuser and `count` generated users, created if missing."""
         user, created = User.objects.get_or_create(
             username="testuser",
             defaults={
@@ -25,262 +158,57 @@ class Command(BaseCommand):
             },
         )
         if created:
-            user.set_password("testpassword123")
+            user.set_password(PASSWORD)
             user.save()
             self.stdout.write(self.style.SUCCESS(f"Created test user: {user.username}"))
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(f"Using existing user: {user.username}")
-            )
-
-        categories_data = [
-            "Art",
-            "Books",
-            "Clothing",
-            "Electronics",
-            "Furniture",
-            "Home and Garden",
-            "Music",
-            "Other",
-            "Tools",
-            "Vehicles",
-        ]
-
-        categories = []
-        for cat_name in categories_data:
-            category, created = Category.objects.get_or_create(name=cat_name)
-            categories.append(category)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f"Created category: {cat_name}"))
-
-        adjectives = [
-            "Vintage",
-            "Modern",
-            "Classic",
-            "Brand New",
-            "Like New",
-            "Gently Used",
-            "Rare",
-            "Limited Edition",
-            "Premium",
-            "Budget-Friendly",
-            "Professional",
-            "Student",
-            "Portable",
-            "Compact",
-            "Spacious",
-        ]
-
-        item_types = {
-            "Art": ["Painting", "Sculpture", "Print", "Drawing", "Poster"],
-            "Books": ["Textbook", "Novel", "Magazine", "Comic Book", "Reference Book"],
-            "Clothing": ["Jacket", "Shirt", "Pants", "Dress", "Shoes"],
-            "Electronics": ["Laptop", "Phone", "Tablet", "Headphones", "Monitor"],
-            "Furniture": ["Chair", "Desk", "Table", "Bookshelf", "Lamp"],
-            "Home and Garden": [
-                "Plant",
-                "Rug",
-                "Curtains",
-                "Kitchen Set",
-                "Decoration",
-            ],
-            "Music": ["Guitar", "Keyboard", "Speakers", "Vinyl Record", "Music Stand"],
-            "Other": ["Bike", "Skateboard", "Game Console", "Camera", "Watch"],
-            "Tools": ["Toolbox", "Drill", "Hammer Set", "Measuring Tape", "Saw"],
-            "Vehicles": [
-                "Bicycle",
-                "Scooter",
-                "Skateboard",
-                "Motorcycle Helmet",
-                "Car Seat",
-            ],
-        }
-
-        item_descriptions = [
-            "Great condition, barely used!",
-            "Perfect for students. Must sell before graduation.",
-            "Moving out sale - need gone ASAP!",
-            "Works perfectly, no issues.",
-            "Excellent quality, well maintained.",
-            "Amazing deal, don't miss out!",
-            "Slight wear and tear but fully functional.",
-            "Like new condition, original packaging included.",
-            "Used for one semester only.",
-            "Selling because I upgraded to a newer model.",
-        ]
-
-        conditions = [
-            Item.Condition.NEW,
-            Item.Condition.LIKE_NEW,
-            Item.Condition.GOOD,
-            Item.Condition.FAIR,
-        ]
-
-        # generate 25 items
-        items_created = 0
-        self.stdout.write(self.style.WARNING("\n=== Generating Items ==="))
-        for _ in range(25):
-            category = random.choice(categories)
-            adjective = random.choice(adjectives)
-            item_type = random.choice(item_types.get(category.name, ["Item"]))
 
-            title = f"{adjective} {item_type}"
-            description = random.choice(item_descriptions)
-
-            # Random price between $5 and $500
-            price = Decimal(random.uniform(5, 500)).quantize(Decimal("0.01"))
-
-            # Random condition
-            condition = random.choice(conditions)
-
-            # Negotiable - 70% chance of being negotiable
-            negotiable = random.random() < 0.7
-
-            # Expires in 30-90 days
-            days_until_expiry = random.randint(30, 90)
-            expires_at = timezone.now() + timedelta(days=days_until_expiry)
-
-            try:
-                Item.objects.create(
-                    seller=user,
-                    title=title,
-                    description=description,
-                    price=price,
-                    negotiable=negotiable,
-                    expires_at=expires_at,
-                    condition=condition,
-                    category=category,
-                )
-                items_created += 1
-                self.stdout.write(f"Created item {items_created}: {title} - ${price}")
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error creating item: {str(e)}"))
-
-        sublet_adjectives = [
-            "Cozy",
-            "Spacious",
-            "Modern",
-            "Renovated",
-            "Charming",
-            "Bright",
-            "Quiet",
-            "Convenient",
-            "Luxurious",
-            "Affordable",
-        ]
-
-        sublet_types = [
-            "Studio Apartment",
-            "1BR Apartment",
-            "2BR Apartment",
-            "3BR Apartment",
-            "Room in Shared Apartment",
-            "Loft",
-            "Townhouse",
-            "House",
-        ]
-
-        street_names = [
-            "Walnut",
-            "Chestnut",
-            "Spruce",
-            "Pine",
-            "Locust",
-            "Market",
-            "Sansom",
-            "Baltimore",
-            "Lombard",
-            "South",
-            "Arch",
-            "Race",
-        ]
-
-        sublet_descriptions = [
-            "Perfect location near campus! Walking distance to classes and libraries.",
-            "Newly renovated with modern appliances. Available for summer sublet.",
-            "Great for students! Utilities included, close to public transportation.",
-            "Furnished apartment in a safe, quiet neighborhood. Perfect for studying.",
-            "Beautiful apartment with lots of natural light. Must see!",
-            "Ideal for summer internship. Flexible lease terms available.",
-            "Close to restaurants, shops, and nightlife. Very convenient location.",
-            "Spacious and clean. Perfect for roommates or single occupant.",
-            "Pet-friendly building with on-site laundry. Great amenities!",
-            "Amazing deal for the location! Available immediately.",
-        ]
-
-        # generate 25 sublets
-        sublets_created = 0
-        self.stdout.write(self.style.WARNING("\n=== Generating Sublets ==="))
-        for _ in range(25):
-            adjective = random.choice(sublet_adjectives)
-            sublet_type = random.choice(sublet_types)
-
-            title = f"{adjective} {sublet_type}"
-            description = random.choice(sublet_descriptions)
-
-            # generate random address
-            street_number = random.randint(100, 4999)
-            street = random.choice(street_names)
-
-            street_address = f"{street_number} {street} St, Philadelphia, PA"
-
-            # random beds and baths
-            beds = random.randint(0, 4)  # 0 for studio
-            baths = random.randint(1, 3)
-
-            # random price between $500 and $3000 per month
-            price = Decimal(random.uniform(500, 3000)).quantize(Decimal("0.01"))
-
-            # negotiable - 60% chance of being negotiable
-            negotiable = random.random() < 0.6
-
-            # start date: between now and 90 days from now
-            days_until_start = random.randint(0, 90)
-            start_date = date.today() + timedelta(days=days_until_start)
-
-            # end date: 1-12 months after start date
-            months_duration = random.randint(1, 12)
-            days_duration = months_duration * 30
-            end_date = start_date + timedelta(days=days_duration)
-
-            # listing expires 30 days before start date
-            # or in 60 days, whichever is sooner
-            days_until_expiry = min(days_until_start + 30, 60)
-            if days_until_expiry < 1:
-                days_until_expiry = 30
-            expires_at = timezone.now() + timedelta(days=days_until_expiry)
-
-            try:
-                Sublet.objects.create(
-                    seller=user,
-                    title=title,
-                    description=description,
-                    price=price,
-                    negotiable=negotiable,
-                    expires_at=expires_at,
-                    street_address=street_address,
-                    beds=beds,
-                    baths=baths,
-                    start_date=start_date,
-                    end_date=end_date,
-                )
-                sublets_created += 1
-                bed_str = "Studio" if beds == 0 else f"{beds} bed"
-                self.stdout.write(
-                    f"Created sublet {sublets_created}: {title} - "
-                    f"${price}/mo ({bed_str}, {baths} bath)"
+        names = [f"generated{i}" for i in range(count)]
+        existing = set(
+            User.objects.filter(username__startswith="generated").values_list(
+                "username", flat=True
+            )
+        )
+        # hashing is slow, so every generated user shares one hash
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=name,
+                    email=f"{name}@example.com",
+                    first_name="Generated",
+                    last_name=name.removeprefix("generated"),
+                    password=password,
                 )
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error creating sublet: {str(e)}"))
+                for name in names
+                if name not in existing
+            ],
+            batch_size=1000,
+        )
+        ids = dict(
+            User.objects.filter(username__startswith="generated").values_list(
+                "username", "id"
+            )
+        )
+        return [user.id] + [ids[name] for name in names]
 
-        # summary
-        self.stdout.write(self.style.SUCCESS("\n=== Summary ==="))
-        self.stdout.write(
-            self.style.SUCCESS(f"Successfully created {items_created} items!")
+    def create_categories(self):
+        """Category name -> id, of every category generated items can be in."""
+        Category.objects.bulk_create(
+            [Category(name=name) for name in ITEM_TYPES], ignore_conflicts=True
         )
-        self.stdout.write(
-            self.style.SUCCESS(f"Successfully created {sublets_created} sublets!")
+        return dict(
+            Category.objects.filter(name__in=ITEM_TYPES)
+            .order_by("name")
+            .values_list("name", "id")
         )
-        self.stdout.write(
-            self.style.SUCCESS(f"All listings are created by user: {user.username}")
+
+    def create_tags(self):
+        existing = set(Tag.objects.values_list("name", flat=True))
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in TAGS if name not in existing]
+        )
+        return list(
+            Tag.objects.filter(name__in=TAGS)
+            .order_by("id")
+            .values_list("id", flat=True)
         )
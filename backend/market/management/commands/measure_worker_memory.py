@@ -0,0 +1,99 @@
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+
+def read_memory(pid):
+    """
+    Return {"rss", "pss", "shared", "private"} in kB for a process, read from
+    /proc/<pid>/smaps_rollup (Linux 4.14+).
+    """
+    memory = dict.fromkeys(("rss", "pss", "shared", "private"), 0)
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            field, _, value = line.partition(":")
+            if field in SMAPS_FIELDS:
+                memory[SMAPS_FIELDS[field]] += int(value.split()[0])
+    return memory
+
+
+def find_processes(pattern):
+    processes = []
+    for proc in Path("/proc").iterdir():
+        if not proc.name.isdigit() or int(proc.name) == os.getpid():
+            continue
+        try:
+            cmdline = (proc / "cmdline").read_bytes().replace(b"\0", b" ").decode()
+            ppid = int((proc / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if pattern in cmdline:
+            processes.append((int(proc.name), ppid, cmdline.strip()))
+    return sorted(processes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report resident, proportional and private memory per WSGI worker, "
+        "to compare PRELOAD_WORKERS on and off"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pattern",
+            default="uwsgi",
+            help="Substring of the worker command line to match",
+        )
+
+    def handle(self, *args, **options):
+        if not Path("/proc/self/smaps_rollup").exists():
+            raise CommandError("/proc/<pid>/smaps_rollup is required (Linux only)")
+
+        processes = find_processes(options["pattern"])
+        if not processes:
+            raise CommandError(f"No processes matching '{options['pattern']}'")
+
+        pids = {pid for pid, _, _ in processes}
+        self.stdout.write(
+            f"{'PID':>7} {'ROLE':>7} {'RSS MB':>9} {'PSS MB':>9} "
+            f"{'SHARED MB':>10} {'PRIVATE MB':>11}"
+        )
+        totals = dict.fromkeys(("rss", "pss", "shared", "private"), 0)
+        workers = worker_private = 0
+        for pid, ppid, _ in processes:
+            try:
+                memory = read_memory(pid)
+            except OSError:
+                continue
+            role = "worker" if ppid in pids else "master"
+            if role == "worker":
+                workers += 1
+                worker_private += memory["private"]
+            for key, value in memory.items():
+                totals[key] += value
+            self.stdout.write(
+                f"{pid:>7} {role:>7} {memory['rss'] / 1024:9.1f} "
+                f"{memory['pss'] / 1024:9.1f} {memory['shared'] / 1024:10.1f} "
+                f"{memory['private'] / 1024:11.1f}"
+            )
+
+        self.stdout.write(
+            f"\nTotal PSS (actual memory used): {totals['pss'] / 1024:.1f} MB "
+            f"across {len(processes)} processes"
+        )
+        if workers:
+            self.stdout.write(
+                f"Private memory per worker: "
+                f"{worker_private / 1024 / workers:.1f} MB average"
+            )
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cache, cached_db
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+KEY_PREFIXES = {"cache": cache.KEY_PREFIX, "cached_db": cached_db.KEY_PREFIX}
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy live sessions from the django_session table into the session cache, "
+        "so switching SESSION_BACKEND to cache doesn't log everyone out"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            choices=sorted(KEY_PREFIXES),
+            default="cache",
+            help="Session backend the copies are written for",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the sessions that would be copied without copying them",
+        )
+
+    def handle(self, *args, **options):
+        prefix = KEY_PREFIXES[options["backend"]]
+        session_cache = caches[settings.SESSION_CACHE_ALIAS]
+        now = timezone.now()
+        copied = 0
+
+        sessions = Session.objects.filter(expire_date__gt=now)
+        for session in sessions.iterator(chunk_size=options["batch_size"]):
+            copied += 1
+            if options["dry_run"]:
+                continue
+            # Keep each session's own expiry rather than restarting it
+            timeout = int((session.expire_date - now).total_seconds())
+            session_cache.set(
+                prefix + session.session_key, session.get_decoded(), timeout
+            )
+
+        action = "Would copy" if options["dry_run"] else "Copied"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} {copied} sessions for the {options['backend']} backend"
+            )
+        )
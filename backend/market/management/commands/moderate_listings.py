@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from market.models import Listing
+from utils.moderation import predict_profanity
+
+
+def moderate_batch(batch_size):
+    """
+    Lock up to `batch_size` pending listings, score all their titles and
+    descriptions with one model call, and publish or flag them in one update.
+    Returns the moderated listings.
+    """
+    with transaction.atomic():
+        listings = list(
+            Listing.objects.select_for_update(skip_locked=True)
+            .filter(moderation_status=Listing.ModerationStatus.PENDING_REVIEW)
+            .order_by("moderation_requested_at")
+            .only("id", "title", "description", "moderation_requested_at")[:batch_size]
+        )
+        if not listings:
+            return []
+
+        flags = predict_profanity(
+            [
+                text
+                for listing in listings
+                for text in (listing.title, listing.description)
+            ]
+        )
+        now = timezone.now()
+        for i, listing in enumerate(listings):
+            flagged = flags[2 * i] or flags[2 * i + 1]
+            listing.moderation_status = (
+                Listing.ModerationStatus.FLAGGED
+                if flagged
+                else Listing.ModerationStatus.PUBLISHED
+            )
+            listing.moderated_at = now
+        Listing.objects.bulk_update(listings, ["moderation_status", "moderated_at"])
+    return listings
+
+
+class Command(BaseCommand):
+    help = "Score listings pending review in micro-batches and publish or flag them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.MODERATION_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.MODERATION_POLL_INTERVAL_SECONDS,
+            help="Seconds to sleep when the queue is drained",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue and exit instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total = flagged = 0
+        started = time.perf_counter()
+
+        while True:
+            batch_started = time.perf_counter()
+            listings = moderate_batch(batch_size)
+            if listings:
+                elapsed = time.perf_counter() - batch_started
+                latencies = [
+                    (
+                        listing.moderated_at - listing.moderation_requested_at
+                    ).total_seconds()
+                    for listing in listings
+                    if listing.moderation_requested_at
+                ]
+                batch_flagged = sum(
+                    listing.moderation_status == Listing.ModerationStatus.FLAGGED
+                    for listing in listings
+                )
+                total += len(listings)
+                flagged += batch_flagged
+                self.stdout.write(
+                    f"Moderated {len(listings)} listings ({batch_flagged} flagged) "
+                    f"in {elapsed * 1000:.1f} ms; "
+                    f"queue latency avg {self.mean(latencies):.2f}s "
+                    f"max {max(latencies, default=0):.2f}s; "
+                    f"throughput {len(listings) / elapsed:.1f} listings/s"
+                )
+
+            if len(listings) < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moderated {total} listings ({flagged} flagged) in {elapsed:.2f}s "
+                f"({total / elapsed if elapsed else 0:.1f} listings/s)"
+            )
+        )
+
+    @staticmethod
+    def mean(values):
+        return sum(values) / len(values) if values else 0
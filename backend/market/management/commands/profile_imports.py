@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Boot the app the way a worker does before serving its first request
+BOOT_SCRIPT = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+# Heavy dependencies that must only be imported on first use
+DEFERRED_MODULES = ["profanity_check", "sklearn", "twilio"]
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output into (module, depth, self_us, cumulative_us)
+    tuples, in the order the interpreter reported them.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            # header line
+            continue
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, self_us, cumulative_us))
+    return entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Report module import times for a cold worker boot (python -X importtime) "
+        "and fail if the boot exceeds its budget or imports deferred modules"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=settings.IMPORT_TIME_BUDGET_MS,
+            help="Maximum total import time for a cold boot",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of cold boots to run; the fastest one is reported",
+        )
+        parser.add_argument(
+            "--top", type=int, default=15, help="Number of packages to list"
+        )
+
+    def handle(self, *args, **options):
+        runs = [self.boot() for _ in range(max(options["repeat"], 1))]
+        entries = min(runs, key=lambda run: sum(e[2] for e in run))
+
+        total_ms = sum(self_us for _, _, self_us, _ in entries) / 1000
+        packages = defaultdict(int)
+        for name, _, self_us, _ in entries:
+            packages[name.split(".")[0]] += self_us
+
+        self.stdout.write(f"{len(entries)} modules imported in {total_ms:.1f} ms")
+        self.stdout.write(f"\nTop {options['top']} packages by import time:")
+        for package, self_us in sorted(
+            packages.items(), key=lambda item: item[1], reverse=True
+        )[: options["top"]]:
+            self.stdout.write(f"{self_us / 1000:10.1f} ms  {package}")
+
+        imported = {name for name, *_ in entries}
+        eager = [
+            module
+            for module in DEFERRED_MODULES
+            if any(name == module or name.startswith(f"{module}.") for name in imported)
+        ]
+
+        errors = []
+        if eager:
+            errors.append(f"deferred modules imported at boot: {', '.join(eager)}")
+        if total_ms > options["budget_ms"]:
+            errors.append(
+                f"boot import time {total_ms:.1f} ms exceeds budget of "
+                f"{options['budget_ms']:.0f} ms"
+            )
+        if errors:
+            raise CommandError("; ".join(errors))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nWithin budget: {total_ms:.1f} / {options['budget_ms']:.0f} ms"
+            )
+        )
+
+    def boot(self):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Boot failed:\n{result.stderr[-2000:]}")
+        return parse_importtime(result.stderr)
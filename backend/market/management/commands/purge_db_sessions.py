@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Empty the django_session table once sessions are stored in the cache "
+        "only. Deletes in batches so the table isn't locked for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--expired-only",
+            action="store_true",
+            help="Only delete expired sessions (safe with any SESSION_BACKEND)",
+        )
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if options["expired_only"]:
+            sessions = sessions.filter(expire_date__lte=timezone.now())
+        elif settings.SESSION_ENGINE != "django.contrib.sessions.backends.cache":
+            raise CommandError(
+                f"Sessions are still read from the table ({settings.SESSION_ENGINE}); "
+                "use --expired-only"
+            )
+
+        deleted = 0
+        while True:
+            keys = list(
+                sessions.values_list("session_key", flat=True)[: options["batch_size"]]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} sessions"))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from market.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount favorites and offers per listing and repair any drift in the "
+        "denormalized favorite_count and offer_count columns"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted listings without fixing them",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        checked = drifted = 0
+        last_id = 0
+        actual = {
+            f"actual_{field}": expression
+            for field, expression in Listing.counter_expressions().items()
+        }
+
+        # Walk the table in id order (keyset pagination) so each batch is one
+        # indexed range scan no matter how far in we are
+        while True:
+            batch = list(
+                Listing.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", "favorite_count", "offer_count")
+                .annotate(**actual)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            checked += len(batch)
+
+            stale = []
+            for listing in batch:
+                if (listing.favorite_count, listing.offer_count) == (
+                    listing.actual_favorite_count,
+                    listing.actual_offer_count,
+                ):
+                    continue
+                self.stdout.write(
+                    f"Listing {listing.id}: "
+                    f"favorite_count {listing.favorite_count} -> "
+                    f"{listing.actual_favorite_count}, "
+                    f"offer_count {listing.offer_count} -> "
+                    f"{listing.actual_offer_count}"
+                )
+                stale.append(listing.id)
+
+            drifted += len(stale)
+            if stale and not options["dry_run"]:
+                # Recount inside the UPDATE itself so favorites and offers made
+                # since the batch was read aren't lost
+                Listing.recount(stale)
+
+        action = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {checked} listings. {action} {drifted} with drifted counters"
+            )
+        )
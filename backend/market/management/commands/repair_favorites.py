@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market import favorites
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the favorites sets in Redis with the database and reload the "
+        "ones that drifted (e.g. after writes fell back to the database)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted sets without reloading them",
+        )
+
+    def handle(self, *args, **options):
+        client = favorites.get_client()
+        if client is None:
+            raise CommandError('FAVORITES_BACKEND is not "redis"; nothing to repair')
+
+        # Settle what's pending first so the database is as current as possible
+        favorites.flush()
+
+        checked = drifted = 0
+        for kind, pattern, column, other in (
+            ("user", favorites.USER_KEY, "user_id", "listing_id"),
+            ("listing", favorites.LISTING_KEY, "listing_id", "user_id"),
+        ):
+            prefix = pattern.format("")
+            keys = [key.decode() for key in client.scan_iter(match=f"{prefix}*")]
+            for i in range(0, len(keys), options["batch_size"]):
+                batch = {
+                    int(key[len(prefix) :]): key
+                    for key in keys[i : i + options["batch_size"]]
+                }
+                expected = self.expected_members(client, batch, column, other)
+                with client.pipeline() as pipe:
+                    for key in batch.values():
+                        pipe.smembers(key)
+                    members = pipe.execute()
+
+                for (owner_id, key), actual in zip(batch.items(), members):
+                    checked += 1
+                    actual = {int(member) for member in actual} - {0}
+                    if actual == expected[owner_id]:
+                        continue
+                    drifted += 1
+                    self.stdout.write(
+                        f"{kind.capitalize()} {owner_id}: "
+                        f"{len(actual - expected[owner_id])} extra, "
+                        f"{len(expected[owner_id] - actual)} missing"
+                    )
+                    if not options["dry_run"]:
+                        client.delete(key)
+                        if kind == "user":
+                            favorites.load_user(client, owner_id)
+                            # the set the client holds may match neither
+                            client.hset(
+                                favorites.VERSIONS_KEY,
+                                owner_id,
+                                max(
+                                    favorites.version(owner_id),
+                                    favorites.db_version(owner_id),
+                                )
+                                + 1,
+                            )
+                        else:
+                            favorites.load_listing(client, owner_id)
+
+        action = "Found" if options["dry_run"] else "Reloaded"
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} sets. {action} {drifted} drifted")
+        )
+
+    @staticmethod
+    def expected_members(client, batch, column, other):
+        """
+        The members each set should have: the database rows, with writes made
+        since the flush (still pending in Redis) applied on top.
+        """
+        expected = defaultdict(set)
+        rows = favorites.Favorite.objects.filter(
+            **{f"{column}__in": batch}
+        ).values_list(column, other)
+        for owner_id, member_id in rows:
+            expected[owner_id].add(member_id)
+
+        for user_id, listing_id, added in favorites.pending_writes(client):
+            owner_id, member_id = (
+                (user_id, listing_id) if column == "user_id" else (listing_id, user_id)
+            )
+            if owner_id in batch:
+                if added:
+                    expected[owner_id].add(member_id)
+                else:
+                    expected[owner_id].discard(member_id)
+        return expected
@@ -0,0 +1,215 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from market.authentication import create_session
+from market.models import Listing
+from market.recording import (
+    CURSOR_PARAMS,
+    PSEUDONYM,
+    TEXT_PARAMS,
+    percentile,
+    shape_key,
+)
+from market.seeding import ITEM_TYPES, NEIGHBORHOODS
+
+
+User = get_user_model()
+
+# what replays search for in place of recorded free text
+TEXT_VALUES = {
+    "title": [item_type for types in ITEM_TYPES.values() for item_type in types],
+    "address": sorted(
+        {street for _, _, streets, _ in NEIGHBORHOODS for street in streets}
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-issue GET requests recorded by RequestRecordingMiddleware "
+        "(market/recording.py) against a running instance that shares this "
+        "process's database, seeded by generate_listings, and save their "
+        "latencies for compare_replays. Recorded ids map to local listings by "
+        "popularity. Requests that carried credentials are sent as a "
+        "generated user. Requests for a later page (a cursor) fetch the second "
+        "page of the local results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("recordings", nargs="+", help="Files the middleware wrote")
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument(
+            "--output", required=True, help="JSON file to save the latencies to"
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=100,
+            help="Replay this many requests first, unmeasured",
+        )
+        parser.add_argument("--limit", type=int, help="Replay at most this many")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        shapes = [
+            shape
+            for shape in self.read(options["recordings"])
+            if shape["m"] in ("GET", "HEAD")
+        ][: options["limit"]]
+        if not shapes:
+            raise CommandError("No GET requests recorded")
+        user = User.objects.filter(username__startswith="generated").first()
+        if user is None:
+            raise CommandError("No generated users: run generate_listings first")
+
+        rng = random.Random(options["seed"])
+        ids = self.listing_ids(shapes)
+        cookie = self.session_cookie(user)
+        base = options["url"].rstrip("/")
+        next_pages = {}
+        requests = []
+        for shape in shapes:
+            url = base + self.path(shape, ids, rng)
+            if any(name in CURSOR_PARAMS for name, _ in shape["q"]):
+                url = self.next_page(url, self.headers(shape, cookie), next_pages)
+            requests.append((shape, url))
+
+        def replay(request):
+            shape, url = request
+            headers = self.headers(shape, cookie)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(
+                    urllib.request.Request(url, method=shape["m"], headers=headers),
+                    timeout=30,
+                ) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                e.read()
+                status = e.code
+            except (urllib.error.URLError, OSError):
+                status = None
+            return shape, status, time.perf_counter() - start
+
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(replay, requests[: options["warmup"]]))
+            started = time.perf_counter()
+            results = list(pool.map(replay, requests))
+        elapsed = time.perf_counter() - started
+
+        grouped = defaultdict(
+            lambda: {"latencies_ms": [], "statuses": Counter(), "mismatched": 0}
+        )
+        for shape, status, duration in results:
+            group = grouped[shape_key(shape)]
+            group["latencies_ms"].append(round(duration * 1000, 2))
+            group["statuses"][str(status)] += 1
+            # e.g. a listing that's gone locally, or a lost connection
+            group["mismatched"] += status != shape["s"]
+        for group in grouped.values():
+            group["latencies_ms"].sort()
+
+        with open(options["output"], "w") as f:
+            json.dump(
+                {
+                    "url": base,
+                    "requests": len(results),
+                    "elapsed_s": elapsed,
+                    "shapes": grouped,
+                },
+                f,
+            )
+
+        self.stdout.write(
+            f"Replayed {len(results):,} requests in {elapsed:.1f}s "
+            f"({len(results) / elapsed:.1f}/s) to {options['output']}"
+        )
+        for key, group in sorted(
+            grouped.items(), key=lambda item: -len(item[1]["latencies_ms"])
+        )[:20]:
+            latencies = group["latencies_ms"]
+            self.stdout.write(
+                f"{len(latencies):>7,}  p50 {percentile(latencies, 0.5):7.1f} ms  "
+                f"p95 {percentile(latencies, 0.95):7.1f} ms  "
+                f"p99 {percentile(latencies, 0.99):7.1f} ms  "
+                f"{group['mismatched']:>5} mismatched  {key}"
+            )
+
+    def read(self, paths):
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def listing_ids(self, shapes):
+        """Local listing ids for the recorded pseudonyms, most requested first."""
+        pseudonyms = Counter(
+            part
+            for shape in shapes
+            for part in shape["p"].split("/")
+            if PSEUDONYM.match(part)
+        )
+        # the listings anyone can see, as those recorded were
+        ids = list(
+            Listing.objects.filter(
+                Q(expires_at__gte=timezone.now()) | Q(expires_at__isnull=True),
+                moderation_status=Listing.ModerationStatus.PUBLISHED,
+            )
+            .order_by("-favorite_count", "id")
+            .values_list("id", flat=True)[: len(pseudonyms)]
+        )
+        if pseudonyms and not ids:
+            raise CommandError("No listings: run generate_listings first")
+        return {
+            pseudonym: str(ids[rank % len(ids)])
+            for rank, (pseudonym, _) in enumerate(pseudonyms.most_common())
+        }
+
+    def path(self, shape, ids, rng):
+        """The recorded path with local ids and text, without its cursor."""
+        path = "/".join(ids.get(part, part) for part in shape["p"].split("/"))
+        params = []
+        for name, value in shape["q"]:
+            if value is not None:
+                params.append((name, value))
+            elif name in TEXT_PARAMS:
+                params.append((name, rng.choice(TEXT_VALUES[name])))
+        return path + (f"?{urllib.parse.urlencode(params)}" if params else "")
+
+    def headers(self, shape, cookie):
+        return {"Cookie": cookie} if shape["a"] else {}
+
+    def next_page(self, url, headers, next_pages):
+        """
+        The `next` link of the page at `url`, fetched once before the replay.
+        If the local data has no second page, the first page is replayed.
+        """
+        key = (url, bool(headers))
+        if key not in next_pages:
+            try:
+                with urllib.request.urlopen(
+                    urllib.request.Request(url, headers=headers), timeout=30
+                ) as response:
+                    next_url = json.load(response).get("next")
+            except (urllib.error.URLError, OSError, ValueError, AttributeError):
+                next_url = None
+            next_pages[key] = next_url or url
+        return next_pages[key]
+
+    def session_cookie(self, user):
+        # the instance shares this process's database and session store
+        return f"{settings.SESSION_COOKIE_NAME}={create_session(user)}"
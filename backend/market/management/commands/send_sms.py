@@ -0,0 +1,142 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from prometheus_client import start_http_server
+
+from market.models import OutboundSMS
+from utils.metrics import SMS_MESSAGES
+from utils.sms import SMSError, get_backend
+
+
+def backoff(attempts):
+    """Delay before retrying after `attempts` failures: doubling, with jitter."""
+    delay = settings.SMS_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(1, 1.5))
+
+
+def claim(batch_size):
+    """
+    Lock up to `batch_size` messages that are due and push their next attempt
+    past the time sending them all could take, so no other sender picks them
+    up meanwhile. If this process dies mid-batch, the messages it never got to
+    come due again once that time has passed. Expired messages are failed on
+    the spot.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboundSMS.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundSMS.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        # each send can take up to SMS_TIMEOUT_SECONDS
+        claimed_until = now + timedelta(
+            seconds=settings.SMS_TIMEOUT_SECONDS * (len(messages) + 1)
+        )
+        for message in messages:
+            if message.expires_at and message.expires_at <= now:
+                message.status = OutboundSMS.Status.FAILED
+                message.last_error = "Expired before it could be sent"
+                message.body = ""
+                SMS_MESSAGES.labels("expired").inc()
+            else:
+                message.attempts += 1
+                message.next_attempt_at = claimed_until
+
+        OutboundSMS.objects.bulk_update(
+            messages, ["status", "attempts", "next_attempt_at", "last_error", "body"]
+        )
+    return messages
+
+
+def deliver_batch(batch_size):
+    """
+    Claim up to `batch_size` messages that are due and send them, rescheduling
+    the ones that fail. Returns the messages attempted.
+    """
+    backend = get_backend()
+    messages = claim(batch_size)
+    for message in messages:
+        if message.status != OutboundSMS.Status.PENDING:
+            continue
+
+        try:
+            message.provider_id = backend.send(str(message.to), message.body)
+        except SMSError as e:
+            message.last_error = str(e)
+            if not e.retryable or message.attempts >= settings.SMS_MAX_ATTEMPTS:
+                message.status = OutboundSMS.Status.FAILED
+                message.body = ""
+                SMS_MESSAGES.labels("failed").inc()
+            else:
+                message.next_attempt_at = timezone.now() + backoff(message.attempts)
+                SMS_MESSAGES.labels("retrying").inc()
+        else:
+            message.status = OutboundSMS.Status.SENT
+            message.sent_at = timezone.now()
+            # verification codes are credentials; don't keep them once sent
+            message.body = ""
+            SMS_MESSAGES.labels("sent").inc()
+
+        # Right away, so a crash later in the batch can't send this one again
+        message.save(
+            update_fields=[
+                "status",
+                "body",
+                "next_attempt_at",
+                "last_error",
+                "provider_id",
+                "sent_at",
+            ]
+        )
+    return messages
+
+
+class Command(BaseCommand):
+    help = "Send queued text messages, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.SMS_BATCH_SIZE)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.SMS_POLL_INTERVAL_SECONDS,
+            help="Seconds to sleep when no messages are due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is due and exit instead of polling forever",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Export Prometheus metrics over HTTP on this port",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"])
+        while True:
+            started = time.perf_counter()
+            messages = deliver_batch(batch_size)
+            if messages:
+                counts = {status: 0 for status in OutboundSMS.Status.values}
+                for message in messages:
+                    counts[message.status] += 1
+                self.stdout.write(
+                    f"Sent {counts['SENT']}, failed {counts['FAILED']}, "
+                    f"retrying {counts['PENDING']} of {len(messages)} messages "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+                )
+
+            if len(messages) < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0005_sublet_true_latitude_sublet_true_longitude"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="listing",
+            name="moderated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="listing",
+            name="moderation_requested_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="listing",
+            name="moderation_status",
+            field=models.CharField(
+                choices=[
+                    ("PUBLISHED", "Published"),
+                    ("PENDING_REVIEW", "Pending Review"),
+                    ("FLAGGED", "Flagged"),
+                ],
+                default="PUBLISHED",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(
+                condition=models.Q(("moderation_status", "PENDING_REVIEW")),
+                fields=["moderation_requested_at"],
+                name="listing_pending_review_idx",
+            ),
+        ),
+    ]
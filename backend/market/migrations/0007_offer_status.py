@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0006_listing_moderation_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offer",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("ACCEPTED", "Accepted"),
+                    ("DECLINED", "Declined"),
+                    ("WITHDRAWN", "Withdrawn"),
+                    ("EXPIRED", "Expired"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="offer",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["listing"],
+                name="offer_pending_listing_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="offer",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["user"],
+                name="offer_pending_user_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Listing = apps.get_model("market", "Listing")
+    Offer = apps.get_model("market", "Offer")
+    Favorite = Listing.favorites.through
+
+    def count(model):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(listing_id=OuterRef("pk"))
+                .values("listing_id")
+                .annotate(count=Count("*"))
+                .values("count")
+            ),
+            0,
+        )
+
+    Listing.objects.update(favorite_count=count(Favorite), offer_count=count(Offer))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0007_offer_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="listing",
+            name="favorite_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="listing",
+            name="offer_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(
+                fields=["favorite_count"], name="market_list_favorit_313e29_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(
+                fields=["offer_count"], name="market_list_offer_c_c392d0_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
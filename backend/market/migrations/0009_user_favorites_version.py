@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-19 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0008_listing_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="favorites_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0010_outbound_sms"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="offer",
+            name="unique_offer_market",
+        ),
+        migrations.AddConstraint(
+            model_name="offer",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["PENDING", "ACCEPTED"])),
+                fields=("user", "listing"),
+                name="unique_offer_market",
+            ),
+        ),
+    ]
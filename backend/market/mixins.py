@@ -1,4 +1,9 @@
-from market.models import Item, Sublet
+from rest_framework import exceptions
+from rest_framework.serializers import ListSerializer
+
+from market.instrumentation import timed
+from market.models import Item, Offer, Sublet
+from utils.moderation import predict_profanity
 
 
 class DefaultOrderMixin:
@@ -11,6 +16,35 @@ class DefaultOrderMixin:
         return qs
 
 
+class OfferStatusFilterMixin:
+    def filter_status(self, queryset):
+        if status := self.request.query_params.get("status"):
+            status = status.upper()
+            if status not in Offer.Status.values:
+                valid = ", ".join(value.lower() for value in Offer.Status.values)
+                raise exceptions.ValidationError({"status": f"Must be one of: {valid}"})
+            queryset = queryset.filter(status=status)
+        return queryset
+
+
+class ListingOrderingMixin:
+    ordering_fields = ["price", "created_at", "favorite_count", "offer_count"]
+
+    def order_listings(self, queryset):
+        """
+        Apply `?ordering=<field>` or `?ordering=-<field>`, breaking ties by id so
+        pages stay stable while counters change.
+        """
+        ordering = self.request.query_params.get("ordering")
+        if not ordering:
+            return queryset
+        if ordering.lstrip("-") not in self.ordering_fields:
+            valid = ", ".join(self.ordering_fields)
+            raise exceptions.ValidationError({"ordering": f"Must be one of: {valid}"})
+        tiebreaker = "-id" if ordering.startswith("-") else "id"
+        return queryset.order_by(ordering, tiebreaker)
+
+
 class ListingTypeMixin:
     def get_listing_type(self, obj):
         for subclass in (Item, Sublet):
@@ -33,3 +67,45 @@ class ListingTypeMixin:
             return serializer.data
         print("UNKNOWN LISTING TYPE FOR ADDITIONAL DATA")
         return {}
+
+
+class ProfanityCheckListSerializer(ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            texts = [
+                text for item in data for text in self.child.get_profanity_texts(item)
+            ]
+            with timed("moderation_time"):
+                predict_profanity(texts)
+        return super().to_internal_value(data)
+
+
+class ProfanityCheckMixin:
+    """
+    Scores every field in `profanity_fields` with one batched model call before
+    field validation runs, so the per-field `validate_<field>` checks are
+    answered from the moderation cache. Pair with
+    `list_serializer_class = ProfanityCheckListSerializer` to batch bulk payloads.
+    """
+
+    profanity_fields = []
+    defer_profanity_check = False
+
+    def get_profanity_texts(self, data):
+        if self.defer_profanity_check or not hasattr(data, "get"):
+            return []
+        return [
+            text
+            for text in (data.get(field) for field in self.profanity_fields)
+            if isinstance(text, str)
+        ]
+
+    def to_internal_value(self, data):
+        if not isinstance(getattr(self, "parent", None), ProfanityCheckListSerializer):
+            with timed("moderation_time"):
+                predict_profanity(self.get_profanity_texts(data))
+        return super().to_internal_value(data)
+
+    def contains_profanity(self, text):
+        with timed("moderation_time"):
+            return predict_profanity([text])[0]
@@ -7,6 +7,8 @@ from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
 
@@ -19,19 +21,45 @@ class User(AbstractUser):
     phone_number = PhoneNumberField(null=True, blank=True)
     phone_verified = models.BooleanField(default=False)
     phone_verified_at = models.DateTimeField(null=True, blank=True)
+    # Bumped whenever the user's favorites change, so clients can tell whether
+    # their copy of the set is current
+    favorites_version = models.PositiveIntegerField(default=0)
 
 
 class Offer(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        ACCEPTED = "ACCEPTED", "Accepted"
+        DECLINED = "DECLINED", "Declined"
+        WITHDRAWN = "WITHDRAWN", "Withdrawn"
+        EXPIRED = "EXPIRED", "Expired"
+
+    # Offers that are still live; a buyer has at most one per listing
+    ACTIVE_STATUSES = [Status.PENDING, Status.ACCEPTED]
+
     class Meta:
         constraints = [
+            # After a decline, withdrawal or expiry the buyer can offer again
             models.UniqueConstraint(
-                fields=["user", "listing"], name="unique_offer_market"
+                fields=["user", "listing"],
+                condition=models.Q(status__in=["PENDING", "ACCEPTED"]),
+                name="unique_offer_market",
             )
         ]
         indexes = [
             models.Index(fields=["user"]),
             models.Index(fields=["listing"]),
             models.Index(fields=["created_at"]),
+            models.Index(
+                fields=["listing"],
+                condition=models.Q(status="PENDING"),
+                name="offer_pending_listing_idx",
+            ),
+            models.Index(
+                fields=["user"],
+                condition=models.Q(status="PENDING"),
+                name="offer_pending_user_idx",
+            ),
         ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="offers")
@@ -42,6 +70,9 @@ class Offer(models.Model):
         max_digits=10, decimal_places=2, validators=[MinValueValidator(0)]
     )
     message = models.TextField(max_length=500, blank=True)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -65,6 +96,11 @@ class Tag(models.Model):
 
 
 class Listing(models.Model):
+    class ModerationStatus(models.TextChoices):
+        PUBLISHED = "PUBLISHED", "Published"
+        PENDING_REVIEW = "PENDING_REVIEW", "Pending Review"
+        FLAGGED = "FLAGGED", "Flagged"
+
     class Meta:
         indexes = [
             models.Index(fields=["title"]),
@@ -72,6 +108,13 @@ class Listing(models.Model):
             models.Index(fields=["created_at"]),
             models.Index(fields=["expires_at"]),
             models.Index(fields=["negotiable"]),
+            models.Index(fields=["favorite_count"]),
+            models.Index(fields=["offer_count"]),
+            models.Index(
+                fields=["moderation_requested_at"],
+                condition=models.Q(moderation_status="PENDING_REVIEW"),
+                name="listing_pending_review_idx",
+            ),
         ]
 
     seller = models.ForeignKey(
@@ -94,10 +137,60 @@ class Listing(models.Model):
     negotiable = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True)
+    # Denormalized counts of favorites and offers, kept in step with F()
+    # updates and repaired by `manage.py reconcile_listing_counters`
+    favorite_count = models.PositiveIntegerField(default=0)
+    offer_count = models.PositiveIntegerField(default=0)
+    moderation_status = models.CharField(
+        max_length=20,
+        choices=ModerationStatus.choices,
+        default=ModerationStatus.PUBLISHED,
+    )
+    moderation_requested_at = models.DateTimeField(null=True, blank=True)
+    moderated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.title} by {self.seller}"
 
+    @classmethod
+    def adjust_count(cls, listing_id, field, delta):
+        """
+        Atomically add `delta` to a denormalized counter (favorite_count or
+        offer_count) without reading it first, clamping at zero. Returns
+        whether the listing exists.
+        """
+        return cls.objects.filter(id=listing_id).update(
+            **{field: Greatest(models.F(field) + delta, 0)}
+        )
+
+    @classmethod
+    def counter_expressions(cls):
+        """
+        Subqueries that recount each denormalized counter from its source table,
+        for annotating or updating listings in bulk.
+        """
+
+        def count(model):
+            return Coalesce(
+                models.Subquery(
+                    model.objects.filter(listing_id=models.OuterRef("pk"))
+                    .values("listing_id")
+                    .annotate(count=models.Count("*"))
+                    .values("count")
+                ),
+                0,
+            )
+
+        return {
+            "favorite_count": count(cls.favorites.through),
+            "offer_count": count(Offer),
+        }
+
+    @classmethod
+    def recount(cls, listing_ids):
+        """Recompute the counters of the given listings in one UPDATE."""
+        cls.objects.filter(id__in=listing_ids).update(**cls.counter_expressions())
+
 
 class ListingImage(models.Model):
     listing = models.ForeignKey(
@@ -177,3 +270,43 @@ class Sublet(Listing):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+class OutboundSMS(models.Model):
+    """
+    Outbox of text messages. Views only insert rows; `manage.py send_sms`
+    delivers them, retrying failures with exponential backoff.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    class Meta:
+        verbose_name = "outbound SMS"
+        verbose_name_plural = "outbound SMS"
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="PENDING"),
+                name="sms_pending_idx",
+            ),
+        ]
+
+    to = PhoneNumberField()
+    body = models.TextField()
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # not worth sending after this (e.g. the code in it has expired)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    provider_id = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"SMS to {self.to} ({self.status})"
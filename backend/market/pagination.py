@@ -1,4 +1,4 @@
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
 from rest_framework.response import Response
 
 
@@ -10,13 +10,44 @@ class PageSizeOffsetPagination(LimitOffsetPagination):
     max_limit = 100
 
     def get_paginated_response(self, data):
-        return Response(
-            {
-                "count": self.count,
-                "next": self.get_next_link(),
-                "previous": self.get_previous_link(),
-                "page_size": self.get_limit(self.request),
-                "offset": self.get_offset(self.request),
-                "results": data,
-            }
-        )
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "page_size": self.get_limit(self.request),
+            "offset": self.get_offset(self.request),
+            "results": data,
+        }
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() for async views; also accepts a list."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        if isinstance(queryset, list):
+            self.count = len(queryset)
+        else:
+            self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        page = queryset[self.offset : self.offset + self.limit]
+        if isinstance(page, list):
+            return page
+        return [obj async for obj in page]
+
+
+class ListingCursorPagination(CursorPagination):
+    """
+    Keyset pagination over listings, newest first. Pages are fetched with an
+    indexed `id < cursor` predicate instead of OFFSET, and no COUNT is run.
+    """
+
+    page_size = 25
+    page_size_query_param = "limit"
+    max_page_size = 100
+    ordering = "-id"
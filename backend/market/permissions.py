@@ -45,14 +45,20 @@ class ListingImageOwnerPermission(permissions.BasePermission):
 
 class OfferOwnerPermission(permissions.BasePermission):
     """
-    Custom permission to allow owner of an offer to delete it.
+    Custom permission to allow owner of an offer to delete or withdraw it,
+    and the seller of the listing to view, accept or decline it.
     """
 
+    seller_actions = ("accept", "decline")
+
     def has_permission(self, request, view):
         return request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:  # GET
-            return obj.listing.seller == request.user
+            return obj.listing.seller_id == request.user.id
+
+        if getattr(view, "action", None) in self.seller_actions:
+            return obj.listing.seller_id == request.user.id
 
         return obj.user == request.user
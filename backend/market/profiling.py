@@ -0,0 +1,134 @@
+"""
+Profiles of single requests, for superusers.
+
+Add `?profile=1` to a request, as a superuser (by session or Bearer token), to
+get a profile of it instead of its response: the call stacks the request was
+seen in, sampled every PROFILE_SAMPLE_INTERVAL_MS, in the folded format that
+flamegraph.pl and speedscope.app read. The response's own status is in the
+X-Profiled-Status header.
+
+Sync requests sample only the thread serving the request. Async requests run
+on the event loop and in sync_to_async's threads, so every thread of the
+process is sampled, each stack under its thread's name, and other requests
+served at the same time show up too.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from market.authentication import CachedPlatformAuthentication, aauthenticate
+
+
+class Sampler:
+    """
+    Counts the call stacks of the threads in `thread_ids` (all but its own if
+    None), sampled every `interval` seconds from a thread of its own while
+    used as a context manager.
+    """
+
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread.ident or (
+                self.thread_ids is not None and thread_id not in self.thread_ids
+            ):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if self.thread_ids is None:
+                stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """One `frame;frame;... count` line per stack, outermost frame first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def profile_response(request, response, sampler):
+    profile = HttpResponse(sampler.folded(), content_type="text/plain")
+    name = f"{request.method}-{request.path.strip('/').replace('/', '-')}"
+    profile["Content-Disposition"] = (
+        f'attachment; filename="{name}-{time.strftime("%Y%m%dT%H%M%S")}.folded"'
+    )
+    profile["X-Profiled-Status"] = response.status_code
+    return profile
+
+
+class ProfilingMiddleware:
+    """Profiles ?profile=1 requests from superusers; needs AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.GET.get("profile") != "1" or not self.is_superuser(request):
+            return self.get_response(request)
+        with Sampler(self.interval, {threading.get_ident()}) as sampler:
+            response = self.get_response(request)
+        return profile_response(request, response, sampler)
+
+    async def __acall__(self, request):
+        if request.GET.get("profile") != "1":
+            return await self.get_response(request)
+        try:
+            user = await aauthenticate(request)
+        except AuthenticationFailed:
+            return await self.get_response(request)
+        if not user.is_superuser:
+            return await self.get_response(request)
+        with Sampler(self.interval) as sampler:
+            response = await self.get_response(request)
+        return profile_response(request, response, sampler)
+
+    @property
+    def interval(self):
+        return settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+
+    def is_superuser(self, request):
+        authentication = CachedPlatformAuthentication()
+        authorization = request.headers.get("Authorization", "").split()
+        if not authorization or authorization[0] != authentication.keyword:
+            return request.user.is_superuser
+        try:
+            user, _ = authentication.authenticate(request) or (None, None)
+        except AuthenticationFailed:
+            return False
+        return user is not None and user.is_superuser
@@ -0,0 +1,167 @@
+"""
+Recording of request shapes, to replay real traffic against local builds.
+
+Set REQUEST_RECORDING_PATH and RequestRecordingMiddleware appends a JSON line
+to that file for each request to the API (a REQUEST_RECORDING_SAMPLE_RATE
+share of them). The line holds when the request came, its method, path and
+query parameters, whether it carried credentials, and the response's status,
+duration and size. Put `{pid}` in the path to give each worker process a file
+of its own.
+
+Nothing else is recorded: no users, headers or bodies. Numeric path segments
+(listing, offer and image ids) become pseudonyms keyed with SECRET_KEY. They
+can't be turned back into ids, but requests for the same listing share one.
+Only parameters in KEPT_PARAMS keep their values; the others, like title
+searches and pagination cursors, are recorded as null.
+
+`manage.py replay_requests` re-issues the recorded GETs against a local
+instance, seeded by generate_listings. `manage.py compare_replays` diffs the
+latencies of two replays, e.g. before and after a change.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+# Listing filters and pagination, whose values say nothing about who sent them
+KEPT_PARAMS = {
+    "type",
+    "category",
+    "condition",
+    "min_price",
+    "max_price",
+    "negotiable",
+    "beds",
+    "baths",
+    "tags",
+    "start_date",
+    "end_date",
+    "seller",
+    "status",
+    "ordering",
+    "limit",
+    "offset",
+    "top",
+}
+# Free-text filters, which replays fill with words of their own
+TEXT_PARAMS = {"title", "address"}
+# Cursors point into the recorded data; replays fetch a later page of their own
+CURSOR_PARAMS = {"cursor"}
+
+PSEUDONYM = re.compile(r"^\{[0-9a-f]{8}\}$")
+
+
+def pseudonym(segment):
+    digest = hmac.new(settings.SECRET_KEY.encode(), segment.encode(), hashlib.sha256)
+    return "{" + digest.hexdigest()[:8] + "}"
+
+
+def request_shape(request, response, started_at, duration):
+    return {
+        "t": round(started_at, 3),
+        "m": request.method,
+        "p": "/".join(
+            pseudonym(part) if part.isdigit() else part
+            for part in request.path.split("/")
+        ),
+        "q": [
+            [name, value if name in KEPT_PARAMS else None]
+            for name, values in request.GET.lists()
+            for value in values
+        ],
+        # from the request alone: looking up the user could query the database
+        "a": "Authorization" in request.headers
+        or settings.SESSION_COOKIE_NAME in request.COOKIES,
+        "s": response.status_code,
+        "ms": round(duration * 1000, 2),
+        "b": None if response.streaming else len(response.content),
+    }
+
+
+def shape_key(shape):
+    """e.g. `GET /market/listings/{id}/?ordering&type`, for grouping requests."""
+    path = "/".join(
+        "{id}" if PSEUDONYM.match(part) else part for part in shape["p"].split("/")
+    )
+    names = sorted({name for name, _ in shape["q"]})
+    return f"{shape['m']} {path}" + (f"?{'&'.join(names)}" if names else "")
+
+
+def percentile(values, fraction):
+    """The value `fraction` of the way through sorted `values`."""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Recorder:
+    """Appends lines to a file, reopened in processes forked after it opened."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def write(self, shape):
+        line = json.dumps(shape, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                # line buffered: each line is one write() to a file in append
+                # mode, so processes sharing the file don't interleave lines
+                self.file = open(
+                    self.path.format(pid=self.pid), "a", buffering=1, encoding="utf-8"
+                )
+            self.file.write(line)
+
+
+class RequestRecordingMiddleware:
+    """Records request shapes when REQUEST_RECORDING_PATH is set."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_RECORDING_PATH:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.recorder = Recorder(settings.REQUEST_RECORDING_PATH)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+        started_at, start = time.time(), time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started_at, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+        started_at, start = time.time(), time.perf_counter()
+        response = await self.get_response(request)
+        # a line to the page cache; not worth a thread hop
+        self.record(request, response, started_at, time.perf_counter() - start)
+        return response
+
+    def sampled(self, request):
+        return (
+            request.path.startswith("/market/")
+            and random.random() < settings.REQUEST_RECORDING_SAMPLE_RATE
+        )
+
+    def record(self, request, response, started_at, duration):
+        self.recorder.write(request_shape(request, response, started_at, duration))
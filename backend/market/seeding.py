@@ -0,0 +1,372 @@
+"""
+Bulk inserts of generated data, for benchmarks and local performance work.
+
+`manage.py generate_listings` generates listings in chunks of CHUNK_SIZE with
+`generate_chunk`. A chunk's rows depend only on the seed and the chunk's
+number, so the same seed generates the same data whatever the number of
+processes or the batch size. Favorites and offers follow Zipf's law within a
+chunk: a few listings get most of them.
+"""
+
+import itertools
+import random
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from market.models import Item, Listing, ListingImage, Offer, Sublet
+
+
+CHUNK_SIZE = 10_000
+
+ITEM_TYPES = {
+    "Art": ["Painting", "Sculpture", "Print", "Drawing", "Poster"],
+    "Books": ["Textbook", "Novel", "Magazine", "Comic Book", "Reference Book"],
+    "Clothing": ["Jacket", "Shirt", "Pants", "Dress", "Shoes"],
+    "Electronics": ["Laptop", "Phone", "Tablet", "Headphones", "Monitor"],
+    "Furniture": ["Chair", "Desk", "Table", "Bookshelf", "Lamp"],
+    "Home and Garden": ["Plant", "Rug", "Curtains", "Kitchen Set", "Decoration"],
+    "Music": ["Guitar", "Keyboard", "Speakers", "Vinyl Record", "Music Stand"],
+    "Other": ["Bike", "Skateboard", "Game Console", "Camera", "Watch"],
+    "Tools": ["Toolbox", "Drill", "Hammer Set", "Measuring Tape", "Saw"],
+    "Vehicles": ["Bicycle", "Scooter", "Skateboard", "Motorcycle Helmet", "Car Seat"],
+}
+ITEM_ADJECTIVES = [
+    "Vintage",
+    "Modern",
+    "Classic",
+    "Brand New",
+    "Like New",
+    "Gently Used",
+    "Rare",
+    "Limited Edition",
+    "Premium",
+    "Budget-Friendly",
+    "Professional",
+    "Student",
+    "Portable",
+    "Compact",
+    "Spacious",
+]
+ITEM_DESCRIPTIONS = [
+    "Great condition, barely used!",
+    "Perfect for students. Must sell before graduation.",
+    "Moving out sale - need gone ASAP!",
+    "Works perfectly, no issues.",
+    "Excellent quality, well maintained.",
+    "Amazing deal, don't miss out!",
+    "Slight wear and tear but fully functional.",
+    "Like new condition, original packaging included.",
+    "Used for one semester only.",
+    "Selling because I upgraded to a newer model.",
+]
+SUBLET_ADJECTIVES = [
+    "Cozy",
+    "Spacious",
+    "Modern",
+    "Renovated",
+    "Charming",
+    "Bright",
+    "Quiet",
+    "Convenient",
+    "Luxurious",
+    "Affordable",
+]
+SUBLET_TYPES = [
+    "Studio Apartment",
+    "1BR Apartment",
+    "2BR Apartment",
+    "3BR Apartment",
+    "Room in Shared Apartment",
+    "Loft",
+    "Townhouse",
+    "House",
+]
+SUBLET_DESCRIPTIONS = [
+    "Perfect location near campus! Walking distance to classes and libraries.",
+    "Newly renovated with modern appliances. Available for summer sublet.",
+    "Great for students! Utilities included, close to public transportation.",
+    "Furnished apartment in a safe, quiet neighborhood. Perfect for studying.",
+    "Beautiful apartment with lots of natural light. Must see!",
+    "Ideal for summer internship. Flexible lease terms available.",
+    "Close to restaurants, shops, and nightlife. Very convenient location.",
+    "Spacious and clean. Perfect for roommates or single occupant.",
+    "Pet-friendly building with on-site laundry. Great amenities!",
+    "Amazing deal for the location! Available immediately.",
+]
+# Where sublets are: (latitude, longitude) of the neighborhood's center, its
+# spread in degrees, the streets in it and its share of sublets
+NEIGHBORHOODS = [
+    ((39.9522, -75.1932), 0.004, ["Locust", "Spruce", "Walnut", "Chestnut"], 50),
+    ((39.9540, -75.2120), 0.006, ["Baltimore", "Pine", "Sansom", "Market"], 25),
+    ((39.9496, -75.1720), 0.005, ["Lombard", "South", "Pine", "Spruce"], 15),
+    ((39.9580, -75.1650), 0.006, ["Arch", "Race", "Market", "Chestnut"], 10),
+]
+OFFER_MESSAGES = ["", "Is this still available?", "Can you do a bit lower?"]
+OFFER_STATUSES = {
+    Offer.Status.PENDING: 70,
+    Offer.Status.DECLINED: 15,
+    Offer.Status.ACCEPTED: 5,
+    Offer.Status.WITHDRAWN: 5,
+    Offer.Status.EXPIRED: 5,
+}
+
+
+class Population:
+    """What generated listings refer to: ids of users, categories and tags."""
+
+    def __init__(self, user_ids, category_ids, tag_ids):
+        self.user_ids = user_ids
+        # category name -> id
+        self.category_ids = category_ids
+        self.tag_ids = tag_ids
+        # a few users sell most listings
+        self.seller_weights = cumulative_zipf(len(user_ids))
+
+
+def cumulative_zipf(n, exponent=1.1):
+    """Cumulative weights of ranks 1..n under Zipf's law, for random.choices()."""
+    return list(itertools.accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+def bulk_create_listings(listings, batch_size=1000):
+    """
+    bulk_create() for unsaved Items or Sublets, all of one model, which Django
+    refuses for multi-table inherited models: inserts their Listing rows, then
+    their own rows pointing at those. Needs a database that returns the ids of
+    bulk inserted rows (PostgreSQL, SQLite 3.35+).
+    """
+    if not listings:
+        return listings
+    model = type(listings[0])
+    db = router.db_for_write(model)
+    fields = [f for f in Listing._meta.concrete_fields if not f.primary_key]
+    with transaction.atomic(using=db):
+        parents = Listing.objects.using(db).bulk_create(
+            [
+                Listing(**{f.attname: getattr(obj, f.attname) for f in fields})
+                for obj in listings
+            ],
+            batch_size=batch_size,
+        )
+        for obj, parent in zip(listings, parents):
+            obj.id = obj.listing_ptr_id = parent.id
+            obj.created_at = parent.created_at
+            obj._state.adding = False
+            obj._state.db = db
+        insert_rows(connections[db], model, listings, batch_size)
+    return listings
+
+
+def insert_rows(connection, model, objs, batch_size):
+    """
+    Insert `objs` into their model's own table as they are, parent link
+    included, in multi-row INSERTs. The SQL is written out rather than going
+    through QuerySet internals, as the child half of a multi-table bulk insert
+    has no public API.
+    """
+    fields = model._meta.local_concrete_fields
+    ops = connection.ops
+    columns = ", ".join(ops.quote_name(field.column) for field in fields)
+    row = f"({', '.join(['%s'] * len(fields))})"
+    batch_size = max(min(batch_size, ops.bulk_batch_size(fields, objs)), 1)
+    with connection.cursor() as cursor:
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i : i + batch_size]
+            cursor.execute(
+                f"INSERT INTO {ops.quote_name(model._meta.db_table)} ({columns}) "
+                f"VALUES {', '.join([row] * len(batch))}",
+                [
+                    field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+                    for obj in batch
+                    for field in fields
+                ],
+            )
+
+
+def listing_fields(rng, population, now):
+    """The fields Items and Sublets share."""
+    roll = rng.random()
+    if roll < 0.1:
+        expires_at = None
+    elif roll < 0.2:
+        expires_at = now - timedelta(days=rng.uniform(0, 30))
+    else:
+        expires_at = now + timedelta(days=rng.uniform(0, 120))
+    roll = rng.random()
+    if roll < 0.02:
+        moderation_status = Listing.ModerationStatus.PENDING_REVIEW
+    elif roll < 0.025:
+        moderation_status = Listing.ModerationStatus.FLAGGED
+    else:
+        moderation_status = Listing.ModerationStatus.PUBLISHED
+    return {
+        "seller_id": rng.choices(
+            population.user_ids, cum_weights=population.seller_weights
+        )[0],
+        "negotiable": rng.random() < 0.7,
+        "expires_at": expires_at,
+        "moderation_status": moderation_status,
+    }
+
+
+def make_item(rng, population, now):
+    category = rng.choice(list(population.category_ids))
+    item_type = rng.choice(ITEM_TYPES.get(category, ["Item"]))
+    # most items are cheap, a few cost hundreds
+    price = min(max(rng.lognormvariate(3.5, 1), 1), 2000)
+    return Item(
+        **listing_fields(rng, population, now),
+        title=f"{rng.choice(ITEM_ADJECTIVES)} {item_type}",
+        description=rng.choice(ITEM_DESCRIPTIONS),
+        price=Decimal(price).quantize(Decimal("0.01")),
+        category_id=population.category_ids[category],
+        condition=rng.choices(Item.Condition.values, weights=[2, 3, 4, 1])[0],
+    )
+
+
+def make_sublet(rng, population, now):
+    (latitude, longitude), spread, streets, _ = rng.choices(
+        NEIGHBORHOODS, weights=[n[3] for n in NEIGHBORHOODS]
+    )[0]
+    beds = rng.choices([0, 1, 2, 3, 4], weights=[2, 4, 3, 2, 1])[0]
+    start_date = date.today() + timedelta(days=rng.randint(0, 180))
+    return Sublet(
+        **listing_fields(rng, population, now),
+        title=f"{rng.choice(SUBLET_ADJECTIVES)} {rng.choice(SUBLET_TYPES)}",
+        description=rng.choice(SUBLET_DESCRIPTIONS),
+        price=Decimal(max(rng.gauss(900 + 400 * beds, 200), 300)).quantize(
+            Decimal("0.01")
+        ),
+        street_address=(
+            f"{rng.randint(30, 49) * 100 + rng.randint(0, 99)} "
+            f"{rng.choice(streets)} St, Philadelphia, PA"
+        ),
+        latitude=rng.gauss(latitude, spread),
+        longitude=rng.gauss(longitude, spread),
+        beds=beds,
+        baths=rng.randint(1, max(beds, 1)),
+        start_date=start_date,
+        end_date=start_date + timedelta(days=30 * rng.randint(1, 12)),
+    )
+
+
+def draw_pairs(rng, count, popular, weights, listings, population):
+    """
+    `count` distinct (listing index, user id) pairs, listings drawn by
+    popularity and users uniformly, never a listing's seller.
+    """
+    pairs = set()
+    # redraw duplicates a few times; a small population can't fill every pick
+    for _ in range(3):
+        missing = count - len(pairs)
+        if not missing:
+            break
+        picks = rng.choices(popular, cum_weights=weights, k=missing)
+        users = rng.choices(population.user_ids, k=missing)
+        pairs.update(
+            (index, user)
+            for index, user in zip(picks, users)
+            if user != listings[index].seller_id
+        )
+    return sorted(pairs)
+
+
+def generate_chunk(
+    population, seed, kind, number, size, offers, favorites, images, batch_size
+):
+    """
+    Insert chunk `number` of the listings of `kind` ("item" or "sublet"):
+    `size` listings, with `offers`, `favorites` and `images` among them.
+    Returns how many rows were inserted, by table.
+    """
+    rng = random.Random(f"{seed}:{kind}:{number}")
+    make = make_item if kind == "item" else make_sublet
+    now = timezone.now()
+    listings = [make(rng, population, now) for _ in range(size)]
+
+    # the listing at popularity rank r gets a share of 1/r^1.1
+    popular = rng.sample(range(size), size)
+    weights = cumulative_zipf(size)
+    favorite_pairs = draw_pairs(rng, favorites, popular, weights, listings, population)
+    offer_pairs = draw_pairs(rng, offers, popular, weights, listings, population)
+    for field, pairs in (
+        ("favorite_count", favorite_pairs),
+        ("offer_count", offer_pairs),
+    ):
+        for index, count in Counter(index for index, _ in pairs).items():
+            setattr(listings[index], field, count)
+    listing_tags = [
+        (index, tag)
+        for index in range(size)
+        for tag in rng.sample(
+            population.tag_ids,
+            min(
+                rng.choices([0, 1, 2, 3], weights=[3, 4, 2, 1])[0],
+                len(population.tag_ids),
+            ),
+        )
+    ]
+    image_orders = Counter()
+    listing_images = []
+    for index in sorted(rng.choices(range(size), k=images)):
+        listing_images.append((index, image_orders[index]))
+        image_orders[index] += 1
+
+    Favorite = Listing.favorites.through
+    ListingTag = Listing.tags.through
+    with transaction.atomic():
+        bulk_create_listings(listings, batch_size)
+        Favorite.objects.bulk_create(
+            [
+                Favorite(listing_id=listings[index].id, user_id=user)
+                for index, user in favorite_pairs
+            ],
+            batch_size=batch_size,
+        )
+        Offer.objects.bulk_create(
+            [
+                Offer(
+                    listing_id=listings[index].id,
+                    user_id=user,
+                    offered_price=(
+                        listings[index].price * Decimal(rng.uniform(0.6, 1))
+                    ).quantize(Decimal("0.01")),
+                    message=rng.choice(OFFER_MESSAGES),
+                    status=rng.choices(
+                        list(OFFER_STATUSES), weights=OFFER_STATUSES.values()
+                    )[0],
+                )
+                for index, user in offer_pairs
+            ],
+            batch_size=batch_size,
+        )
+        ListingTag.objects.bulk_create(
+            [
+                ListingTag(listing_id=listings[index].id, tag_id=tag)
+                for index, tag in listing_tags
+            ],
+            batch_size=batch_size,
+        )
+        # rows only: they name placeholder files that aren't written
+        ListingImage.objects.bulk_create(
+            [
+                ListingImage(
+                    listing_id=listings[index].id,
+                    image=f"marketplace/images/generated/{seed}-{kind}-{number}-{index}-{order}.jpg",
+                    order=order,
+                )
+                for index, order in listing_images
+            ],
+            batch_size=batch_size,
+        )
+    return Counter(
+        listings=size,
+        favorites=len(favorite_pairs),
+        offers=len(offer_pairs),
+        tags=len(listing_tags),
+        images=len(listing_images),
+    )
@@ -1,26 +1,38 @@
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError as ModelValidationError
-from profanity_check import predict
+from django.utils import timezone
 from rest_framework.serializers import (
     BooleanField,
     DateTimeField,
+    DecimalField,
     ImageField,
+    IntegerField,
+    ListField,
     ModelSerializer,
+    Serializer,
     SerializerMethodField,
     SlugRelatedField,
     URLField,
     ValidationError,
 )
 
-from market.mixins import ListingTypeMixin
-from market.models import Category, Item, Listing, ListingImage, Offer, Sublet, Tag
+from market import favorites
+from market.caches import get_category
+from market.instrumentation import TimedSerializerMixin, timed
+from market.mixins import (
+    ListingTypeMixin,
+    ProfanityCheckListSerializer,
+    ProfanityCheckMixin,
+)
+from market.models import Item, Listing, ListingImage, Offer, Sublet, Tag
 
 
 User = get_user_model()
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -35,26 +47,60 @@ class UserSerializer(ModelSerializer):
         read_only_fields = fields
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Tag
         fields = ["name"]
         read_only_fields = fields
 
 
-class OfferSerializer(ModelSerializer):
+class OfferSerializer(TimedSerializerMixin, ProfanityCheckMixin, ModelSerializer):
+    profanity_fields = ["message"]
+
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Offer
-        fields = ["id", "user", "listing", "offered_price", "message", "created_at"]
-        read_only_fields = ["id", "created_at", "user"]
+        fields = [
+            "id",
+            "user",
+            "listing",
+            "offered_price",
+            "message",
+            "status",
+            "created_at",
+        ]
+        # the listing comes from the URL
+        read_only_fields = ["id", "created_at", "user", "listing", "status"]
+        list_serializer_class = ProfanityCheckListSerializer
+
+    def validate_message(self, value):
+        if self.contains_profanity(value):
+            raise ValidationError("The message contains inappropriate language.")
+        return value
 
     def create(self, validated_data):
         validated_data["user"] = self.context["request"].user
         return super().create(validated_data)
 
 
+# Request bodies for setting favorites, one at a time or in a batch
+class FavoriteSerializer(Serializer):
+    liked = BooleanField(default=True)
+
+
+class FavoritesSyncSerializer(Serializer):
+    add = ListField(child=IntegerField(), default=list, max_length=500)
+    remove = ListField(child=IntegerField(), default=list, max_length=500)
+
+    def validate(self, attrs):
+        if both := set(attrs["add"]) & set(attrs["remove"]):
+            raise ValidationError(
+                f"Listings can't be both added and removed: {sorted(both)}"
+            )
+        return attrs
+
+
 # Create/Update Image Serializer
 class ListingImageSerializer(ModelSerializer):
     image = ImageField(write_only=True, required=False, allow_null=True)
@@ -73,12 +119,15 @@ class ListingImageURLSerializer(ModelSerializer):
 
         if not image:
             return None
-        if image.url.startswith("http"):
-            return image.url
-        elif "request" in self.context:
-            return self.context["request"].build_absolute_uri(image.url)
-        else:
-            return image.url
+        # the storage builds the URL, which remote storages may sign
+        with timed("image_url_time"):
+            url = image.url
+            if url.startswith("http"):
+                return url
+            elif "request" in self.context:
+                return self.context["request"].build_absolute_uri(url)
+            else:
+                return url
 
     class Meta:
         model = ListingImage
@@ -126,8 +175,11 @@ class SubletDataSerializer(ModelSerializer):
             return float(approx_lon)
         return None
 
+
 # Unified serializer for all listing types (Items and Sublets); used for CRUD operations
-class ListingSerializer(ListingTypeMixin, ModelSerializer):
+class ListingSerializer(
+    TimedSerializerMixin, ProfanityCheckMixin, ListingTypeMixin, ModelSerializer
+):
     LISTING_TYPE_CONFIG = {
         "item": {
             "required_fields": ["condition", "category"],
@@ -145,6 +197,8 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
         },
     }
 
+    profanity_fields = ["title", "description"]
+
     images = ListingImageSerializer(many=True, required=False, read_only=True)
     tags = SlugRelatedField(
         many=True,
@@ -180,6 +234,7 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
             "listing_type",
             "additional_data",
             "is_favorited",
+            "moderation_status",
         ]
         read_only_fields = [
             "id",
@@ -188,7 +243,9 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
             "buyers",
             "images",
             "favorites",
+            "moderation_status",
         ]
+        list_serializer_class = ProfanityCheckListSerializer
 
     def validate(self, attrs):
         if not self.instance:
@@ -225,23 +282,39 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
         request = self.context.get("request")
         if not request or not request.user or not request.user.is_authenticated:
             return False
-        return request.user.listings_favorited.filter(id=obj.id).exists()
+        return favorites.is_favorited(request.user.id, obj.id)
+
+    @property
+    def defer_profanity_check(self):
+        return settings.MODERATION_MODE == "async"
 
     def validate_title(self, value):
-        if self.contains_profanity(value):
+        if not self.defer_profanity_check and self.contains_profanity(value):
             raise ValidationError("The title contains inappropriate language.")
         return value
 
     def validate_description(self, value):
-        if self.contains_profanity(value):
+        if not self.defer_profanity_check and self.contains_profanity(value):
             raise ValidationError("The description contains inappropriate language.")
         return value
 
-    def contains_profanity(self, text):
-        return predict([text])[0]
+    def needs_moderation(self, validated_data, instance=None):
+        if not self.defer_profanity_check:
+            return False
+        return any(
+            field in validated_data
+            and (instance is None or validated_data[field] != getattr(instance, field))
+            for field in self.profanity_fields
+        )
+
+    def request_moderation(self, validated_data):
+        validated_data["moderation_status"] = Listing.ModerationStatus.PENDING_REVIEW
+        validated_data["moderation_requested_at"] = timezone.now()
 
     def create(self, validated_data):
         validated_data["seller"] = self.context["request"].user
+        if self.needs_moderation(validated_data):
+            self.request_moderation(validated_data)
 
         listing_type = self.initial_data.get("listing_type")
         additional_data = self.initial_data.get("additional_data", {})
@@ -262,7 +335,7 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
 
     def _create_item(self, validated_data, additional_data):
         category_name = additional_data.get("category")
-        category = Category.objects.filter(name=category_name).first()
+        category = get_category(category_name)
         if not category:
             raise ValidationError(
                 {
@@ -291,7 +364,6 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
         latitude = additional_data.get("latitude")
         longitude = additional_data.get("longitude")
 
-
         if latitude is not None:
             latitude = float(latitude)
         if longitude is not None:
@@ -319,6 +391,8 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
 
         try:
             tags = validated_data.pop("tags", None)
+            if self.needs_moderation(validated_data, instance):
+                self.request_moderation(validated_data)
             for attr, value in validated_data.items():
                 setattr(instance, attr, value)
             if tags:
@@ -349,7 +423,7 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
             item.condition = additional_data["condition"]
 
         if "category" in additional_data:
-            category = Category.objects.filter(name=additional_data["category"]).first()
+            category = get_category(additional_data["category"])
             if category:
                 item.category = category
         item.full_clean()
@@ -372,9 +446,8 @@ class ListingSerializer(ListingTypeMixin, ModelSerializer):
 
 
 # Read-only serializer for use when reading a single listing
-class ListingSerializerPublic(ListingTypeMixin, ModelSerializer):
-    buyer_count = SerializerMethodField()
-    favorite_count = SerializerMethodField()
+class ListingSerializerPublic(TimedSerializerMixin, ListingTypeMixin, ModelSerializer):
+    buyer_count = IntegerField(source="offer_count", read_only=True)
     is_favorited = SerializerMethodField()
     tags = SlugRelatedField(many=True, slug_field="name", queryset=Tag.objects.all())
     images = ListingImageURLSerializer(many=True)
@@ -403,22 +476,15 @@ class ListingSerializerPublic(ListingTypeMixin, ModelSerializer):
         ]
         read_only_fields = fields
 
-    def get_buyer_count(self, obj):
-        return obj.buyers.count()
-
-    def get_favorite_count(self, obj):
-        return obj.favorites.count()
-
     def get_is_favorited(self, obj):
         request = self.context.get("request")
         if not request or not request.user or not request.user.is_authenticated:
             return False
-        return request.user.listings_favorited.filter(id=obj.id).exists()
+        return favorites.is_favorited(request.user.id, obj.id)
 
 
 # Read-only serializer for use when pulling all listings /etc
-class ListingSerializerList(ListingTypeMixin, ModelSerializer):
-    favorite_count = SerializerMethodField()
+class ListingSerializerList(TimedSerializerMixin, ListingTypeMixin, ModelSerializer):
     tags = SlugRelatedField(many=True, slug_field="name", queryset=Tag.objects.all())
     images = ListingImageURLSerializer(many=True)
     seller = UserSerializer(read_only=True)
@@ -441,5 +507,28 @@ class ListingSerializerList(ListingTypeMixin, ModelSerializer):
         ]
         read_only_fields = fields
 
-    def get_favorite_count(self, obj):
-        return obj.favorites.count()
+
+# Read-only serializer for a seller's per-listing offer statistics
+class ListingOfferStatsSerializer(TimedSerializerMixin, ModelSerializer):
+    offer_count = IntegerField(read_only=True)
+    highest_offer = DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    lowest_offer = DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    average_offer = DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    latest_offer_at = DateTimeField(read_only=True)
+    top_offers = OfferSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Listing
+        fields = [
+            "id",
+            "title",
+            "price",
+            "expires_at",
+            "offer_count",
+            "highest_offer",
+            "lowest_offer",
+            "average_offer",
+            "latest_offer_at",
+            "top_offers",
+        ]
+        read_only_fields = fields
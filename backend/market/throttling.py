@@ -0,0 +1,147 @@
+import logging
+import re
+import uuid
+
+import phonenumbers
+from redis.exceptions import RedisError
+from rest_framework.throttling import SimpleRateThrottle
+
+from market.caches import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Sliding-window log: one sorted-set member per request, scored by its time in
+# ms. Drops entries older than the window, then admits the request if fewer
+# than the limit remain. Returns {1, 0} if allowed, else {0, ms until the
+# oldest request leaves the window}.
+# KEYS: the log. ARGV: now (ms), window (ms), limit, unique member
+SLIDING_WINDOW_SCRIPT = """
+local now, window, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - window)
+if redis.call("ZCARD", KEYS[1]) < limit then
+    redis.call("ZADD", KEYS[1], now, ARGV[4])
+    redis.call("PEXPIRE", KEYS[1], window)
+    return {1, 0}
+end
+local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+return {0, tonumber(oldest[2]) + window - now}
+"""
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Allows at most `num_requests` in any window of `duration` seconds, checked
+    and recorded in one atomic Redis script so concurrent workers can't race
+    past the limit.
+
+    Without a Redis default cache this behaves like DRF's cache-based throttle;
+    if Redis is configured but unreachable, requests are let through.
+
+    Rates take an optional multiplier on the period, e.g. "3/10m".
+    """
+
+    def parse_rate(self, rate):
+        if rate is None:
+            return (None, None)
+        num, period = rate.split("/")
+        multiple, unit = re.match(r"(\d*)([smhd])", period).groups()
+        duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[unit]
+        return (int(num), int(multiple or 1) * duration)
+
+    def allow_request(self, request, view):
+        self.redis_wait = None
+        if self.rate is None:
+            return True
+
+        client = get_redis()
+        if client is None:
+            return super().allow_request(request, view)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        try:
+            allowed, wait_ms = client.eval(
+                SLIDING_WINDOW_SCRIPT,
+                1,
+                self.key,
+                int(self.timer() * 1000),
+                self.duration * 1000,
+                self.num_requests,
+                uuid.uuid4().hex,
+            )
+        except RedisError:
+            logger.warning("Redis unavailable, not throttling", exc_info=True)
+            return True
+
+        if not allowed:
+            self.redis_wait = wait_ms / 1000
+        return bool(allowed)
+
+    def wait(self):
+        if self.redis_wait is not None:
+            return self.redis_wait
+        return super().wait()
+
+
+class UserSlidingWindowThrottle(SlidingWindowThrottle):
+    """Limits each user, or each IP address for anonymous requests."""
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+def normalize_phone_number(value):
+    """
+    `value` in E.164 form, so that writing one number differently (with or
+    without its country code, spaces or dashes) can't give it a fresh limit.
+    Numbers without a country code are taken to be American.
+    """
+    try:
+        number = phonenumbers.parse(str(value), "US")
+    except phonenumbers.NumberParseException:
+        # not a phone number, but still limited
+        return re.sub(r"[^\d+]", "", str(value))
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+class PhoneNumberSlidingWindowThrottle(SlidingWindowThrottle):
+    """Limits each phone number in the request body, across all users."""
+
+    def get_cache_key(self, request, view):
+        phone_number = request.data.get("phone_number")
+        if not phone_number:
+            # the view rejects the request
+            return None
+        ident = normalize_phone_number(phone_number)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class SendCodeUserThrottle(UserSlidingWindowThrottle):
+    scope = "send_code_user"
+
+
+class SendCodePhoneThrottle(PhoneNumberSlidingWindowThrottle):
+    scope = "send_code_phone"
+
+
+class VerifyCodeUserThrottle(UserSlidingWindowThrottle):
+    scope = "verify_code_user"
+
+
+class VerifyCodePhoneThrottle(PhoneNumberSlidingWindowThrottle):
+    scope = "verify_code_phone"
+
+
+class OfferCreateThrottle(UserSlidingWindowThrottle):
+    scope = "offer_create"
+
+
+class ListingCreateThrottle(UserSlidingWindowThrottle):
+    scope = "listing_create"
@@ -1,19 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework import routers
 
+from market import async_views
 from market.views import (
     CreateImages,
     DeleteImage,
     Favorites,
     Listings,
     Offers,
+    OffersDashboard,
     OffersMade,
     OffersReceived,
     Tags,
     UserFavorites,
     get_current_user,
+    get_db_pool_stats,
     get_phone_status,
     send_verification_code,
+    sync_favorites,
     verify_phone_code,
 )
 
@@ -30,16 +35,21 @@ additional_urls = [
     path("tags/", Tags.as_view(), name="tags"),
     # All favorites for user
     path("favorites/", UserFavorites.as_view(), name="user-favorites"),
+    # Apply a batch of favorite adds and removes
+    path("favorites/sync/", sync_favorites, name="sync-favorites"),
     # All offers made by user
     path("offers/made/", OffersMade.as_view(), name="offers-made"),
     # All offers for an listing owned by user
     path("offers/received/", OffersReceived.as_view(), name="offers-received"),
+    # Offer statistics for each listing owned by user
+    path("offers/dashboard/", OffersDashboard.as_view(), name="offers-dashboard"),
     # Favorites
     # post: add a listing to the user's favorites
+    # put: set whether the listing is favorited (idempotent)
     # delete: remove a listing from the user's favorites
     path(
         "listings/<listing_id>/favorites/",
-        Favorites.as_view({"post": "create", "delete": "destroy"}),
+        Favorites.as_view({"post": "create", "put": "update", "delete": "destroy"}),
     ),
     # Offers
     # get: list all offers for an listing
@@ -49,6 +59,21 @@ additional_urls = [
         "listings/<listing_id>/offers/",
         Offers.as_view({"get": "list", "post": "create", "delete": "destroy"}),
     ),
+    # Offer responses
+    # accept/decline: seller responds to a pending offer
+    # withdraw: buyer withdraws their pending offer
+    path(
+        "listings/<listing_id>/offers/<offer_id>/accept/",
+        Offers.as_view({"post": "accept"}),
+    ),
+    path(
+        "listings/<listing_id>/offers/<offer_id>/decline/",
+        Offers.as_view({"post": "decline"}),
+    ),
+    path(
+        "listings/<listing_id>/offers/<offer_id>/withdraw/",
+        Offers.as_view({"post": "withdraw"}),
+    ),
     # Image Creation
     path("listings/<listing_id>/images/", CreateImages.as_view()),
     # Image Deletion
@@ -57,6 +82,54 @@ additional_urls = [
     path("phone/status/", get_phone_status, name="phone-status"),
     path("phone/send-code/", send_verification_code, name="send-verification-code"),
     path("phone/verify-code/", verify_phone_code, name="verify-phone-code"),
+    # Connection pool usage of the worker that answers (superusers only)
+    path("metrics/db-pool/", get_db_pool_stats, name="db-pool-stats"),
+]
+
+# Under uvicorn (ASYNC_VIEWS), GETs to these endpoints go to native async views
+# and other methods to the same DRF views as above
+async_read_urls = [
+    path(
+        "listings/",
+        async_views.with_async_reads(
+            Listings.as_view({"get": "list", "post": "create"}), async_views.listings
+        ),
+        name="listings-list",
+    ),
+    path(
+        "listings/<pk>/",
+        async_views.with_async_reads(
+            Listings.as_view(
+                {
+                    "get": "retrieve",
+                    "put": "update",
+                    "patch": "partial_update",
+                    "delete": "destroy",
+                }
+            ),
+            async_views.listing,
+        ),
+        name="listings-detail",
+    ),
+    path(
+        "user/me/",
+        async_views.with_async_reads(get_current_user, async_views.current_user),
+        name="current-user",
+    ),
+    path(
+        "tags/",
+        async_views.with_async_reads(Tags.as_view(), async_views.tags),
+        name="tags",
+    ),
+    path(
+        "favorites/",
+        async_views.with_async_reads(
+            UserFavorites.as_view(), async_views.user_favorites
+        ),
+        name="user-favorites",
+    ),
 ]
 
 urlpatterns = router.urls + additional_urls
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_read_urls + urlpatterns
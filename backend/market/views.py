@@ -1,10 +1,18 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, HttpResponseForbidden
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import exceptions, mixins, status, viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.generics import (
     CreateAPIView,
     DestroyAPIView,
@@ -15,9 +23,16 @@ from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from market.mixins import DefaultOrderMixin
-from market.models import Listing, ListingImage, Offer, Tag
-from market.pagination import PageSizeOffsetPagination
+from market import favorites
+from market.caches import get_tags
+from market.instrumentation import QueueDepthCollector, query_budget
+from market.mixins import (
+    DefaultOrderMixin,
+    ListingOrderingMixin,
+    OfferStatusFilterMixin,
+)
+from market.models import Listing, ListingImage, Offer, OutboundSMS
+from market.pagination import ListingCursorPagination, PageSizeOffsetPagination
 from market.permissions import (
     IsSuperUser,
     ListingImageOwnerPermission,
@@ -25,8 +40,11 @@ from market.permissions import (
     OfferOwnerPermission,
 )
 from market.serializers import (
+    FavoriteSerializer,
+    FavoritesSyncSerializer,
     ListingImageSerializer,
     ListingImageURLSerializer,
+    ListingOfferStatsSerializer,
     ListingSerializer,
     ListingSerializerList,
     ListingSerializerPublic,
@@ -34,52 +52,142 @@ from market.serializers import (
     TagSerializer,
     UserSerializer,
 )
-from utils.sms import generate_verification_code, send_verification_sms
+from market.throttling import (
+    ListingCreateThrottle,
+    OfferCreateThrottle,
+    SendCodePhoneThrottle,
+    SendCodeUserThrottle,
+    VerifyCodePhoneThrottle,
+    VerifyCodeUserThrottle,
+)
+from utils import metrics
+from utils.postgres_pool import pool_stats
+from utils.sms import generate_verification_code, verification_message
 
 
 User = get_user_model()
 
 
+def listings_with_related():
+    """Listings with everything the listing serializers read fetched up front."""
+    return Listing.objects.select_related(
+        "seller", "item__category", "sublet"
+    ).prefetch_related("tags", "images")
+
+
 class Tags(ListAPIView, DefaultOrderMixin):
     serializer_class = TagSerializer
     pagination_class = PageSizeOffsetPagination
+    query_budget = 3
 
     def get_queryset(self):
-        return Tag.objects.all()
+        return get_tags()
 
 
 class UserFavorites(ListAPIView, DefaultOrderMixin):
     serializer_class = ListingSerializerList
     permission_classes = [IsAuthenticated]
     pagination_class = PageSizeOffsetPagination
+    query_budget = 7
 
     def get_queryset(self):
-        user = self.request.user
-        return user.listings_favorited.all()
+        return listings_with_related().filter(
+            id__in=favorites.listing_ids(self.request.user.id)
+        )
 
 
-# TODO: Can add feature to filter for active offers only
-class OffersMade(ListAPIView, DefaultOrderMixin):
+class OffersMade(ListAPIView, OfferStatusFilterMixin, DefaultOrderMixin):
     serializer_class = OfferSerializer
     permission_classes = [IsAuthenticated | IsSuperUser]
     pagination_class = PageSizeOffsetPagination
+    query_budget = 4
 
     def get_queryset(self):
         user = self.request.user
-        return Offer.objects.filter(user=user)
+        return self.filter_status(
+            Offer.objects.filter(user=user).select_related("user")
+        )
 
 
-class OffersReceived(ListAPIView, DefaultOrderMixin):
+class OffersReceived(ListAPIView, OfferStatusFilterMixin, DefaultOrderMixin):
     serializer_class = OfferSerializer
     permission_classes = [IsAuthenticated | IsSuperUser]
     pagination_class = PageSizeOffsetPagination
+    query_budget = 4
 
     def get_queryset(self):
         user = self.request.user
-        return Offer.objects.filter(listing__seller=user)
+        return self.filter_status(
+            Offer.objects.filter(listing__seller=user).select_related("user")
+        )
+
+
+class OffersDashboard(ListAPIView):
+    """
+    Offer statistics for each of the user's listings, newest listing first:
+    offer count, highest/lowest/average offer, latest offer time and the `top`
+    highest offers (default 3, max 10). Runs two queries per page regardless
+    of the number of listings or offers.
+    """
 
+    serializer_class = ListingOfferStatsSerializer
+    permission_classes = [IsAuthenticated | IsSuperUser]
+    pagination_class = ListingCursorPagination
+    query_budget = 4
+
+    default_top = 3
+    max_top = 10
+
+    def get_queryset(self):
+        return (
+            Listing.objects.filter(seller=self.request.user)
+            .only("id", "title", "price", "expires_at", "offer_count")
+            .annotate(
+                highest_offer=Max("offers_received__offered_price"),
+                lowest_offer=Min("offers_received__offered_price"),
+                average_offer=Avg("offers_received__offered_price"),
+                latest_offer_at=Max("offers_received__created_at"),
+            )
+        )
+
+    def get_top(self):
+        try:
+            top = int(self.request.query_params.get("top", self.default_top))
+        except ValueError:
+            raise exceptions.ValidationError({"top": "Must be an integer."})
+        return max(0, min(top, self.max_top))
 
-class Listings(viewsets.ModelViewSet, DefaultOrderMixin):
+    def list(self, request, *args, **kwargs):
+        # before paginating, so a bad ?top= doesn't cost the aggregate query
+        top = self.get_top()
+        listings = self.paginate_queryset(self.get_queryset())
+
+        top_offers = {listing.id: [] for listing in listings}
+        if top and listings:
+            ranked = (
+                Offer.objects.filter(listing_id__in=top_offers)
+                .annotate(
+                    rank=Window(
+                        RowNumber(),
+                        partition_by=[F("listing_id")],
+                        order_by=[F("offered_price").desc(), F("created_at").asc()],
+                    )
+                )
+                .filter(rank__lte=top)
+                .select_related("user")
+                .order_by("listing_id", "rank")
+            )
+            for offer in ranked:
+                top_offers[offer.listing_id].append(offer)
+
+        for listing in listings:
+            listing.top_offers = top_offers[listing.id]
+
+        serializer = self.get_serializer(listings, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class Listings(viewsets.ModelViewSet, DefaultOrderMixin, ListingOrderingMixin):
     """
     list:
     Returns a list of Listings that match query parameters.
@@ -98,11 +206,23 @@ class Listings(viewsets.ModelViewSet, DefaultOrderMixin):
     permission_classes = [ListingOwnerPermission | IsSuperUser]
     serializer_class = ListingSerializer
     pagination_class = PageSizeOffsetPagination
+    query_budget = {"list": 6, "retrieve": 7}
 
     def get_queryset(self):
-        return Listing.objects.select_related("item", "sublet").prefetch_related(
-            "tags", "images"
-        )
+        queryset = listings_with_related()
+        if self.action == "retrieve" and not self.request.user.is_superuser:
+            # Listings held for review (or flagged) are only visible to their
+            # seller; the list endpoint hides them in filter_listings
+            queryset = queryset.filter(
+                Q(moderation_status=Listing.ModerationStatus.PUBLISHED)
+                | Q(seller=self.request.user)
+            )
+        return queryset
+
+    def get_throttles(self):
+        if self.action == "create":
+            return [ListingCreateThrottle()]
+        return super().get_throttles()
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -144,7 +264,19 @@ class Listings(viewsets.ModelViewSet, DefaultOrderMixin):
         Returns a list of Listings that match query parameters.
         Supports filtering by type and type-specific fields.
         """
-        queryset = self.get_queryset()
+        queryset = self.filter_listings(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def filter_listings(self, queryset):
+        """Apply the list query parameters (filters and ordering)."""
+        request = self.request
 
         listing_type = request.query_params.get("type", "").lower()
         if listing_type == "item":
@@ -169,19 +301,14 @@ class Listings(viewsets.ModelViewSet, DefaultOrderMixin):
         if request.query_params.get("seller", "false").lower() == "true":
             queryset = queryset.filter(seller=request.user)
         else:
-            # Show listings that are not expired, or have no expiration
+            # Show published listings that are not expired, or have no expiration
             now = timezone.now()
             queryset = queryset.filter(
-                Q(expires_at__gte=now) | Q(expires_at__isnull=True)
+                Q(expires_at__gte=now) | Q(expires_at__isnull=True),
+                moderation_status=Listing.ModerationStatus.PUBLISHED,
             )
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.order_listings(queryset)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -249,7 +376,7 @@ class Favorites(
     mixins.DestroyModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet
 ):
     serializer_class = ListingSerializer
-    http_method_names = ["post", "delete"]
+    http_method_names = ["post", "put", "delete"]
     permission_classes = [IsAuthenticated | IsSuperUser]
     pagination_class = PageSizeOffsetPagination
 
@@ -257,29 +384,39 @@ class Favorites(
         user = self.request.user
         return user.listings_favorited.all()
 
-    def create(self, request, *args, **kwargs):
+    def get_listing_id(self):
         listing_id = int(self.kwargs["listing_id"])
-        favorites = request.user.listings_favorited
-        if favorites.filter(id=listing_id).exists():
+        if not Listing.objects.filter(id=listing_id).exists():
+            raise exceptions.NotFound("No Listing matches the given query.")
+        return listing_id
+
+    def update(self, request, *args, **kwargs):
+        """Set whether the listing is favorited, whatever its current state."""
+        serializer = FavoriteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        liked = serializer.validated_data["liked"]
+        listing_ids = [self.get_listing_id()]
+        _, version = favorites.update(
+            request.user.id,
+            add=listing_ids if liked else [],
+            remove=[] if liked else listing_ids,
+        )
+        return Response({"liked": liked, "version": version})
+
+    def create(self, request, *args, **kwargs):
+        if not favorites.add(request.user.id, self.get_listing_id()):
             return Response(
                 {"liked": True, "detail": "User has already liked the listing"},
                 status=status.HTTP_409_CONFLICT,
             )
-        listing = get_object_or_404(Listing, id=listing_id)
-        favorites.add(listing)
         return Response({"liked": True}, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
-        listing_id = int(self.kwargs["listing_id"])
-        listing = get_object_or_404(Listing, id=listing_id)
-
-        if listing not in request.user.listings_favorited.all():
+        if not favorites.remove(request.user.id, self.get_listing_id()):
             return Response(
                 {"liked": False, "detail": "User hasn't liked the listing yet"},
                 status=status.HTTP_404_NOT_FOUND,
             )
-
-        request.user.listings_favorited.remove(listing)
         return Response({"liked": False}, status=status.HTTP_200_OK)
 
 
@@ -294,11 +431,23 @@ class Offers(viewsets.ModelViewSet):
 
     destroy:
     Delete the offer between the user and the listing matching the ID.
+
+    accept / decline:
+    The seller responds to a pending offer on their listing.
+
+    withdraw:
+    The buyer withdraws their pending offer.
     """
 
     permission_classes = [OfferOwnerPermission | IsSuperUser]
     serializer_class = OfferSerializer
     pagination_class = PageSizeOffsetPagination
+    query_budget = {"list": 5}
+
+    def get_throttles(self):
+        if self.action == "create":
+            return [OfferCreateThrottle()]
+        return super().get_throttles()
 
     def get_queryset(self):
         if Listing.objects.filter(pk=int(self.kwargs["listing_id"])).exists():
@@ -313,14 +462,30 @@ class Offers(viewsets.ModelViewSet):
             raise exceptions.ValidationError(
                 "You must verify your phone number before making an offer"
             )
-        data = request.data.copy()
-        if self.get_queryset().filter(user=self.request.user).exists():
-            raise exceptions.ValidationError("Offer already exists")
-        data["listing"] = int(self.kwargs["listing_id"])
-        data["user"] = self.request.user.id
-        serializer = self.get_serializer(data=data)
+        listing_id = int(self.kwargs["listing_id"])
+
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        try:
+            # Rely on the unique_offer_market constraint rather than checking
+            # first, so concurrent submits can't both get through. Foreign keys
+            # are checked at commit, so the counter update is what finds a
+            # missing listing.
+            with transaction.atomic():
+                serializer.save(listing_id=listing_id)
+                if not Listing.adjust_count(listing_id, "offer_count", 1):
+                    raise exceptions.NotFound("No Listing matches the given query")
+        except IntegrityError:
+            if not Offer.objects.filter(
+                user=request.user,
+                listing_id=listing_id,
+                status__in=Offer.ACTIVE_STATUSES,
+            ).exists():
+                # the listing was deleted mid-request
+                raise exceptions.NotFound("No Listing matches the given query")
+            return Response(
+                {"detail": "Offer already exists"}, status=status.HTTP_409_CONFLICT
+            )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
@@ -329,21 +494,98 @@ class Offers(viewsets.ModelViewSet):
             "user": self.request.user,
             "listing": int(self.kwargs["listing_id"]),
         }
-        obj = get_object_or_404(queryset, **filter)
+        # the buyer's latest offer: their live one, if they have one
+        queryset = queryset.filter(**filter).order_by("-created_at", "-id")
+        obj = get_object_or_404(queryset[:1])
         self.check_object_permissions(self.request, obj)
-        self.perform_destroy(obj)
+        with transaction.atomic():
+            self.perform_destroy(obj)
+            Listing.adjust_count(obj.listing_id, "offer_count", -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def accept(self, request, *args, **kwargs):
+        return self.transition(request, Offer.Status.ACCEPTED)
+
+    def decline(self, request, *args, **kwargs):
+        return self.transition(request, Offer.Status.DECLINED)
+
+    def withdraw(self, request, *args, **kwargs):
+        return self.transition(request, Offer.Status.WITHDRAWN)
+
+    def transition(self, request, new_status):
+        queryset = Offer.objects.select_related("user", "listing")
+        filter = {
+            "id": self.kwargs["offer_id"],
+            "listing": int(self.kwargs["listing_id"]),
+        }
+        offer = get_object_or_404(queryset, **filter)
+        self.check_object_permissions(request, offer)
+
+        # Only pending offers can change state; the conditional update keeps
+        # concurrent responses from overwriting each other
+        pending = Offer.objects.filter(id=offer.id, status=Offer.Status.PENDING)
+        if not pending.update(status=new_status):
+            offer.refresh_from_db(fields=["status"])
+            return Response(
+                {"detail": f"Offer is already {offer.status.lower()}."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        offer.status = new_status
+        return Response(self.get_serializer(offer).data)
+
     def list(self, request, *args, **kwargs):
-        if not Listing.objects.filter(pk=int(self.kwargs["listing_id"])).exists():
+        try:
+            listing = Listing.objects.only("id", "seller_id").get(
+                pk=int(self.kwargs["listing_id"])
+            )
+        except Listing.DoesNotExist:
             raise exceptions.NotFound("No Listing matches the given query")
-        for offer in self.get_queryset():
-            self.check_object_permissions(request, offer)
-        return super().list(request, *args, **kwargs)
+
+        # Every offer on a listing shares the same permission rule (only the
+        # seller can see them), so check it once against the listing
+        self.check_object_permissions(request, Offer(listing=listing))
+
+        queryset = (
+            Offer.objects.filter(listing=listing)
+            .select_related("user")
+            .order_by("created_at")
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+def sync_favorites(request):
+    """
+    Apply a batch of favorites made offline in one go. Listings that no longer
+    exist are skipped. Returns the resulting favorites and their version.
+    """
+    serializer = FavoritesSyncSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    add = serializer.validated_data["add"]
+    remove = serializer.validated_data["remove"]
+    if add:
+        add = list(Listing.objects.filter(id__in=add).values_list("id", flat=True))
+
+    _, version = favorites.update(request.user.id, add=add, remove=remove)
+    return Response(
+        {
+            "favorites": sorted(favorites.listing_ids(request.user.id)),
+            "version": version,
+        }
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([SendCodeUserThrottle, SendCodePhoneThrottle])
 def send_verification_code(request):
     phone_number = request.data.get("phone_number")
 
@@ -359,16 +601,19 @@ def send_verification_code(request):
     timeout = settings.PHONE_VERIFICATION_CODE_EXPIRY_MINUTES * 60
     cache.set(cache_key, code, timeout=timeout)
 
-    try:
-        send_verification_sms(phone_number, code)
-    except Exception as e:
-        raise exceptions.APIException(f"Failed to send SMS: {str(e)}") from e
+    # delivered by `manage.py send_sms`, so a slow provider can't hold this worker
+    OutboundSMS.objects.create(
+        to=phone_number,
+        body=verification_message(code),
+        expires_at=timezone.now() + timedelta(seconds=timeout),
+    )
 
     return Response({"success": True, "message": "Verification code sent"})
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([VerifyCodeUserThrottle, VerifyCodePhoneThrottle])
 def verify_phone_code(request):
     phone_number = request.data.get("phone_number")
     code = request.data.get("code")
@@ -386,7 +631,10 @@ def verify_phone_code(request):
     request.user.phone_number = phone_number
     request.user.phone_verified = True
     request.user.phone_verified_at = timezone.now()
-    request.user.save()
+    # only these: the rest of a cached user may be stale
+    request.user.save(
+        update_fields=["phone_number", "phone_verified", "phone_verified_at"]
+    )
 
     cache.delete(cache_key)
 
@@ -399,6 +647,7 @@ def verify_phone_code(request):
     )
 
 
+@query_budget(2)
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_current_user(request):
@@ -406,6 +655,7 @@ def get_current_user(request):
     return Response(UserSerializer(request.user).data)
 
 
+@query_budget(2)
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_phone_status(request):
@@ -416,3 +666,28 @@ def get_phone_status(request):
             "phone_verified": user.phone_verified,
         }
     )
+
+
+@query_budget(2)
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def get_db_pool_stats(request):
+    """Database connection pool usage in the process that serves the request"""
+    return Response(pool_stats())
+
+
+@require_GET
+def get_metrics(request):
+    """
+    Prometheus metrics, for scrapers sending the METRICS_TOKEN as a Bearer
+    token, and superusers
+    """
+    token = settings.METRICS_TOKEN
+    is_scraper = token and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not is_scraper and not request.user.is_superuser:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render([QueueDepthCollector()]), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,66 @@
+import gc
+import logging
+
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+
+from market import caches
+from utils import moderation
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """
+    Load everything a worker needs before serving its first request: the URLconf
+    (and with it the views and serializers), the profanity model and the
+    reference-data caches.
+
+    Meant to run once in the WSGI master process before it forks workers, so the
+    loaded objects are shared copy-on-write. Database connections are opened to
+    prime the caches but closed again afterwards, pools included: a socket
+    inherited across fork() would be shared by every worker.
+    """
+    get_resolver().url_patterns
+    moderation.load_model()(["warm up"])
+
+    try:
+        open_connections()
+        caches.prime()
+    except DatabaseError:
+        # workers fill the caches lazily instead
+        logger.warning("Could not prime reference caches", exc_info=True)
+    finally:
+        close_connections()
+
+    register_postfork()
+
+    # Move everything allocated so far out of the garbage collector's reach so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.freeze()
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def close_connections():
+    connections.close_all()
+    for connection in connections.all():
+        # With DATABASE_POOL=psycopg, closing only hands the connection back to
+        # the process's pool, whose sockets and threads must not be forked
+        # either. Each worker creates its own pool on first use.
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
+
+
+def register_postfork():
+    """Have each uWSGI worker open its database connections as soon as it forks."""
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        # not running under uWSGI
+        return
+    postfork(open_connections)
@@ -1,30 +1,110 @@
+import base64
 import datetime
 import json
-from unittest.mock import MagicMock
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from io import StringIO
+from unittest import skipIf
+from unittest.mock import MagicMock, patch
 
 import pytz
+import redis
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends import cache as cache_session
+from django.contrib.sessions.backends import db as db_session
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
 from django.core.files.storage import Storage
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import (
+    LiveServerTestCase,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
 from django.utils.timezone import now
 from rest_framework.test import APIClient
 
+from market import authentication, favorites, instrumentation, profiling
+from market import caches as market_caches
+from market import urls as market_urls
+from market.backends import CachedLabsUserBackend
+from market.caches import get_redis
+from market.management.commands.profile_imports import parse_importtime
 from market.models import (
     Category,
     Item,
     Listing,
     ListingImage,
     Offer,
+    OutboundSMS,
     Sublet,
     Tag,
 )
+from market.recording import shape_key
+from market.seeding import bulk_create_listings
+from market.serializers import ListingSerializer, OfferSerializer
+from market.throttling import SlidingWindowThrottle
+from market.views import Tags
+from market.warmup import warm_up
+from utils import metrics, moderation, postgres_pool, replicas, sms
 
 
 User = get_user_model()
 
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+
+def redis_caches(location):
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": location,
+            "OPTIONS": {"SOCKET_CONNECT_TIMEOUT": 0.5},
+        },
+        "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+
+
+def reset_throttles():
+    """Throttle history lives in the cache or Redis and outlives the test DB."""
+    if client := get_redis():
+        try:
+            for key in client.scan_iter(match="*throttle_*"):
+                client.delete(key)
+        except redis.RedisError:
+            # tests pointing at a Redis that is down aren't throttled
+            pass
+    else:
+        caches["default"].clear()
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5).ping()
+    except redis.RedisError:
+        return False
+
 
 class BaseMarketTest(TestCase):
     def setUp(self):
+        # reference data is cached per process; bulk_create doesn't invalidate it
+        caches["local"].clear()
+        reset_throttles()
         self.client = APIClient()
         self.tags = self.load_tags()
         self.categories = self.load_categories()
@@ -290,6 +370,7 @@ class TestItemGet(BaseMarketTest):
             "id": 1,
             "seller": 1,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["Used", "Textbook"],
             "favorites": [],
             "title": "Math Textbook",
@@ -368,6 +449,7 @@ class TestItemPost(BaseMarketTest):
             "id": int(f"{response.json()['id']}"),
             "seller": 1,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["New"],
             "favorites": [],
             "title": "Math Textbook",
@@ -428,6 +510,7 @@ class TestItemPost(BaseMarketTest):
             "id": int(f"{response.json()['id']}"),
             "seller": 1,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["New"],
             "favorites": [],
             "title": "Math Textbook",
@@ -569,6 +652,7 @@ class TestItemPatch(BaseMarketTest):
             "id": self.items[0].id,
             "seller": self.users[0].id,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["Used", "Textbook"],
             "favorites": [],
             "title": "Physics Textbook",
@@ -637,6 +721,7 @@ class TestItemPatch(BaseMarketTest):
             "id": self.items[0].id,
             "seller": self.users[0].id,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["New"],
             "favorites": [],
             "title": "5 meal swipes",
@@ -825,6 +910,7 @@ class TestSubletGet(BaseMarketTest):
             "id": self.sublets[0].id,
             "seller": self.users[0].id,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["New"],
             "favorites": [],
             "title": "Cira Green Sublet",
@@ -949,6 +1035,7 @@ class TestSubletPost(BaseMarketTest):
             "expires_at": "3000-12-12T00:00:00-05:00",
             "seller": self.users[0].id,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["New"],
             "favorites": [],
             "listing_type": "sublet",
@@ -1033,6 +1120,7 @@ class TestSubletPatchDelete(BaseMarketTest):
             "id": int(self.sublets[0].id),
             "seller": 1,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["Used", "Apartment"],
             "favorites": [],
             "title": "Cira Green Sublet 2",
@@ -1362,8 +1450,8 @@ class TestOffer(BaseMarketTest):
             payload,
             format="json",
         )
-        expected_response = ["Offer already exists"]
-        self.assertEqual(response.status_code, 400)
+        expected_response = {"detail": "Offer already exists"}
+        self.assertEqual(response.status_code, 409)
         self.assertEqual(response.json(), expected_response)
 
     def test_delete_offer(self):
@@ -1395,6 +1483,7 @@ class TestFavorites(BaseMarketTest):
             "id": self.items[0].id,
             "seller": self.users[0].id,
             "buyers": [],
+            "moderation_status": "PUBLISHED",
             "tags": ["Used", "Textbook"],
             "favorites": [self.users[1].id],
             "title": "Math Textbook",
@@ -1542,3 +1631,1852 @@ class TestImages(BaseMarketTest):
                     ListingImage.objects.filter(id=saved_images[1]["id"]).exists()
                 )
                 self.assertEqual(1, ListingImage.objects.all().count())
+
+
+class TestModeration(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        moderation.get_cache().clear()
+        self.predict = MagicMock(side_effect=lambda texts: [0] * len(texts))
+        patcher = patch("utils.moderation.load_model", return_value=self.predict)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_predict_profanity_batches_and_caches(self):
+        texts = ["Desk lamp", "Works great", "Desk lamp", ""]
+        self.assertEqual(
+            moderation.predict_profanity(texts), [False, False, False, False]
+        )
+        self.predict.assert_called_once_with(["Desk lamp", "Works great"])
+
+        moderation.predict_profanity(["Works great", "Couch"])
+        self.assertEqual(self.predict.call_count, 2)
+        self.predict.assert_called_with(["Couch"])
+
+    def test_listing_fields_scored_in_one_call(self):
+        serializer = ListingSerializer(
+            data={"title": "Desk lamp", "description": "Barely used", "price": 5}
+        )
+        serializer.is_valid()
+        self.predict.assert_called_once_with(["Desk lamp", "Barely used"])
+
+    def test_bulk_payload_scored_in_one_call(self):
+        serializer = OfferSerializer(
+            data=[
+                {"offered_price": 5, "message": "Is this available?"},
+                {"offered_price": 6, "message": "Can pick up today"},
+            ],
+            many=True,
+        )
+        serializer.is_valid()
+        self.predict.assert_called_once_with(
+            ["Is this available?", "Can pick up today"]
+        )
+
+    def test_offer_message_profanity(self):
+        self.predict.side_effect = lambda texts: [1] * len(texts)
+        serializer = OfferSerializer(data={"offered_price": 5, "message": "Fuck"})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            serializer.errors["message"][0],
+            "The message contains inappropriate language.",
+        )
+
+
+@override_settings(MODERATION_MODE="async")
+class TestAsyncModeration(BaseMarketTest):
+    def create_item(self, title, description="Barely used"):
+        payload = {
+            "title": title,
+            "description": description,
+            "price": 20.0,
+            "listing_type": "item",
+            "additional_data": {"condition": "GOOD", "category": "Book"},
+        }
+        response = self.client.post("/market/listings/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Listing.objects.get(id=response.json()["id"])
+
+    def test_listing_pending_until_moderated(self):
+        listing = self.create_item("Physics Textbook")
+        self.assertEqual(
+            listing.moderation_status, Listing.ModerationStatus.PENDING_REVIEW
+        )
+        self.assertIsNotNone(listing.moderation_requested_at)
+
+        response = self.client.get("/market/listings/")
+        self.assertEqual(response.json()["count"], 0)
+        response = self.client.get("/market/listings/?seller=true")
+        self.assertEqual(response.json()["count"], 1)
+
+        call_command("moderate_listings", "--once", stdout=StringIO())
+
+        listing.refresh_from_db()
+        self.assertEqual(listing.moderation_status, Listing.ModerationStatus.PUBLISHED)
+        self.assertIsNotNone(listing.moderated_at)
+        response = self.client.get("/market/listings/")
+        self.assertEqual(response.json()["count"], 1)
+
+    def test_profane_listing_flagged(self):
+        listing = self.create_item("Fuck Textbook", "Fuck 2023 version")
+        call_command("moderate_listings", "--once", stdout=StringIO())
+
+        listing.refresh_from_db()
+        self.assertEqual(listing.moderation_status, Listing.ModerationStatus.FLAGGED)
+        response = self.client.get("/market/listings/")
+        self.assertEqual(response.json()["count"], 0)
+
+    def test_edit_requeues_listing(self):
+        listing = self.create_item("Physics Textbook")
+        call_command("moderate_listings", "--once", stdout=StringIO())
+
+        response = self.client.patch(
+            f"/market/listings/{listing.id}/", {"title": "Fuck"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        listing.refresh_from_db()
+        self.assertEqual(
+            listing.moderation_status, Listing.ModerationStatus.PENDING_REVIEW
+        )
+
+
+class TestImportTime(TestCase):
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     twilio.base\n"
+            "import time:       300 |        420 |   twilio\n"
+            "import time:        50 |        470 | market\n"
+        )
+        self.assertEqual(
+            parse_importtime(output),
+            [
+                ("twilio.base", 2, 120, 120),
+                ("twilio", 1, 300, 420),
+                ("market", 0, 50, 470),
+            ],
+        )
+
+    def test_boot_defers_heavy_imports(self):
+        stdout = StringIO()
+        call_command(
+            "profile_imports", "--repeat", "1", "--budget-ms", "60000", stdout=stdout
+        )
+        self.assertIn("Within budget", stdout.getvalue())
+
+
+class TestReferenceCaches(BaseMarketTest):
+    # warm_up() connects to every database, replicas included
+    databases = "__all__"
+
+    def test_tags_cached_until_changed(self):
+        self.assertEqual(len(market_caches.get_tags()), 8)
+        with self.assertNumQueries(0):
+            self.client.get("/market/tags/")
+
+        Tag.objects.create(name="Desk")
+        response = self.client.get("/market/tags/")
+        self.assertEqual(response.json()["count"], 9)
+
+    def test_category_lookup_cached(self):
+        self.assertEqual(market_caches.get_category("Book").name, "Book")
+        with self.assertNumQueries(0):
+            self.assertEqual(market_caches.get_category("Book").name, "Book")
+        # misses are checked against the database
+        with self.assertNumQueries(1):
+            self.assertIsNone(market_caches.get_category("Not a category"))
+
+        Category.objects.filter(name="Book").first().delete()
+        self.assertIsNone(market_caches.get_category("Book"))
+
+    def test_category_created_elsewhere(self):
+        market_caches.get_categories()
+        # as another process would: this process's cache isn't invalidated
+        Category.objects.bulk_create([Category(name="Desks")])
+        self.assertEqual(market_caches.get_category("Desks").name, "Desks")
+        # the stale list was dropped; the reloaded one has it
+        market_caches.get_categories()
+        with self.assertNumQueries(0):
+            self.assertEqual(market_caches.get_category("Desks").name, "Desks")
+
+    def test_warm_up_primes_caches(self):
+        with patch("market.warmup.gc.freeze"), patch("utils.moderation.load_model"):
+            warm_up()
+        with self.assertNumQueries(0):
+            market_caches.get_tags()
+            market_caches.get_categories()
+
+
+class TestOfferList(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+
+    def make_offers(self, listing, count):
+        return [
+            Offer.objects.create(
+                user=self.load_user(f"buyer{User.objects.count()}"),
+                listing=listing,
+                offered_price=10 + i,
+            )
+            for i in range(count)
+        ]
+
+    def test_list_offers_constant_queries(self):
+        listing = self.items[0]
+        self.make_offers(listing, 2)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/market/listings/{listing.id}/offers/")
+        self.assertEqual(response.json()["count"], 2)
+
+        offers = self.make_offers(listing, 8)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/market/listings/{listing.id}/offers/")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[-1]["user"]["username"], offers[-1].user.username)
+
+    def test_list_offers_not_seller(self):
+        listing = self.items[1]
+        self.make_offers(listing, 1)
+        response = self.client.get(f"/market/listings/{listing.id}/offers/")
+        self.assertEqual(response.status_code, 403)
+
+        # the rule is checked against the listing, not per offer
+        response = self.client.get(f"/market/listings/{self.items[2].id}/offers/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_list_offers_invalid_listing(self):
+        response = self.client.get("/market/listings/9999/offers/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            response.json(), {"detail": "No Listing matches the given query"}
+        )
+
+
+class TestOffersDashboard(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.extra = Item.objects.create(
+            seller=self.users[0],
+            category=self.categories[0],
+            title="Chem Textbook",
+            price=15,
+        )
+        self.offers = [
+            Offer.objects.create(
+                user=self.load_user(f"buyer{i}"),
+                listing=self.items[0],
+                offered_price=price,
+            )
+            for i, price in enumerate([12, 18, 15, 9])
+        ]
+        Listing.objects.filter(id=self.items[0].id).update(offer_count=4)
+        # offers on other sellers' listings are not included
+        Offer.objects.create(user=self.users[0], listing=self.items[1], offered_price=5)
+
+    def test_dashboard_stats(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/market/offers/dashboard/?top=2")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [listing["id"] for listing in results], [self.extra.id, self.items[0].id]
+        )
+
+        empty, stats = results
+        self.assertEqual(empty["offer_count"], 0)
+        self.assertEqual(empty["top_offers"], [])
+        self.assertEqual(stats["offer_count"], 4)
+        self.assertEqual(stats["highest_offer"], "18.00")
+        self.assertEqual(stats["lowest_offer"], "9.00")
+        self.assertEqual(stats["average_offer"], "13.50")
+        self.assertEqual(
+            [offer["id"] for offer in stats["top_offers"]],
+            [self.offers[1].id, self.offers[2].id],
+        )
+
+    def test_dashboard_keyset_pagination(self):
+        response = self.client.get("/market/offers/dashboard/?limit=1")
+        data = response.json()
+        self.assertEqual(len(data["results"]), 1)
+        self.assertEqual(data["results"][0]["id"], self.extra.id)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(data["next"])
+        data = response.json()
+        self.assertEqual(data["results"][0]["id"], self.items[0].id)
+        self.assertEqual(len(data["results"][0]["top_offers"]), 3)
+
+    def test_dashboard_bad_top(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/market/offers/dashboard/?top=many")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"top": "Must be an integer."})
+
+
+class TestOfferStatus(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        # offer received by the current user
+        self.received = Offer.objects.create(
+            user=self.users[1], listing=self.items[0], offered_price=15
+        )
+        # offer made by the current user
+        self.made = Offer.objects.create(
+            user=self.users[0], listing=self.items[1], offered_price=1500
+        )
+
+    def offer_url(self, offer, action):
+        return f"/market/listings/{offer.listing_id}/offers/{offer.id}/{action}/"
+
+    def test_accept_offer(self):
+        response = self.client.post(self.offer_url(self.received, "accept"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ACCEPTED")
+        self.received.refresh_from_db()
+        self.assertEqual(self.received.status, Offer.Status.ACCEPTED)
+
+        response = self.client.post(self.offer_url(self.received, "decline"))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"detail": "Offer is already accepted."})
+
+    def test_decline_offer(self):
+        response = self.client.post(self.offer_url(self.received, "decline"))
+        self.assertEqual(response.status_code, 200)
+        self.received.refresh_from_db()
+        self.assertEqual(self.received.status, Offer.Status.DECLINED)
+
+    def test_buyer_cannot_accept(self):
+        response = self.client.post(self.offer_url(self.made, "accept"))
+        self.assertEqual(response.status_code, 403)
+        self.made.refresh_from_db()
+        self.assertEqual(self.made.status, Offer.Status.PENDING)
+
+    def test_withdraw_offer(self):
+        response = self.client.post(self.offer_url(self.received, "withdraw"))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(self.offer_url(self.made, "withdraw"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "WITHDRAWN")
+
+    def test_filter_by_status(self):
+        self.client.post(self.offer_url(self.received, "decline"))
+        response = self.client.get("/market/offers/received/?status=pending")
+        self.assertEqual(response.json()["count"], 0)
+        response = self.client.get("/market/offers/received/?status=declined")
+        self.assertEqual(response.json()["count"], 1)
+        response = self.client.get("/market/offers/made/?status=pending")
+        self.assertEqual(response.json()["count"], 1)
+
+        response = self.client.get("/market/offers/made/?status=unknown")
+        self.assertEqual(response.status_code, 400)
+
+    def test_expire_offers(self):
+        Listing.objects.filter(id=self.items[1].id).update(
+            expires_at=now() - datetime.timedelta(days=1)
+        )
+        call_command("expire_offers", stdout=StringIO())
+
+        self.made.refresh_from_db()
+        self.received.refresh_from_db()
+        self.assertEqual(self.made.status, Offer.Status.EXPIRED)
+        self.assertEqual(self.received.status, Offer.Status.PENDING)
+
+
+class TestOfferCreate(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.user.phone_number = "+12025550100"
+        self.user.phone_verified = True
+        self.user.save()
+
+    def test_create_offer_two_queries(self):
+        url = f"/market/listings/{self.items[1].id}/offers/"
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                url, {"offered_price": 1500, "message": "Hi"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["listing"], self.items[1].id)
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        # insert and offer_count increment, which also finds missing listings
+        self.assertEqual(len(queries), 2)
+
+    def test_create_offer_duplicate(self):
+        url = f"/market/listings/{self.items[1].id}/offers/"
+        self.client.post(url, {"offered_price": 1500}, format="json")
+        response = self.client.post(url, {"offered_price": 1600}, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"detail": "Offer already exists"})
+        self.assertEqual(Offer.objects.filter(listing=self.items[1]).count(), 1)
+
+    def test_offer_again_after_withdrawing(self):
+        url = f"/market/listings/{self.items[1].id}/offers/"
+        offer_id = self.client.post(url, {"offered_price": 1500}, format="json").json()[
+            "id"
+        ]
+        response = self.client.post(f"{url}{offer_id}/withdraw/")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(url, {"offered_price": 1400}, format="json")
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(url, {"offered_price": 1300}, format="json")
+        self.assertEqual(response.status_code, 409)
+
+        # deleting takes back the live offer, not the withdrawn one
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(
+            list(Offer.objects.filter(listing=self.items[1]).values_list("status")),
+            [(Offer.Status.WITHDRAWN,)],
+        )
+
+    def test_create_offer_invalid_listing(self):
+        response = self.client.post(
+            "/market/listings/9999/offers/", {"offered_price": 5}, format="json"
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TestListingCounters(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.user.phone_number = "+12025550100"
+        self.user.phone_verified = True
+        self.user.save()
+        self.listing = self.items[1]
+
+    def counts(self):
+        self.listing.refresh_from_db(fields=["favorite_count", "offer_count"])
+        return self.listing.favorite_count, self.listing.offer_count
+
+    def test_favorite_counter(self):
+        url = f"/market/listings/{self.listing.id}/favorites/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertEqual(self.client.post(url).status_code, 409)
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_offer_counter(self):
+        url = f"/market/listings/{self.listing.id}/offers/"
+        self.client.post(url, {"offered_price": 1500}, format="json")
+        self.assertEqual(self.counts(), (0, 1))
+        self.client.post(url, {"offered_price": 1600}, format="json")
+        self.assertEqual(self.counts(), (0, 1))
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_public_listing_reads_counters(self):
+        self.client.post(f"/market/listings/{self.listing.id}/favorites/")
+        self.client.post(
+            f"/market/listings/{self.listing.id}/offers/",
+            {"offered_price": 1500},
+            format="json",
+        )
+        response = self.client.get(f"/market/listings/{self.listing.id}/")
+        self.assertEqual(response.json()["favorite_count"], 1)
+        self.assertEqual(response.json()["buyer_count"], 1)
+
+    def test_ordering(self):
+        Listing.objects.filter(id=self.items[2].id).update(favorite_count=5)
+        Listing.objects.filter(id=self.items[0].id).update(favorite_count=3)
+        response = self.client.get("/market/listings/?ordering=-favorite_count")
+        self.assertEqual(response.status_code, 200)
+        ids = [listing["id"] for listing in response.json()["results"]]
+        self.assertEqual(ids[:2], [self.items[2].id, self.items[0].id])
+
+        response = self.client.get("/market/listings/?ordering=price")
+        prices = [float(listing["price"]) for listing in response.json()["results"]]
+        self.assertEqual(prices, sorted(prices))
+
+    def test_ordering_invalid(self):
+        response = self.client.get("/market/listings/?ordering=seller")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.json())
+
+    def test_reconcile(self):
+        Listing.favorites.through.objects.create(
+            listing=self.listing, user=self.users[0]
+        )
+        Listing.objects.filter(id=self.items[2].id).update(offer_count=4)
+
+        out = StringIO()
+        call_command("reconcile_listing_counters", "--dry-run", stdout=out)
+        self.assertIn("Found 2 with drifted counters", out.getvalue())
+        self.assertEqual(self.counts(), (0, 0))
+
+        out = StringIO()
+        call_command("reconcile_listing_counters", "--batch-size", "2", stdout=out)
+        self.assertIn("Repaired 2 with drifted counters", out.getvalue())
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertEqual(Listing.objects.get(id=self.items[2].id).offer_count, 0)
+
+
+class TestFavoritesSync(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.url = f"/market/listings/{self.items[1].id}/favorites/"
+
+    def test_put_is_idempotent(self):
+        response = self.client.put(self.url, {}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"liked": True, "version": 1})
+        response = self.client.put(self.url, {"liked": True}, format="json")
+        self.assertEqual(response.json(), {"liked": True, "version": 1})
+        self.assertEqual(self.items[1].favorites.count(), 1)
+
+        response = self.client.put(self.url, {"liked": False}, format="json")
+        self.assertEqual(response.json(), {"liked": False, "version": 2})
+        response = self.client.put(self.url, {"liked": False}, format="json")
+        self.assertEqual(response.json(), {"liked": False, "version": 2})
+        self.assertFalse(self.items[1].favorites.exists())
+        self.assertEqual(Listing.objects.get(id=self.items[1].id).favorite_count, 0)
+
+    def test_put_nonexistent_listing(self):
+        response = self.client.put("/market/listings/9999/favorites/", format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_sync(self):
+        self.items[0].favorites.add(self.users[0])
+        data = {
+            "add": [self.items[1].id, 9999],
+            "remove": [self.items[0].id, self.items[2].id],
+        }
+        response = self.client.post("/market/favorites/sync/", data, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"favorites": [self.items[1].id], "version": 1}
+        )
+        self.assertEqual(
+            [Listing.objects.get(id=item.id).favorite_count for item in self.items],
+            [0, 1, 0],
+        )
+
+        # replaying the same batch changes nothing
+        response = self.client.post("/market/favorites/sync/", data, format="json")
+        self.assertEqual(response.json()["version"], 1)
+
+    def test_sync_conflicting(self):
+        data = {"add": [self.items[1].id], "remove": [self.items[1].id]}
+        response = self.client.post("/market/favorites/sync/", data, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+)
+@patch.object(
+    SlidingWindowThrottle,
+    "THROTTLE_RATES",
+    {
+        "send_code_user": "3/m",
+        "send_code_phone": "1/m",
+        "verify_code_user": "4/m",
+        "verify_code_phone": "2/10m",
+        "offer_create": "1/m",
+        "listing_create": "1/m",
+    },
+)
+class TestThrottling(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.user.phone_number = "+12025550100"
+        self.user.phone_verified = True
+        self.user.save()
+
+    def send_code(self, phone_number):
+        return self.client.post(
+            "/market/phone/send-code/", {"phone_number": phone_number}, format="json"
+        )
+
+    def verify_code(self, phone_number):
+        return self.client.post(
+            "/market/phone/verify-code/",
+            {"phone_number": phone_number, "code": "000000"},
+            format="json",
+        )
+
+    def test_send_code_per_phone_and_user(self):
+        self.assertEqual(self.send_code("+12025550101").status_code, 200)
+        # same number in another format
+        response = self.send_code("+1 (202) 555-0101")
+        self.assertEqual(response.status_code, 429)
+        self.assertLessEqual(int(response["Retry-After"]), 60)
+        self.assertEqual(self.send_code("+12025550102").status_code, 200)
+        # the rejected request counts towards the user's limit too
+        self.assertEqual(self.send_code("+12025550103").status_code, 429)
+
+    def test_verify_code_per_phone(self):
+        for _ in range(2):
+            self.assertEqual(self.verify_code("+12025550101").status_code, 400)
+        self.assertEqual(self.verify_code("+12025550101").status_code, 429)
+        self.assertEqual(self.verify_code("+12025550102").status_code, 400)
+        self.assertEqual(self.verify_code("+12025550103").status_code, 429)
+
+    def test_phone_number_formats_share_a_limit(self):
+        self.assertEqual(self.verify_code("+12025550101").status_code, 400)
+        self.assertEqual(self.verify_code("12025550101").status_code, 400)
+        self.assertEqual(self.verify_code("2025550101").status_code, 429)
+
+    def test_offer_create(self):
+        for item, expected in zip(self.items, [201, 429]):
+            response = self.client.post(
+                f"/market/listings/{item.id}/offers/",
+                {"offered_price": 10},
+                format="json",
+            )
+            self.assertEqual(response.status_code, expected)
+        # other actions aren't throttled
+        url = f"/market/listings/{self.items[0].id}/offers/"
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+    def test_listing_create(self):
+        payload = {
+            "listing_type": "item",
+            "title": "Desk Lamp",
+            "description": "Works",
+            "price": 10,
+            "tags": [],
+            "additional_data": {"condition": "GOOD", "category": "Book"},
+        }
+        self.assertEqual(
+            self.client.post("/market/listings/", payload, format="json").status_code,
+            201,
+        )
+        self.assertEqual(
+            self.client.post("/market/listings/", payload, format="json").status_code,
+            429,
+        )
+
+
+@skipIf(not redis_available(), "Redis is not running")
+@override_settings(CACHES=redis_caches(REDIS_URL))
+class TestRedisThrottling(TestThrottling):
+    def test_fails_open(self):
+        down = redis.Redis.from_url("redis://127.0.0.1:1/0", socket_connect_timeout=0.5)
+        with patch("market.throttling.get_redis", return_value=down):
+            with self.assertLogs("market.throttling", "WARNING"):
+                for _ in range(3):
+                    self.assertEqual(self.send_code("+12025550101").status_code, 200)
+
+
+@skipIf(not redis_available(), "Redis is not running")
+@override_settings(FAVORITES_BACKEND="redis", CACHES=redis_caches(REDIS_URL))
+class TestRedisFavorites(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.listing = self.items[1]
+        self.url = f"/market/listings/{self.listing.id}/favorites/"
+        self.redis = favorites.get_client()
+        self.redis.delete(*self.redis.keys("favorites:*"), "favorites:none")
+
+    def in_db(self):
+        return self.listing.favorites.filter(id=self.users[0].id).exists()
+
+    def flush(self):
+        call_command("flush_favorites", "--once", stdout=StringIO())
+        self.listing.refresh_from_db(fields=["favorite_count"])
+
+    def favorited_ids(self):
+        response = self.client.get("/market/favorites/")
+        return [listing["id"] for listing in response.json()["results"]]
+
+    def test_write_behind(self):
+        self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.client.post(self.url).status_code, 409)
+        self.assertEqual(self.favorited_ids(), [self.listing.id])
+        self.assertFalse(self.in_db())
+
+        self.flush()
+        self.assertTrue(self.in_db())
+        self.assertEqual(self.listing.favorite_count, 1)
+
+        self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.assertEqual(self.client.delete(self.url).status_code, 404)
+        self.assertEqual(self.favorited_ids(), [])
+        self.assertTrue(self.in_db())
+
+        self.flush()
+        self.assertFalse(self.in_db())
+        self.assertEqual(self.listing.favorite_count, 0)
+
+    def test_sync_and_versions(self):
+        data = {"add": [self.listing.id, self.items[2].id]}
+        response = self.client.post("/market/favorites/sync/", data, format="json")
+        self.assertEqual(
+            response.json(),
+            {"favorites": sorted([self.listing.id, self.items[2].id]), "version": 1},
+        )
+        response = self.client.put(self.url, {"liked": False}, format="json")
+        self.assertEqual(response.json(), {"liked": False, "version": 2})
+        self.assertFalse(Listing.favorites.through.objects.exists())
+
+        self.flush()
+        self.assertEqual(
+            list(
+                Listing.favorites.through.objects.values_list("listing_id", flat=True)
+            ),
+            [self.items[2].id],
+        )
+        self.users[0].refresh_from_db()
+        self.assertEqual(self.users[0].favorites_version, 2)
+
+    def test_loads_existing_favorites(self):
+        self.listing.favorites.add(self.users[0])
+        self.assertEqual(self.client.post(self.url).status_code, 409)
+        self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.flush()
+        self.assertFalse(self.in_db())
+
+    def test_deleted_listing(self):
+        self.client.post(self.url)
+        self.listing.delete()
+        self.assertEqual(self.favorited_ids(), [])
+        self.assertEqual(list(favorites.pending_writes(self.redis)), [])
+        call_command("flush_favorites", "--once", stdout=StringIO())
+        self.assertFalse(Listing.favorites.through.objects.exists())
+
+    def test_nonexistent_listing(self):
+        response = self.client.post("/market/listings/9999/favorites/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_repair(self):
+        self.client.post(self.url)
+        self.flush()
+        # a write that fell back to the database while Redis was down
+        self.items[2].favorites.add(self.users[0])
+
+        out = StringIO()
+        call_command("repair_favorites", "--dry-run", stdout=out)
+        self.assertIn("Found 1 drifted", out.getvalue())
+        self.assertEqual(self.favorited_ids(), [self.listing.id])
+
+        out = StringIO()
+        call_command("repair_favorites", stdout=out)
+        self.assertIn("Reloaded 1 drifted", out.getvalue())
+        self.assertEqual(
+            sorted(self.favorited_ids()), [self.listing.id, self.items[2].id]
+        )
+
+
+@override_settings(
+    FAVORITES_BACKEND="redis", CACHES=redis_caches("redis://127.0.0.1:1/0")
+)
+class TestFavoritesRedisDown(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items("tests/market/user_1_items.json", self.users[1])
+        self.listing = self.items[0]
+        self.url = f"/market/listings/{self.listing.id}/favorites/"
+
+    def test_falls_back_to_db(self):
+        with self.assertLogs("market.favorites", "WARNING"):
+            self.assertEqual(self.client.post(self.url).status_code, 201)
+            self.assertEqual(self.client.post(self.url).status_code, 409)
+        self.listing.refresh_from_db(fields=["favorite_count"])
+        self.assertEqual(self.listing.favorite_count, 1)
+        self.assertTrue(self.listing.favorites.filter(id=self.users[0].id).exists())
+
+        with self.assertLogs("market.favorites", "WARNING"):
+            self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.assertFalse(self.listing.favorites.exists())
+
+
+@skipIf(connection.vendor == "sqlite", "SQLite table locks serialize the writers")
+class TestOfferCreateConcurrency(TransactionTestCase):
+    def setUp(self):
+        reset_throttles()
+        seller = User.objects.create_user("seller")
+        self.buyer = User.objects.create_user(
+            "buyer", phone_number="+12025550100", phone_verified=True
+        )
+        self.item = Item.objects.create(
+            seller=seller,
+            category=Category.objects.create(name="Book"),
+            title="Math Textbook",
+            price=20,
+        )
+
+    def test_concurrent_offers(self):
+        url = f"/market/listings/{self.item.id}/offers/"
+        barrier = threading.Barrier(4)
+        statuses = []
+
+        def submit(price):
+            client = APIClient()
+            client.force_authenticate(self.buyer)
+            barrier.wait()
+            try:
+                response = client.post(url, {"offered_price": price}, format="json")
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=submit, args=(price,)) for price in range(10, 14)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201, 409, 409, 409])
+        self.assertEqual(Offer.objects.filter(listing=self.item).count(), 1)
+
+
+class ScriptedSMSBackend:
+    """Fails with each error in `errors` in turn, then sends."""
+
+    errors = []
+    sent = []
+
+    def send(self, to, body):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(to)
+        return f"scripted-{len(self.sent)}"
+
+
+@override_settings(SMS_BACKEND="tests.market.test_market.ScriptedSMSBackend")
+class TestSMSOutbox(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        ScriptedSMSBackend.errors = []
+        ScriptedSMSBackend.sent = []
+
+    def queue(self, **kwargs):
+        return OutboundSMS.objects.create(to="+12025550100", body="Hi", **kwargs)
+
+    def send(self):
+        call_command("send_sms", "--once", stdout=StringIO())
+
+    def test_view_queues_message(self):
+        response = self.client.post(
+            "/market/phone/send-code/", {"phone_number": "+12025550100"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ScriptedSMSBackend.sent, [])
+        message = OutboundSMS.objects.get()
+        self.assertEqual(message.status, OutboundSMS.Status.PENDING)
+        self.assertEqual(str(message.to), "+12025550100")
+        self.assertIsNotNone(message.expires_at)
+
+    def test_send(self):
+        message = self.queue()
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.SENT)
+        self.assertEqual(message.provider_id, "scripted-1")
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.body, "")
+        self.assertEqual(ScriptedSMSBackend.sent, ["+12025550100"])
+
+    def test_crash_mid_batch(self):
+        first, second = self.queue(), self.queue()
+        with (
+            patch.object(
+                ScriptedSMSBackend, "send", side_effect=["sent", RuntimeError]
+            ),
+            self.assertRaises(RuntimeError),
+        ):
+            self.send()
+        first.refresh_from_db()
+        self.assertEqual(first.status, OutboundSMS.Status.SENT)
+
+        # still claimed by the dead sender until its send could have timed out
+        second.refresh_from_db()
+        self.assertEqual(second.status, OutboundSMS.Status.PENDING)
+        self.assertGreater(second.next_attempt_at, now())
+        self.send()
+        self.assertEqual(ScriptedSMSBackend.sent, [])
+
+        OutboundSMS.objects.update(next_attempt_at=now())
+        self.send()
+        self.assertEqual(ScriptedSMSBackend.sent, ["+12025550100"])
+
+    def test_retry_with_backoff(self):
+        ScriptedSMSBackend.errors = [sms.SMSError("timeout")]
+        message = self.queue()
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.PENDING)
+        self.assertEqual(message.last_error, "timeout")
+        self.assertGreater(message.next_attempt_at, now())
+
+        # not due yet
+        self.send()
+        self.assertEqual(ScriptedSMSBackend.sent, [])
+
+        OutboundSMS.objects.update(next_attempt_at=now())
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.SENT)
+        self.assertEqual(message.attempts, 2)
+
+    @override_settings(SMS_MAX_ATTEMPTS=2, SMS_RETRY_BACKOFF_SECONDS=0)
+    def test_gives_up(self):
+        ScriptedSMSBackend.errors = [sms.SMSError("down")] * 3
+        message = self.queue()
+        self.send()
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.FAILED)
+        self.assertEqual(message.attempts, 2)
+
+    def test_permanent_failure(self):
+        ScriptedSMSBackend.errors = [sms.SMSError("invalid number", retryable=False)]
+        message = self.queue()
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.FAILED)
+        self.assertEqual(message.attempts, 1)
+
+    def test_expired(self):
+        message = self.queue(expires_at=now() - datetime.timedelta(seconds=1))
+        self.send()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundSMS.Status.FAILED)
+        self.assertEqual(ScriptedSMSBackend.sent, [])
+
+    def test_locmem_backend(self):
+        with override_settings(SMS_BACKEND="utils.sms.LocMemBackend"):
+            self.queue()
+            self.send()
+        self.assertEqual(sms.outbox[-1], {"to": "+12025550100", "body": "Hi"})
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+)
+class TestAuthCache(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+
+    def introspection(self):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {
+            "user": {
+                "pennid": 12345,
+                "username": "platform",
+                "first_name": "Platform",
+                "last_name": "User",
+                "email": "platform@upenn.edu",
+                "user_permissions": [],
+                "groups": ["student"],
+            }
+        }
+        return response
+
+    @patch("accounts.authentication.requests.post")
+    def test_token_introspected_once(self, mock_post):
+        mock_post.return_value = self.introspection()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer abc")
+        for _ in range(2):
+            response = client.get("/market/user/me/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["username"], "platform")
+        self.assertEqual(mock_post.call_count, 1)
+
+        # a different token is introspected again
+        client.credentials(HTTP_AUTHORIZATION="Bearer xyz")
+        client.get("/market/user/me/")
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("accounts.authentication.requests.post")
+    def test_deactivated_user_loses_cached_token(self, mock_post):
+        mock_post.return_value = self.introspection()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer abc")
+        self.assertEqual(client.get("/market/user/me/").status_code, 200)
+
+        User.objects.filter(username="platform").update(is_active=False)
+        authentication.invalidate_users([12345])
+        for urlconf in (settings.ROOT_URLCONF, AsyncURLConf):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                response = client.get("/market/user/me/")
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(response.json(), {"detail": "Invalid User."})
+
+    def test_session_user_cached(self):
+        backend = CachedLabsUserBackend()
+        self.assertEqual(backend.get_user(self.user.id), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.id), self.user)
+        self.assertIsNone(backend.get_user(999999))
+
+    def test_verification_invalidates(self):
+        self.assertFalse(authentication.get_user(self.user.id).phone_verified)
+        caches["default"].set(f"phone_verify:{self.user.id}:+12025550100", "123456")
+        response = self.client.post(
+            "/market/phone/verify-code/",
+            {"phone_number": "+12025550100", "code": "123456"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(authentication.get_user(self.user.id).phone_verified)
+
+    def test_bulk_updates_invalidate(self):
+        # a session user, loaded through the cache on every request
+        client = APIClient()
+        client.force_login(self.user)
+        listing = self.load_items("tests/market/user_1_items.json", self.users[1])[0]
+        client.put(
+            f"/market/listings/{listing.id}/favorites/", {"liked": True}, format="json"
+        )
+        self.assertEqual(authentication.get_user(self.user.id).favorites_version, 1)
+
+        caches["default"].set(f"phone_verify:{self.user.id}:+12025550100", "123456")
+        response = client.post(
+            "/market/phone/verify-code/",
+            {"phone_number": "+12025550100", "code": "123456"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.favorites_version, 1)
+        self.assertTrue(self.user.phone_verified)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+)
+class TestSessionMigration(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.live = db_session.SessionStore()
+        self.live["_auth_user_id"] = str(self.user.id)
+        self.live.create()
+        self.expired = db_session.SessionStore()
+        self.expired.set_expiry(-1)
+        self.expired.create()
+
+    def test_migrate_sessions(self):
+        out = StringIO()
+        call_command("migrate_sessions", stdout=out)
+        self.assertIn("Copied 1 sessions", out.getvalue())
+        migrated = cache_session.SessionStore(self.live.session_key)
+        self.assertEqual(migrated["_auth_user_id"], str(self.user.id))
+        self.assertFalse(cache_session.SessionStore().exists(self.expired.session_key))
+
+    def test_purge_db_sessions(self):
+        with self.assertRaises(CommandError):
+            call_command("purge_db_sessions", stdout=StringIO())
+
+        call_command("purge_db_sessions", "--expired-only", stdout=StringIO())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            [self.live.session_key],
+        )
+
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cache"):
+            call_command("purge_db_sessions", "--batch-size", "1", stdout=StringIO())
+        self.assertFalse(Session.objects.exists())
+
+
+class AsyncURLConf:
+    """market.urls with the async read views switched on, as under ASGI."""
+
+    urlpatterns = [
+        path(
+            "market/",
+            include((market_urls.async_read_urls + market_urls.urlpatterns, "market")),
+        )
+    ]
+
+
+class TestAsyncViews(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items(
+            "tests/market/self_user_items.json", self.users[0]
+        ) + self.load_items("tests/market/user_1_items.json", self.users[1])
+        favorites.add(self.user.id, self.items[2].id)
+        # the async views authenticate by session or token
+        self.client.force_authenticate(None)
+        self.client.force_login(self.user)
+
+    def assertSameResponse(self, url):
+        sync_response = self.client.get(url)
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            async_response = self.client.get(url)
+            self.assertTrue(iscoroutinefunction(async_response.resolver_match.func))
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.json(), sync_response.json())
+        return async_response
+
+    def test_matches_sync_views(self):
+        for url in [
+            "/market/user/me/",
+            "/market/tags/?limit=3&offset=2",
+            "/market/favorites/",
+            "/market/listings/?type=item&ordering=-price",
+            "/market/listings/?ordering=bogus",
+            f"/market/listings/{self.items[0].id}/",
+            f"/market/listings/{self.items[2].id}/",
+            "/market/listings/999999/",
+        ]:
+            with self.subTest(url=url):
+                self.assertSameResponse(url)
+
+    def test_unmoderated_listings_hidden(self):
+        Listing.objects.filter(id__in=[self.items[0].id, self.items[1].id]).update(
+            moderation_status=Listing.ModerationStatus.FLAGGED
+        )
+        # only the seller can fetch their listing while it's under review
+        response = self.assertSameResponse(f"/market/listings/{self.items[0].id}/")
+        self.assertEqual(response.status_code, 200)
+        response = self.assertSameResponse(f"/market/listings/{self.items[1].id}/")
+        self.assertEqual(response.status_code, 404)
+
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.assertSameResponse(f"/market/listings/{self.items[1].id}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_unauthenticated(self):
+        self.client.logout()
+        response = self.assertSameResponse("/market/listings/")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.assertSameResponse("/market/tags/").status_code, 200)
+
+    def test_basic_auth(self):
+        self.client.logout()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"user:user").decode()
+        )
+        response = self.assertSameResponse("/market/user/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], "user")
+
+    def test_writes_reach_drf_views(self):
+        self.client.force_authenticate(self.user)
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            response = self.client.delete(f"/market/listings/{self.items[0].id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Listing.objects.filter(id=self.items[0].id).exists())
+
+    @patch("accounts.authentication.requests.post")
+    def test_bearer_token(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=401)
+        self.client.logout()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer bad")
+        with patch("accounts.authentication.get_validated_claims", return_value=None):
+            response = self.assertSameResponse("/market/user/me/")
+        self.assertEqual(response.json(), {"detail": "Invalid access token."})
+
+
+class TestConnectionPool(BaseMarketTest):
+    def test_configure(self):
+        options = {"min_size": 1, "max_size": 4}
+        database = postgres_pool.configure(
+            {"ENGINE": "django.db.backends.postgresql", "CONN_MAX_AGE": 600},
+            "psycopg",
+            options,
+        )
+        self.assertEqual(database["ENGINE"], "utils.postgres_pool")
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertEqual(database["OPTIONS"]["pool"], options)
+
+        database = postgres_pool.configure({"CONN_MAX_AGE": 600}, "pgbouncer", options)
+        self.assertTrue(database["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertEqual(database["CONN_MAX_AGE"], 600)
+
+        with self.assertRaises(ValueError):
+            postgres_pool.configure({}, "bogus", options)
+
+    @skipIf(connection.vendor != "postgresql", "needs PostgreSQL")
+    def test_connections_are_reused(self):
+        from utils.postgres_pool.base import DatabaseWrapper
+
+        pooled = DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                "CONN_MAX_AGE": 0,
+                "OPTIONS": {"pool": {"min_size": 1, "max_size": 1}},
+            },
+            alias="pooled",
+        )
+        self.addCleanup(pooled.close_pool)
+        backend_pids = []
+        for _ in range(2):
+            with pooled.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                backend_pids.append(cursor.fetchone()[0])
+            pooled.close()
+        self.assertEqual(backend_pids[0], backend_pids[1])
+        self.assertEqual(postgres_pool.pool_stats()["pooled"]["requests_num"], 2)
+
+    @skipIf(connection.vendor != "postgresql", "needs PostgreSQL")
+    def test_warm_up_closes_pools(self):
+        from utils.postgres_pool.base import DatabaseWrapper
+
+        pooled = DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                "CONN_MAX_AGE": 0,
+                "OPTIONS": {"pool": {"min_size": 1, "max_size": 1}},
+            },
+            alias="pooled",
+        )
+        self.addCleanup(pooled.close_pool)
+        with (
+            patch.object(connections, "all", return_value=[pooled]),
+            patch("market.warmup.gc.freeze"),
+            patch("utils.moderation.load_model"),
+        ):
+            warm_up()
+        # nothing pooled left for the workers to inherit
+        self.assertNotIn("pooled", DatabaseWrapper.connection_pools)
+        self.assertIsNone(pooled.connection)
+
+        # the first query in a worker starts a pool of its own
+        with pooled.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertIn("pooled", DatabaseWrapper.connection_pools)
+
+    def test_stats_endpoint(self):
+        self.assertEqual(self.client.get("/market/metrics/db-pool/").status_code, 403)
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get("/market/metrics/db-pool/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), dict)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class TestReplicaRouting(SimpleTestCase):
+    def setUp(self):
+        replicas.lag_checks.clear()
+        self.addCleanup(replicas.lag_checks.clear)
+
+    def route(self, request, lag=0.0, write=False):
+        """Where a view's reads go, and its response, for `request`."""
+
+        def view(request):
+            if write:
+                router.db_for_write(Listing)
+            response = HttpResponse()
+            response.read_database = router.db_for_read(Listing)
+            return response
+
+        with patch.object(replicas, "replica_lag", return_value=lag) as replica_lag:
+            response = replicas.ReplicaMiddleware(view)(request)
+        return response.read_database, response, replica_lag
+
+    def test_safe_requests_read_replica(self):
+        database, response, _ = self.route(RequestFactory().get("/market/listings/"))
+        self.assertEqual(database, "replica_1")
+        self.assertNotIn(replicas.STICKY_COOKIE, response.cookies)
+        # outside requests
+        self.assertEqual(router.db_for_read(Listing), "default")
+
+    def test_writes_read_primary(self):
+        database, response, _ = self.route(
+            RequestFactory().post("/market/listings/"), write=True
+        )
+        self.assertEqual(database, "default")
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+
+        # reads after a write in a GET
+        database, response, _ = self.route(
+            RequestFactory().get("/market/listings/"), write=True
+        )
+        self.assertEqual(database, "default")
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+
+    def test_sticky_after_write(self):
+        request = RequestFactory().get("/market/listings/")
+        request.COOKIES[replicas.STICKY_COOKIE] = "1"
+        database, _, replica_lag = self.route(request)
+        self.assertEqual(database, "default")
+        replica_lag.assert_not_called()
+
+    def test_lagging_replica(self):
+        database, _, replica_lag = self.route(
+            RequestFactory().get("/market/listings/"), lag=60.0
+        )
+        self.assertEqual(database, "default")
+        # the lag is only checked again after DATABASE_REPLICA_LAG_CHECK_SECONDS
+        database, _, replica_lag = self.route(RequestFactory().get("/market/tags/"))
+        self.assertEqual(database, "default")
+        replica_lag.assert_not_called()
+
+        replicas.lag_checks.clear()
+        database, _, replica_lag = self.route(RequestFactory().get("/market/tags/"))
+        self.assertEqual(database, "replica_1")
+        replica_lag.assert_called_once_with("replica_1")
+
+
+@skipIf(not settings.DATABASE_REPLICAS, "needs DATABASE_REPLICA_URLS")
+class TestReplicas(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        replicas.lag_checks.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user("user")
+        self.client.force_authenticate(self.user)
+        self.item = Item.objects.create(
+            seller=User.objects.create_user("seller"),
+            category=Category.objects.create(name="Book"),
+            title="Math Textbook",
+            price=20,
+        )
+
+    def test_reads_from_replica(self):
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        with CaptureQueriesContext(replica) as replica_queries:
+            response = self.client.get("/market/listings/")
+        self.assertEqual(response.json()["count"], 1)
+        self.assertTrue(replica_queries)
+
+        with CaptureQueriesContext(replica) as replica_queries:
+            response = self.client.post(f"/market/listings/{self.item.id}/favorites/")
+            self.assertEqual(response.status_code, 201)
+            self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+            self.client.get("/market/favorites/")
+        self.assertFalse(replica_queries)
+
+
+class QueryBudgetTestMixin:
+    page_sizes = (1, 5, 25)
+
+    def assertWithinQueryBudget(self, url):
+        """
+        Fail if GET `url` runs more queries than its view's query_budget, at any
+        of `page_sizes`. Pages should be full, so that N+1 queries show.
+        """
+        request = RequestFactory().get(url)
+        budget = instrumentation.get_query_budget(resolve(request.path).func, request)
+        self.assertIsNotNone(budget, f"{request.path} declares no query_budget")
+        for page_size in self.page_sizes:
+            paged_url = f"{url}{'&' if '?' in url else '?'}limit={page_size}"
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(paged_url)
+            self.assertEqual(response.status_code, 200, paged_url)
+            if "results" in response.json():
+                self.assertEqual(len(response.json()["results"]), page_size)
+            self.assertLessEqual(
+                len(queries),
+                budget,
+                "\n".join([paged_url, *(q["sql"] for q in queries.captured_queries)]),
+            )
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        book = self.categories[0]
+        self.mine = []
+        for i in range(25):
+            theirs = Item.objects.create(
+                seller=self.users[1], category=book, title=f"Theirs {i}", price=10
+            )
+            theirs.tags.set(self.tags[:2])
+            theirs.favorites.add(self.user)
+            Offer.objects.create(user=self.user, listing=theirs, offered_price=5)
+
+            mine = Sublet.objects.create(
+                seller=self.user,
+                title=f"Mine {i}",
+                price=1000,
+                street_address="3401 Walnut St",
+                beds=1,
+                baths=1,
+                start_date="2030-01-01",
+                end_date="2030-05-01",
+            )
+            mine.tags.set(self.tags[6:])
+            self.mine.append(mine)
+            buyer = User.objects.create_user(f"buyer{i}")
+            Offer.objects.create(user=buyer, listing=self.mine[0], offered_price=900)
+
+    def test_read_endpoints(self):
+        for url in [
+            "/market/listings/",
+            "/market/listings/?type=item",
+            "/market/listings/?seller=true",
+            f"/market/listings/{self.mine[0].id}/",
+            "/market/favorites/",
+            "/market/offers/made/",
+            "/market/offers/received/",
+            "/market/offers/dashboard/",
+            f"/market/listings/{self.mine[0].id}/offers/",
+            "/market/user/me/",
+            "/market/phone/status/",
+        ]:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(url)
+
+    def test_read_endpoints_declare_budgets(self):
+        request = RequestFactory().get("/")
+        for pattern in market_urls.urlpatterns:
+            view = pattern.callback
+            actions = getattr(view, "actions", None)
+            reads = "get" in actions if actions else hasattr(view.cls, "get")
+            # the router's index of the API
+            if reads and pattern.name != "api-root":
+                with self.subTest(route=str(pattern.pattern)):
+                    budget = instrumentation.get_query_budget(view, request)
+                    self.assertIsNotNone(budget)
+
+    def test_over_budget_logged(self):
+        caches["local"].clear()
+        with (
+            patch.object(Tags, "query_budget", 0),
+            self.assertLogs("market.instrumentation", "WARNING") as logs,
+        ):
+            self.client.get("/market/tags/")
+        self.assertIn('1x SELECT "market_tag"', logs.output[0])
+
+        self.client.get("/market/tags/")
+        totals = instrumentation.view_totals["GET", "market/tags/"]
+        self.assertGreaterEqual(totals["cache_misses"], 1)
+        self.assertGreaterEqual(totals["cache_hits"], 1)
+        self.assertGreater(totals["serializer_time"], 0)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"
+            ),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+
+class TestMetrics(BaseMarketTest):
+    def test_requires_token_or_superuser(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with override_settings(METRICS_TOKEN="secret"):
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_export(self):
+        self.client.get("/market/tags/")
+        OutboundSMS.objects.create(to="+12025550100", body="Hi")
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_bucket{le="0.005",method="GET",'
+            'route="market:tags",status="200"}',
+            body,
+        )
+        self.assertIn('http_request_db_queries_count{route="market:tags"}', body)
+        self.assertIn('cache_requests_total{namespace="market:tags"', body)
+        self.assertIn('queue_depth{queue="sms"} 1.0', body)
+        self.assertIn('queue_depth{queue="moderation"} 0.0', body)
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+            for _ in range(2):
+                subprocess.run(
+                    [
+                        sys.executable,
+                        "-c",
+                        "from utils.metrics import SMS_MESSAGES; "
+                        "SMS_MESSAGES.labels('sent').inc()",
+                    ],
+                    cwd=settings.BASE_DIR,
+                    env=env,
+                    check=True,
+                )
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                body = metrics.render().decode()
+        self.assertIn('sms_messages_total{outcome="sent"} 2.0', body)
+
+
+def parse_server_timing(header):
+    """{name: milliseconds} of a Server-Timing header."""
+    timings = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        timings[name] = float(dict(p.split("=", 1) for p in params)["dur"])
+    return timings
+
+
+class TestServerTiming(BaseMarketTest):
+    def setUp(self):
+        super().setUp()
+        self.items = self.load_items("tests/market/user_1_items.json", self.users[1])
+
+    def test_breakdown(self):
+        response = self.client.get("/market/listings/")
+        self.assertEqual(response.status_code, 200)
+        header = response.headers["Server-Timing"]
+        timings = parse_server_timing(header)
+        self.assertEqual(
+            list(timings),
+            ["db", "cache", "serialize", "images", "moderation", "render", "total"],
+        )
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertGreater(timings["db"], 0)
+        self.assertGreater(timings["render"], 0)
+        self.assertLessEqual(timings["db"], timings["total"])
+
+    def test_moderation(self):
+        moderation.get_cache().clear()
+        self.addCleanup(moderation.get_cache().clear)
+
+        def predict(texts):
+            time.sleep(0.01)
+            return [0] * len(texts)
+
+        self.user.phone_number = "+12025550100"
+        self.user.phone_verified = True
+        self.user.save()
+        with patch("utils.moderation.load_model", return_value=predict):
+            response = self.client.post(
+                f"/market/listings/{self.items[0].id}/offers/",
+                {"offered_price": 5, "message": "Still available?"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        timings = parse_server_timing(response.headers["Server-Timing"])
+        self.assertGreaterEqual(timings["moderation"], 10)
+
+
+class TestProfiling(BaseMarketTest):
+    def test_sampler(self):
+        with profiling.Sampler(0.001, {threading.get_ident()}) as sampler:
+            time.sleep(0.05)
+        self.assertTrue(sampler.stacks)
+        line = sampler.folded().splitlines()[0]
+        stack, count = line.rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn(";test_sampler (", stack)
+
+    def test_superusers_only(self):
+        response = self.client.get("/market/tags/?profile=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "application/json")
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get("/market/tags/?profile=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Profiled-Status"], "200")
+        self.assertTrue(
+            response.headers["Content-Disposition"].startswith(
+                'attachment; filename="GET-market-tags-'
+            )
+        )
+        for line in response.content.decode().splitlines():
+            self.assertRegex(line, r"^\S.* \d+$")
+
+
+class TestSeeding(BaseMarketTest):
+    def test_bulk_create_listings(self):
+        items = bulk_create_listings(
+            [
+                Item(
+                    seller=self.user,
+                    category=self.categories[0],
+                    title=f"Book {i}",
+                    price=i,
+                )
+                for i in range(3)
+            ],
+            batch_size=2,
+        )
+        sublets = bulk_create_listings(
+            [
+                Sublet(
+                    seller=self.user,
+                    title="Room",
+                    price=900,
+                    street_address="3401 Walnut St",
+                    beds=1,
+                    baths=1,
+                    start_date="2030-01-01",
+                    end_date="2030-05-01",
+                )
+            ]
+        )
+        self.assertEqual(Listing.objects.count(), 4)
+        # each child row points at the parent inserted for it
+        self.assertEqual(
+            list(Item.objects.order_by("pk").values_list("listing_ptr_id", "title")),
+            [(item.pk, item.title) for item in items],
+        )
+        item = Item.objects.get(pk=items[2].pk)
+        self.assertEqual(
+            (item.title, item.price, item.category), ("Book 2", 2, self.categories[0])
+        )
+        self.assertIsNotNone(item.created_at)
+        self.assertEqual(Sublet.objects.get().pk, sublets[0].pk)
+        self.assertEqual(
+            self.client.get(f"/market/listings/{item.pk}/").status_code, 200
+        )
+
+    @patch("market.management.commands.generate_listings.CHUNK_SIZE", 7)
+    def test_generate_listings(self):
+        def generate(batch_size):
+            call_command(
+                "generate_listings",
+                "--items=20",
+                "--sublets=10",
+                "--users=5",
+                "--offers=15",
+                "--favorites=40",
+                "--images=12",
+                "--seed=3",
+                f"--batch-size={batch_size}",
+                stdout=StringIO(),
+            )
+            return sorted(
+                Listing.objects.values_list(
+                    "title",
+                    "price",
+                    "seller__username",
+                    "favorite_count",
+                    "offer_count",
+                )
+            )
+
+        listings = generate(batch_size=4)
+        self.assertEqual(len(listings), 30)
+        # every listing has exactly one Item or Sublet row
+        self.assertEqual(
+            sorted(
+                [*Item.objects.values_list("listing_ptr_id", flat=True)]
+                + [*Sublet.objects.values_list("listing_ptr_id", flat=True)]
+            ),
+            sorted(Listing.objects.values_list("id", flat=True)),
+        )
+        self.assertEqual(Offer.objects.count(), 15)
+        self.assertEqual(ListingImage.objects.count(), 12)
+        self.assertEqual(
+            Sublet.objects.filter(latitude__range=(39.8, 40.1)).count(), 10
+        )
+        for listing in Listing.objects.annotate(
+            favorites_total=Count("favorites", distinct=True),
+            offers_total=Count("offers_received", distinct=True),
+        ):
+            self.assertEqual(listing.favorite_count, listing.favorites_total)
+            self.assertEqual(listing.offer_count, listing.offers_total)
+            self.assertFalse(
+                listing.offers_received.filter(user=listing.seller).exists()
+            )
+
+        # the same seed generates the same listings, in batches of any size
+        Listing.objects.all().delete()
+        self.assertEqual(generate(batch_size=1000), listings)
+
+    def test_create_load_test_sessions(self):
+        call_command("generate_listings", "--users=3", "--seed=1", stdout=StringIO())
+        out = StringIO()
+        call_command("create_load_test_sessions", "--users=2", stdout=out)
+        sessions = json.loads(out.getvalue())
+        self.assertEqual(list(sessions["sessions"]), ["generated0", "generated1"])
+
+        # as scripts/loadtest.py sends them, with a CSRF token of its own
+        csrf = "a" * 32
+        client = APIClient(enforce_csrf_checks=True)
+        client.cookies[sessions["session_cookie"]] = sessions["sessions"]["generated1"]
+        client.cookies[sessions["csrf_cookie"]] = csrf
+        self.assertEqual(
+            client.get("/market/user/me/").json()["username"], "generated1"
+        )
+        listing = (
+            Listing.objects.exclude(seller__username="generated1")
+            .exclude(offers_received__user__username="generated1")
+            .first()
+        )
+        response = client.post(
+            f"/market/listings/{listing.id}/offers/",
+            {"offered_price": 10},
+            format="json",
+            headers={sessions["csrf_header"]: csrf},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+
+class TestRequestRecording(BaseMarketTest):
+    def test_records_shapes(self):
+        call_command("generate_listings", "--users=1", "--seed=1", stdout=StringIO())
+        listing = Listing.objects.first()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "requests-{pid}.jsonl")
+            with override_settings(REQUEST_RECORDING_PATH=path):
+                client = APIClient()
+                client.force_login(self.users[0])
+                response = client.get(
+                    "/market/listings/?type=item&title=Lamp&category=Books"
+                )
+                client.get(f"/market/listings/{listing.id}/")
+                client.logout()
+                client.get("/market/tags/")
+                client.get("/admin/login/")
+            with open(path.format(pid=os.getpid())) as f:
+                shapes = [json.loads(line) for line in f]
+
+        self.assertEqual(len(shapes), 3)
+        self.assertEqual(
+            shapes[0]["q"], [["type", "item"], ["title", None], ["category", "Books"]]
+        )
+        self.assertEqual(
+            (shapes[0]["s"], shapes[0]["b"], shapes[0]["a"]),
+            (200, len(response.content), True),
+        )
+        self.assertNotIn(str(listing.id), shapes[1]["p"].split("/"))
+        self.assertEqual(shape_key(shapes[1]), "GET /market/listings/{id}/")
+        self.assertEqual(
+            shape_key(shapes[0]), "GET /market/listings/?category&title&type"
+        )
+        self.assertFalse(shapes[2]["a"])
+
+
+class TestRequestReplay(LiveServerTestCase):
+    def test_replay_and_compare(self):
+        call_command(
+            "generate_listings", "--users=2", "--items=5", "--seed=1", stdout=StringIO()
+        )
+        recorded = [
+            {"m": "GET", "p": "/market/listings/{0123abcd}/", "q": [], "a": True},
+            {
+                "m": "GET",
+                "p": "/market/listings/",
+                "q": [["type", "item"], ["title", None]],
+                "a": True,
+            },
+            {"m": "POST", "p": "/market/listings/{0123abcd}/favorites/", "q": []},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            recording = os.path.join(directory, "requests.jsonl")
+            with open(recording, "w") as f:
+                for shape in recorded * 5:
+                    f.write(json.dumps({**shape, "s": 200, "ms": 1, "b": 0}) + "\n")
+            base = os.path.join(directory, "base.json")
+            call_command(
+                "replay_requests",
+                recording,
+                f"--url={self.live_server_url}",
+                f"--output={base}",
+                "--warmup=0",
+                stdout=StringIO(),
+            )
+            with open(base) as f:
+                replay = json.load(f)
+            self.assertEqual(replay["requests"], 10)
+            self.assertEqual(
+                {key: shape["mismatched"] for key, shape in replay["shapes"].items()},
+                {
+                    "GET /market/listings/{id}/": 0,
+                    "GET /market/listings/?title&type": 0,
+                },
+            )
+
+            # the same replay, three times slower
+            for shape in replay["shapes"].values():
+                shape["latencies_ms"] = [ms * 3 for ms in shape["latencies_ms"]]
+            new = os.path.join(directory, "new.json")
+            with open(new, "w") as f:
+                json.dump(replay, f)
+            out = StringIO()
+            call_command("compare_replays", base, base, "--fail", stdout=out)
+            self.assertNotIn("SLOWER", out.getvalue())
+            with self.assertRaisesMessage(CommandError, "3 of 3 comparisons slower"):
+                call_command(
+                    "compare_replays",
+                    base,
+                    new,
+                    "--min-requests=5",
+                    "--fail",
+                    stdout=StringIO(),
+                )
+
+    def test_replays_later_pages(self):
+        call_command(
+            "generate_listings", "--users=2", "--items=5", "--seed=1", stdout=StringIO()
+        )
+        user = User.objects.filter(username__startswith="generated").first()
+        Listing.objects.update(seller=user)
+        shape = {
+            "m": "GET",
+            "p": "/market/offers/dashboard/",
+            "q": [["limit", "2"], ["cursor", None]],
+            "a": True,
+            "s": 200,
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            recording = os.path.join(directory, "requests.jsonl")
+            with open(recording, "w") as f:
+                f.write(json.dumps(shape) + "\n")
+            output = os.path.join(directory, "replay.json")
+            with patch(
+                "urllib.request.urlopen", wraps=urllib.request.urlopen
+            ) as urlopen:
+                call_command(
+                    "replay_requests",
+                    recording,
+                    f"--url={self.live_server_url}",
+                    f"--output={output}",
+                    "--warmup=0",
+                    stdout=StringIO(),
+                )
+            with open(output) as f:
+                replay = json.load(f)
+
+        # the first page, for its cursor, then the replayed second page
+        urls = [call.args[0].full_url for call in urlopen.call_args_list]
+        self.assertEqual(len(urls), 2)
+        self.assertNotIn("cursor=", urls[0])
+        self.assertIn("cursor=", urls[1])
+        self.assertEqual(
+            replay["shapes"]["GET /market/offers/dashboard/?cursor&limit"][
+                "mismatched"
+            ],
+            0,
+        )
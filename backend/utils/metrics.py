@@ -0,0 +1,72 @@
+"""
+Prometheus metrics, exposed at /metrics (see market.views.get_metrics).
+
+Each process records into the metrics below. With several WSGI workers, set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by all of them (and
+emptied when the server starts) so a scrape of any worker reports the totals
+of every worker. It must be set in the environment, before this module is
+imported.
+
+Processes that don't serve /metrics, like `manage.py send_sms`, export theirs
+with --metrics-port.
+"""
+
+import os
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to respond to a request, by route name",
+    ["method", "route", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries run by a request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time a request spent running SQL queries",
+    ["route"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "Cache lookups by namespace and whether they hit",
+    ["namespace", "result"],
+)
+PROFANITY_INFERENCE_DURATION = Histogram(
+    "profanity_inference_duration_seconds",
+    "Time of a profanity model call, for every text that missed the cache",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SMS_MESSAGES = Counter(
+    "sms_messages",
+    "Text message send attempts by outcome: sent, retrying, failed or expired",
+    ["outcome"],
+)
+
+
+def render(collectors=()):
+    """
+    The exposition of every process's metrics, followed by those of the
+    given scrape-time `collectors`.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    scraped = CollectorRegistry()
+    for collector in collectors:
+        scraped.register(collector)
+    return generate_latest(registry) + generate_latest(scraped)
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from utils.metrics import PROFANITY_INFERENCE_DURATION
+
+
+_predict = None
+_model_lock = threading.Lock()
+
+
+def load_model():
+    """
+    Import profanity_check (which unpickles its scikit-learn model) on first use
+    and return its predict function. Safe to call from multiple threads.
+    """
+    global _predict
+    if _predict is None:
+        with _model_lock:
+            if _predict is None:
+                from profanity_check import predict
+
+                _predict = predict
+    return _predict
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(settings.PROFANITY_CACHE_SIZE)
+    return _cache
+
+
+def text_key(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def predict_profanity(texts):
+    """
+    Return one boolean per text. Cached texts are answered from the LRU and all
+    remaining (deduplicated) texts are scored with a single predict call.
+    """
+    cache = get_cache()
+    results = [False] * len(texts)
+    misses = {}
+
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        key = text_key(text)
+        cached = cache.get(key)
+        if cached is None:
+            misses.setdefault(key, (text, []))[1].append(i)
+        else:
+            results[i] = cached
+
+    if misses:
+        predict = load_model()
+        with PROFANITY_INFERENCE_DURATION.time():
+            predictions = predict([text for text, _ in misses.values()])
+        for (key, (_, indexes)), prediction in zip(misses.items(), predictions):
+            flagged = bool(prediction)
+            cache.set(key, flagged)
+            for i in indexes:
+                results[i] = flagged
+
+    return results
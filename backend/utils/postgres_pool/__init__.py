@@ -0,0 +1,42 @@
+"""
+PostgreSQL connection pooling.
+
+`configure()` applies the DATABASE_POOL setting to a DATABASES entry:
+
+- "psycopg": every process keeps a psycopg 3 pool (see `base.py`) that its
+  threads borrow a connection from for the length of a request.
+- "pgbouncer": connections go through PgBouncer in transaction pooling mode,
+  so the server connection can change between transactions.
+- "none": one persistent connection per worker thread (Django's default).
+"""
+
+MODES = ("none", "psycopg", "pgbouncer")
+
+
+def configure(database, mode, pool_options):
+    if mode not in MODES:
+        raise ValueError(f"DATABASE_POOL must be one of {', '.join(MODES)}")
+    if mode == "psycopg":
+        # Connections go back to the pool at the end of each request
+        database["ENGINE"] = "utils.postgres_pool"
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = dict(pool_options)
+    elif mode == "pgbouncer":
+        # Named cursors (QuerySet.iterator()) don't survive a change of server
+        # connection between transactions. Prepared statements are already off.
+        database["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return database
+
+
+def pool_stats():
+    """
+    Usage counters of this process's pools by database alias, from psycopg's
+    ConnectionPool.get_stats(): pool_size, pool_available, requests_waiting,
+    requests_num, requests_wait_ms, usage_ms, connections_errors and so on.
+    """
+    from utils.postgres_pool.base import DatabaseWrapper
+
+    return {
+        alias: pool.get_stats()
+        for alias, pool in DatabaseWrapper.connection_pools.items()
+    }
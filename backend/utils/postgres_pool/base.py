@@ -0,0 +1,119 @@
+"""
+PostgreSQL backend whose connections come from a psycopg 3 ConnectionPool
+shared by all threads of the process, instead of one connection per thread.
+
+Set OPTIONS["pool"] to True or to ConnectionPool keyword arguments (min_size,
+max_size, timeout, ...), and CONN_MAX_AGE to 0. This backports the pooling
+built into Django 5.1's postgresql backend; use that backend's OPTIONS["pool"]
+instead once we upgrade.
+"""
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from psycopg import IsolationLevel
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # pooled connections would keep the test database in use
+        self.connection.close_pool()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    # One pool per database alias, shared by every thread's wrapper
+    connection_pools = {}
+    pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        with self.pools_lock:
+            pool = self.connection_pools.get(self.alias)
+            if pool is not None and pool.database == self.settings_dict["NAME"]:
+                return pool
+            if pool is not None:
+                # NAME changed, e.g. to the test database
+                pool.close()
+
+            if self.settings_dict["CONN_MAX_AGE"] != 0:
+                raise ImproperlyConfigured(
+                    "Pooled connections can't be persistent; set CONN_MAX_AGE to 0"
+                )
+            try:
+                from psycopg_pool import ConnectionPool
+            except ImportError as e:
+                raise ImproperlyConfigured(
+                    "Error loading psycopg_pool; install psycopg[pool]"
+                ) from e
+
+            connect_kwargs = self.get_connection_params()
+            # Django turns autocommit off again for each transaction
+            connect_kwargs["autocommit"] = True
+            pool = ConnectionPool(
+                kwargs=connect_kwargs,
+                open=False,
+                check=(
+                    ConnectionPool.check_connection
+                    if self.settings_dict["CONN_HEALTH_CHECKS"]
+                    else None
+                ),
+                name=self.alias,
+                **({} if pool_options is True else pool_options),
+            )
+            pool.database = self.settings_dict["NAME"]
+            self.connection_pools[self.alias] = pool
+            return pool
+
+    def close_pool(self):
+        with self.pools_lock:
+            if pool := self.connection_pools.pop(self.alias, None):
+                pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = IsolationLevel(
+                IsolationLevel.READ_COMMITTED
+                if isolation_level is None
+                else isolation_level
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {isolation_level} specified. "
+                "Use one of the psycopg.IsolationLevel values."
+            )
+        pool.open()
+        connection = pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        # the pool this connection came from, which may have been replaced since
+        pool = getattr(self.connection, "_pool", None)
+        if pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django holds on to a connection closed mid-transaction until
+                # the block exits, so it mustn't be handed to anyone else
+                self.connection.close()
+            pool.putconn(self.connection)
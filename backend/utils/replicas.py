@@ -0,0 +1,215 @@
+"""
+Read replicas.
+
+`databases()` adds a DATABASES entry per DATABASE_REPLICA_URLS entry.
+ReplicaRouter then sends the reads of GET, HEAD and OPTIONS requests to a
+replica, and every other query to the primary. For each request,
+ReplicaMiddleware decides which database is read:
+
+- A client that wrote in the last DATABASE_REPLICA_STICKY_SECONDS (marked by a
+  cookie) reads from the primary, so they see their own changes even though
+  the replicas lag behind it.
+- Once a request writes, or opens a transaction, the rest of its reads go to
+  the primary as well.
+- Replicas more than DATABASE_REPLICA_MAX_LAG_SECONDS behind, or unreachable,
+  aren't read from until their next check. With none left, reads go to the
+  primary.
+
+Queries outside a request (management commands, workers) use the primary.
+"""
+
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+import dj_database_url
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from utils import postgres_pool
+
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = "read_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Seconds since the primary's last replayed transaction, or 0 if the replica
+# has replayed everything it has received
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class RequestState:
+    def __init__(self, alias):
+        # the replica this request reads from, or None for the primary
+        self.alias = alias
+        self.wrote = False
+
+
+request_state = ContextVar("replica_request_state", default=None)
+
+# alias -> (time.monotonic() of the last lag check, whether it can be read from)
+lag_checks = {}
+
+
+def databases(urls, pool, pool_options, **options):
+    """
+    DATABASES entries replica_1, replica_2, ... for `urls`, parsed with the
+    dj_database_url `options` and pooled like the primary.
+    """
+    replicas = {}
+    for number, url in enumerate(urls, 1):
+        database = dj_database_url.parse(url, **options)
+        # tests read the test database through every alias
+        database["TEST"] = {"MIRROR": DEFAULT_DB_ALIAS}
+        replicas[f"replica_{number}"] = postgres_pool.configure(
+            database, pool, pool_options
+        )
+    return replicas
+
+
+def replica_lag(alias):
+    """Seconds the data on replica `alias` is behind the primary's."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_QUERY)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def lag_check_due():
+    checked_before = time.monotonic() - settings.DATABASE_REPLICA_LAG_CHECK_SECONDS
+    return any(
+        lag_checks.get(alias, (checked_before, False))[0] <= checked_before
+        for alias in settings.DATABASE_REPLICAS
+    )
+
+
+def healthy_replicas():
+    """
+    The replicas that can be read from. Each process checks a replica's lag
+    at most once every DATABASE_REPLICA_LAG_CHECK_SECONDS.
+    """
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked_at, is_healthy = lag_checks.get(alias, (None, False))
+        if (
+            checked_at is None
+            or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_SECONDS
+        ):
+            try:
+                lag = replica_lag(alias)
+            except DatabaseError as e:
+                logger.warning("Not reading from replica %s: %s", alias, e)
+                is_healthy = False
+            else:
+                is_healthy = lag <= settings.DATABASE_REPLICA_MAX_LAG_SECONDS
+                if not is_healthy:
+                    logger.warning(
+                        "Not reading from replica %s: %.1fs behind", alias, lag
+                    )
+            lag_checks[alias] = (now, is_healthy)
+        if is_healthy:
+            healthy.append(alias)
+    return healthy
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = request_state.get()
+        if state is None or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # only the primary can see what the transaction has written so far
+            return None
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every database holds the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas are migrated through the primary
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        replicas = healthy_replicas() if self.reads_replica(request) else []
+        state = RequestState(random.choice(replicas) if replicas else None)
+        token = request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_state.reset(token)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        if not self.reads_replica(request):
+            replicas = []
+        elif lag_check_due():
+            # checking lag queries the replicas, which mustn't block the event loop
+            replicas = await sync_to_async(healthy_replicas)()
+        else:
+            replicas = healthy_replicas()
+        state = RequestState(random.choice(replicas) if replicas else None)
+        token = request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_state.reset(token)
+        return self.process_response(request, response, state)
+
+    def reads_replica(self, request):
+        return (
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            # e.g. handled inside a test's transaction
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        )
+
+    def process_response(self, request, response, state):
+        if not state.wrote:
+            return response
+        # so the client's next requests see what this one wrote
+        response.set_cookie(
+            STICKY_COOKIE,
+            "1",
+            max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
+        return response
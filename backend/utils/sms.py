@@ -1,23 +1,89 @@
 import random
 import string
+from functools import lru_cache
 
 from django.conf import settings
-from twilio.rest import Client
+from django.utils.module_loading import import_string
 
 
-def generate_verification_code():
-    return "".join(random.choices(string.digits, k=6))
+# Messages "sent" with LocMemBackend, for tests (like django.core.mail.outbox)
+outbox = []
+
+
+class SMSError(Exception):
+    """
+    Sending failed. `retryable` is False when trying again can't help, e.g. the
+    provider rejected the number.
+    """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioBackend:
+    """
+    Sends through the Twilio API. One instance (and so one client and pooled
+    HTTPS session) is reused for every message a process sends.
+    """
 
+    def __init__(self):
+        # twilio pulls in a large dependency tree, so defer it until an SMS is sent
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
 
-def send_verification_sms(phone_number, code):
-    try:
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
-            body=f"Penn Marketplace: Your verification code is: {code}",
-            from_=settings.TWILIO_PHONE_NUMBER,
-            to=phone_number,
+        self.client = Client(
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            http_client=TwilioHttpClient(
+                pool_connections=True, timeout=settings.SMS_TIMEOUT_SECONDS
+            ),
         )
+
+    def send(self, to, body):
+        from twilio.base.exceptions import TwilioException, TwilioRestException
+
+        try:
+            message = self.client.messages.create(
+                body=body, from_=settings.TWILIO_PHONE_NUMBER, to=to
+            )
+        except TwilioRestException as e:
+            # 4xx means the request itself is bad (invalid number, unsubscribed)
+            retryable = e.status == 429 or e.status >= 500
+            raise SMSError(str(e), retryable=retryable) from e
+        except (TwilioException, OSError) as e:
+            raise SMSError(str(e)) from e
         return message.sid
-    except Exception as e:
-        print(f"Error sending verification SMS: {e}")
-        return None
+
+
+class ConsoleBackend:
+    """Prints messages instead of sending them, for local development."""
+
+    def send(self, to, body):
+        print(f"SMS to {to}: {body}")
+        return f"console-{random.getrandbits(32):08x}"
+
+
+class LocMemBackend:
+    """Keeps messages in `utils.sms.outbox` instead of sending them."""
+
+    def send(self, to, body):
+        outbox.append({"to": to, "body": body})
+        return f"locmem-{len(outbox)}"
+
+
+@lru_cache
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return load_backend(settings.SMS_BACKEND)
+
+
+def generate_verification_code():
+    return "".join(random.choices(string.digits, k=6))
+
+
+def verification_message(code):
+    return f"Penn Marketplace: Your verification code is: {code}"
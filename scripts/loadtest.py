@@ -0,0 +1,525 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = ["httpx>=0.27"]
+# ///
+r"""
+Load test for the marketplace API, run against the local docker compose
+stack. Session-authenticated users replay a mix of browsing, listing details,
+favorite toggles, offers and image uploads. At the end it reports p50/p95/p99
+latency and the error rate of each endpoint.
+
+Setup (from the repository root, once the stack is up):
+
+    make generate-data ARGS="--items 20000 --sublets 5000 --users 1000 \
+        --offers 10000 --favorites 50000 --seed 1"
+    docker compose exec -T backend uv run python manage.py \
+        create_load_test_sessions --users 100 > .loadtest-sessions.json
+
+Offers hit the offer_create throttle (30 an hour per user) within seconds. For
+profiles with offers, set THROTTLE_OFFER_CREATE=1000000/s in backend/.env and
+restart the backend.
+
+Runs:
+
+    uv run scripts/loadtest.py --profile browse --duration 60
+    # how many requests per second the backend serves, before it saturates
+    uv run scripts/loadtest.py --profile saturate --concurrency 50
+    # open loop: 200 actions per second, whatever the latency
+    uv run scripts/loadtest.py --profile rush --rate 200
+    # a profile of your own, see PROFILES for the format
+    uv run scripts/loadtest.py --profile-file my-profile.toml --output results.json
+
+Closed loop (--concurrency) gives each session a virtual user. That user runs
+one action at a time and pauses for the profile's think time in between.
+Open loop (--rate) starts actions at random times, at the given average rate,
+however slowly the backend answers. Latencies are measured from when each
+action was due, so time spent queued in the load generator is counted too.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import secrets
+import string
+import struct
+import sys
+import time
+import tomllib
+import zlib
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+import httpx
+
+
+# Each profile has an action mix (relative weights) and a mean think time in
+# seconds between a virtual user's actions. In a TOML file passed with
+# --profile-file, `think_time = 0.5` goes at the top and the weights go under
+# an [actions] table.
+PROFILES = {
+    # everyday traffic: mostly browsing
+    "browse": {
+        "think_time": 1.0,
+        "actions": {
+            "browse": 55,
+            "search": 15,
+            "detail": 25,
+            "favorite": 4,
+            "offer": 1,
+        },
+    },
+    # move-in and move-out weeks: more favorites, offers and new photos
+    "rush": {
+        "think_time": 0.5,
+        "actions": {
+            "browse": 40,
+            "search": 15,
+            "detail": 25,
+            "favorite": 10,
+            "offer": 7,
+            "upload": 3,
+        },
+    },
+    # browse without think time, to find the request rate the backend tops out at
+    "saturate": {
+        "think_time": 0,
+        "actions": {"browse": 60, "search": 15, "detail": 25},
+    },
+}
+
+# Query strings of the listing filters the frontend combines
+BROWSE_FILTERS = [
+    "",
+    "type=item",
+    "type=sublet",
+    "type=item&category=Books",
+    "type=item&category=Furniture&condition=GOOD",
+    "type=item&min_price=20&max_price=200",
+    "type=sublet&beds=2",
+    "ordering=-favorite_count",
+    "ordering=price",
+    "offset=100",
+    "tags=Used",
+]
+SEARCH_WORDS = ["Desk", "Lamp", "Chair", "Laptop", "Bike", "Textbook", "Studio"]
+OFFER_MESSAGES = ["", "Is this still available?", "Can you do a bit lower?"]
+
+
+def tiny_png():
+    """A valid 8x8 gray PNG, for image uploads."""
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    pixels = b"".join(b"\x00" + b"\x80" * 8 for _ in range(8))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 8, 8, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixels))
+        + chunk(b"IEND", b"")
+    )
+
+
+PNG = tiny_png()
+
+# In open loop, when the action under way in this task was due to start
+due_at = ContextVar("due_at", default=None)
+
+
+class Stats:
+    """Latencies and errors per endpoint, after the warmup."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.recording = False
+        self.started = self.stopped = None
+
+    def start(self):
+        self.recording = True
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.recording = False
+        self.stopped = time.perf_counter()
+
+    def record(self, endpoint, latency, error=None):
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(latency)
+        if error is not None:
+            self.errors[endpoint][error] += 1
+
+    def summary(self):
+        elapsed = self.stopped - self.started
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": errors / len(latencies),
+                "error_kinds": dict(self.errors[endpoint].most_common()),
+                "rps": len(latencies) / elapsed,
+                **{f"p{q}_ms": percentile(latencies, q) * 1000 for q in (50, 95, 99)},
+                "max_ms": latencies[-1] * 1000,
+            }
+        requests = sum(e["requests"] for e in endpoints.values())
+        return {
+            "duration_s": elapsed,
+            "requests": requests,
+            "rps": requests / elapsed,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "endpoints": endpoints,
+        }
+
+
+def percentile(values, q):
+    """The nearest-rank q-th percentile of sorted `values`."""
+    return values[max(0, -(-len(values) * q // 100) - 1)]
+
+
+class Session:
+    """A logged-in user, their own listings and what they've favorited."""
+
+    def __init__(self, base_url, sessions, username, session_key, stats, timeout):
+        csrf = "".join(secrets.choice(string.ascii_letters) for _ in range(32))
+        self.username = username
+        self.stats = stats
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            cookies={
+                sessions["session_cookie"]: session_key,
+                sessions["csrf_cookie"]: csrf,
+            },
+            headers={sessions["csrf_header"]: csrf},
+            timeout=timeout,
+        )
+        self.listings = []
+        self.favorited = set()
+
+    async def request(self, endpoint, method, url, expected=(200,), **kwargs):
+        # an action's first request counts from when the action was due
+        start = due_at.get() or time.perf_counter()
+        due_at.set(None)
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.stats.record(endpoint, time.perf_counter() - start, type(exc).__name__)
+            return None
+        latency = time.perf_counter() - start
+        error = None if response.status_code in expected else response.status_code
+        self.stats.record(endpoint, latency, error)
+        return response
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class Catalog:
+    """Listings to act on, most favorited first, picked by popularity."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        # the listing at rank r is viewed in proportion to 1/r
+        self.weights = list(itertools.accumulate(1 / r for r in range(1, len(ids) + 1)))
+
+    def pick(self, rng):
+        return rng.choices(self.ids, cum_weights=self.weights)[0]
+
+
+async def browse(session, catalog, rng):
+    filters = rng.choice(BROWSE_FILTERS)
+    await session.request(
+        "GET /market/listings/", "GET", f"/market/listings/?{filters}"
+    )
+
+
+async def search(session, catalog, rng):
+    await session.request(
+        "GET /market/listings/?title=",
+        "GET",
+        "/market/listings/",
+        params={"title": rng.choice(SEARCH_WORDS)},
+    )
+
+
+async def detail(session, catalog, rng):
+    await session.request(
+        "GET /market/listings/{id}/", "GET", f"/market/listings/{catalog.pick(rng)}/"
+    )
+
+
+async def favorite(session, catalog, rng):
+    listing = catalog.pick(rng)
+    url = f"/market/listings/{listing}/favorites/"
+    # users only see their own favorites, so conflicts here are expected
+    if listing in session.favorited:
+        session.favorited.discard(listing)
+        await session.request(f"DELETE {url_template(url)}", "DELETE", url, (200, 404))
+    else:
+        session.favorited.add(listing)
+        await session.request(f"POST {url_template(url)}", "POST", url, (201, 409))
+
+
+async def offer(session, catalog, rng):
+    listing = catalog.pick(rng)
+    if listing in session.listings:
+        return
+    url = f"/market/listings/{listing}/offers/"
+    response = await session.request(
+        "POST /market/listings/{id}/offers/",
+        "POST",
+        url,
+        (201, 409),
+        json={
+            "offered_price": rng.randint(5, 500),
+            "message": rng.choice(OFFER_MESSAGES),
+        },
+    )
+    # withdraw it completely, so the user can make it again later
+    if response is not None and response.status_code == 201:
+        await session.request(
+            "DELETE /market/listings/{id}/offers/", "DELETE", url, (204,)
+        )
+
+
+async def upload(session, catalog, rng):
+    if not session.listings:
+        return
+    response = await session.request(
+        "POST /market/listings/{id}/images/",
+        "POST",
+        f"/market/listings/{rng.choice(session.listings)}/images/",
+        (201,),
+        files={"images": ("loadtest.png", PNG, "image/png")},
+    )
+    if response is not None and response.status_code == 201:
+        for image in response.json():
+            await session.request(
+                "DELETE /market/listings/images/{id}/",
+                "DELETE",
+                f"/market/listings/images/{image['id']}/",
+                (204,),
+            )
+
+
+ACTIONS = {
+    "browse": browse,
+    "search": search,
+    "detail": detail,
+    "favorite": favorite,
+    "offer": offer,
+    "upload": upload,
+}
+
+
+def url_template(url):
+    return "/".join("{id}" if part.isdigit() else part for part in url.split("/"))
+
+
+async def setup(sessions, args, stats):
+    """Open the sessions, then find listings to act on and each user's own."""
+    users = list(sessions["sessions"].items())[: args.users]
+    opened = [
+        Session(args.url, sessions, username, key, stats, args.timeout)
+        for username, key in users
+    ]
+    first = opened[0].client
+    response = await first.get("/market/user/me/")
+    if response.status_code != 200:
+        sys.exit(
+            f"GET /market/user/me/ answered {response.status_code}: are the sessions "
+            "from create_load_test_sessions against this backend?"
+        )
+
+    ids = []
+    for offset in range(0, args.catalog, 100):
+        response = await first.get(
+            "/market/listings/",
+            params={"ordering": "-favorite_count", "limit": 100, "offset": offset},
+        )
+        response.raise_for_status()
+        results = response.json()["results"]
+        ids += [listing["id"] for listing in results]
+        if len(results) < 100:
+            break
+    if not ids:
+        sys.exit("No listings to act on: run generate_listings first")
+
+    async def own_listings(session):
+        response = await session.client.get(
+            "/market/listings/", params={"seller": "true", "limit": 100}
+        )
+        response.raise_for_status()
+        session.listings = [listing["id"] for listing in response.json()["results"]]
+
+    await asyncio.gather(*(own_listings(session) for session in opened))
+    return opened, Catalog(ids)
+
+
+async def closed_loop(sessions, catalog, profile, args, deadline):
+    actions, weights = zip(*profile["actions"].items())
+    concurrency = args.concurrency or len(sessions)
+
+    async def virtual_user(number):
+        session = sessions[number % len(sessions)]
+        rng = random.Random(f"{args.seed}:{number}")
+        while time.perf_counter() < deadline:
+            action = rng.choices(actions, weights)[0]
+            await ACTIONS[action](session, catalog, rng)
+            if profile["think_time"]:
+                await asyncio.sleep(rng.expovariate(1 / profile["think_time"]))
+
+    await asyncio.gather(*(virtual_user(number) for number in range(concurrency)))
+
+
+async def open_loop(sessions, catalog, profile, args, deadline, stats):
+    actions, weights = zip(*profile["actions"].items())
+    rng = random.Random(args.seed)
+    in_flight = set()
+    due = time.perf_counter()
+    while due < deadline:
+        # exponential gaps: arrivals are a Poisson process
+        due += rng.expovariate(args.rate)
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        action = rng.choices(actions, weights)[0]
+        if len(in_flight) >= args.max_in_flight:
+            stats.record(f"{action} (not started)", 0, "max in flight")
+            continue
+        session = rng.choice(sessions)
+        task = asyncio.create_task(
+            run_due(session, ACTIONS[action], catalog, random.Random(rng.random()), due)
+        )
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+
+
+async def run_due(session, action, catalog, rng, due):
+    due_at.set(due)
+    await action(session, catalog, rng)
+
+
+def load_profile(args):
+    if args.profile_file:
+        with open(args.profile_file, "rb") as f:
+            profile = tomllib.load(f)
+    else:
+        profile = PROFILES[args.profile]
+    unknown = set(profile["actions"]) - set(ACTIONS)
+    if unknown:
+        sys.exit(f"Unknown actions {sorted(unknown)}; choose from {sorted(ACTIONS)}")
+    return {"think_time": profile.get("think_time", 0), "actions": profile["actions"]}
+
+
+def report(summary):
+    print(
+        f"\n{summary['requests']:,} requests in {summary['duration_s']:.1f}s: "
+        f"{summary['rps']:.1f} requests/s, {summary['errors']:,} errors\n"
+    )
+    width = max(len(endpoint) for endpoint in summary["endpoints"])
+    print(
+        f"{'endpoint':<{width}}  {'requests':>8}  {'req/s':>7}  {'errors':>7}  "
+        f"{'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}"
+    )
+    for endpoint, stats in summary["endpoints"].items():
+        print(
+            f"{endpoint:<{width}}  {stats['requests']:>8,}  {stats['rps']:>7.1f}  "
+            f"{stats['error_rate']:>7.1%}  {stats['p50_ms']:>8.1f}  "
+            f"{stats['p95_ms']:>8.1f}  {stats['p99_ms']:>8.1f}  {stats['max_ms']:>8.1f}"
+        )
+    for endpoint, stats in summary["endpoints"].items():
+        if stats["error_kinds"]:
+            kinds = ", ".join(
+                f"{kind} x{count}" for kind, count in stats["error_kinds"].items()
+            )
+            print(f"  {endpoint}: {kinds}")
+
+
+async def main(args):
+    with open(args.sessions) as f:
+        sessions = json.load(f)
+    profile = load_profile(args)
+    stats = Stats()
+    opened, catalog = await setup(sessions, args, stats)
+    print(
+        f"{len(opened)} users, {len(catalog.ids)} listings, "
+        f"{sum(bool(session.listings) for session in opened)} users with listings"
+    )
+    try:
+        deadline = time.perf_counter() + args.warmup + args.duration
+
+        async def record():
+            await asyncio.sleep(args.warmup)
+            stats.start()
+            await asyncio.sleep(args.duration)
+            stats.stop()
+
+        recorder = asyncio.create_task(record())
+        if args.rate:
+            await open_loop(opened, catalog, profile, args, deadline, stats)
+        else:
+            await closed_loop(opened, catalog, profile, args, deadline)
+        await recorder
+    finally:
+        await asyncio.gather(*(session.close() for session in opened))
+
+    if not stats.latencies:
+        sys.exit("No requests were made after the warmup")
+    summary = stats.summary()
+    report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"profile": profile, "args": vars(args), **summary}, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument(
+        "--sessions",
+        default=".loadtest-sessions.json",
+        help="Output of manage.py create_load_test_sessions",
+    )
+    profiles = parser.add_mutually_exclusive_group()
+    profiles.add_argument("--profile", choices=PROFILES, default="browse")
+    profiles.add_argument("--profile-file", help="A TOML traffic profile")
+    parser.add_argument("--users", type=int, help="Sessions to use; all by default")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Virtual users in closed loop; one per session by default",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="Actions per second in open loop, instead"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1000,
+        help="Open loop: actions due beyond this many in flight are counted as errors",
+    )
+    parser.add_argument("--duration", type=float, default=60, help="Seconds measured")
+    parser.add_argument(
+        "--warmup", type=float, default=5, help="Seconds run before measuring"
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument(
+        "--catalog", type=int, default=1000, help="Most favorited listings to act on"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))